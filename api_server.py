@@ -0,0 +1,205 @@
+import asyncio
+import argparse
+import json
+import uuid
+import weakref
+from contextlib import asynccontextmanager
+import yaml
+import structlog
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from main import create_graph, astream_turn, turn_input, thread_config, transcript, NODE_PROGRESS
+from utils_kk.nodes.node_historyCompaction import afold_history
+from utils_kk.misl_function.misl_dataStore import ensure_dataset_loaded, refresh_dataset, refresh_dataset_if_due
+from utils_kk.misl_function.misl_getData import CONFIG_FILELOC
+from dotenv import load_dotenv
+load_dotenv(override=True)
+
+structlogger = structlog.get_logger(__name__)
+
+with open(CONFIG_FILELOC) as file:
+    API_CONFIG = yaml.safe_load(file).get('api_server', {})
+
+
+class Question(BaseModel):
+    question: str
+
+
+class TurnSlots:
+    """Bounded number of turns running at once, and one turn at a time per session.
+
+    A turn waits at most `queue_timeout` seconds for a free slot and is then
+    refused with 503, so a burst queues briefly instead of piling up model
+    calls. Turns of one session are serialised: they append to the same
+    checkpoint thread. Work queued with `after_turn` runs in the background
+    between two turns of the session, without a slot.
+    """
+
+    def __init__(self, max_turns: int, queue_timeout: float):
+        self.max_turns = max_turns
+        self.queue_timeout = queue_timeout
+        self.running = 0
+        self._slots = asyncio.Semaphore(max_turns)
+        self._sessions = weakref.WeakValueDictionary()
+        self._background = dict()
+
+    @asynccontextmanager
+    async def turn(self, session_id: str):
+        # a turn waiting for an earlier turn of its session does not hold a slot
+        session_lock = self._sessions.setdefault(session_id, asyncio.Lock())
+        try:
+            await asyncio.wait_for(session_lock.acquire(), self.queue_timeout)
+        except TimeoutError:
+            raise HTTPException(status_code=503, detail="An earlier turn of this session is still running, retry later")
+        try:
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+            except TimeoutError:
+                raise HTTPException(status_code=503, detail="All turn slots are busy, retry later")
+            self.running += 1
+            try:
+                yield
+            finally:
+                self.running -= 1
+                self._slots.release()
+        finally:
+            session_lock.release()
+
+    def after_turn(self, session_id: str, work) -> None:
+        """Run `await work()` once the session's current turn ended and before its next one starts
+
+        At most one piece of work is pending per session; a later request while
+        it is pending is dropped, the pending work sees the later turns anyway.
+        """
+        if session_id in self._background:
+            return
+        session_lock = self._sessions.setdefault(session_id, asyncio.Lock())
+
+        async def run():
+            try:
+                async with session_lock:
+                    await work()
+            except Exception as e:
+                structlogger.error("Exception in after_turn", session_id=session_id, detail=e)
+            finally:
+                self._background.pop(session_id, None)
+
+        self._background[session_id] = asyncio.create_task(run())
+
+
+def _answer(result: dict) -> dict:
+    """Part of a turn's final state returned to clients"""
+    result = result or {}
+    return {"final_result": result.get("final_result", None), "serialnumber": result.get("serialnumber", None),
+            "intent_classification": result.get("intent_classification", None)}
+
+
+def _sse(kind: str, payload) -> str:
+    return f"event: {kind}\ndata: {json.dumps(payload, default=str)}\n\n"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # one dataset and one compiled graph per worker process, shared by every session
+    app.state.dataset_version = await asyncio.to_thread(ensure_dataset_loaded)
+    app.state.flow = create_graph()
+    app.state.slots = TurnSlots(API_CONFIG.get('max_concurrent_turns', 16), API_CONFIG.get('queue_timeout_seconds', 30))
+    structlogger.info("-- API server ready", dataset_version=app.state.dataset_version,
+                      max_concurrent_turns=app.state.slots.max_turns)
+    yield
+
+
+app = FastAPI(title="Router assistant", lifespan=lifespan)
+
+
+def _fold_after_turn(session_id: str):
+    # the rolling summary is updated once the answer is out, so its model call never delays a response
+    app.state.slots.after_turn(session_id, lambda: afold_history(app.state.flow, thread_config(session_id)))
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "dataset_version": app.state.dataset_version, "running_turns": app.state.slots.running}
+
+
+@app.post("/dataset/refresh")
+async def dataset_refresh():
+    """Ingest newly arrived telemetry files now instead of at the next due refresh"""
+    app.state.dataset_version = await asyncio.to_thread(refresh_dataset)
+    return {"dataset_version": app.state.dataset_version}
+
+
+@app.post("/sessions")
+async def create_session():
+    """New conversation; its state is created by its first turn"""
+    return {"session_id": str(uuid.uuid4())}
+
+
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    """Messages still in the session's checkpoint and the summary of the older ones"""
+    state = await app.state.flow.aget_state(thread_config(session_id))
+    if not state.values:
+        raise HTTPException(status_code=404, detail=f"Unknown session {session_id}")
+    return {"session_id": session_id, "messages": transcript(state.values),
+            "history_summary": state.values.get("history_summary", None),
+            "serialnumber": state.values.get("serialnumber", None)}
+
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    await asyncio.to_thread(app.state.flow.checkpointer.delete_thread, session_id)
+    return {"session_id": session_id, "deleted": True}
+
+
+@app.post("/sessions/{session_id}/ask")
+async def ask(session_id: str, body: Question):
+    """Run one turn and return its answer"""
+    async with app.state.slots.turn(session_id):
+        app.state.dataset_version = await asyncio.to_thread(refresh_dataset_if_due)
+        result = await app.state.flow.ainvoke(turn_input(body.question, app.state.dataset_version),
+                                              thread_config(session_id))
+        _fold_after_turn(session_id)
+    return _answer(result)
+
+
+@app.post("/sessions/{session_id}/stream")
+async def stream(session_id: str, body: Question):
+    """Run one turn as server-sent events: progress (step label), token (answer text) and a final result
+
+    A turn refused for lack of a slot ends with an error event instead of a 503.
+    """
+    async def events():
+        # the slot is taken once the client reads the stream and released when the generator
+        # ends or is closed, so a client that disconnects early holds nothing
+        try:
+            async with app.state.slots.turn(session_id):
+                app.state.dataset_version = await asyncio.to_thread(refresh_dataset_if_due)
+                async for kind, payload in astream_turn(app.state.flow,
+                                                        turn_input(body.question, app.state.dataset_version),
+                                                        thread_config(session_id)):
+                    if kind == "progress":
+                        payload = NODE_PROGRESS[payload]
+                    elif kind == "result":
+                        payload = _answer(payload)
+                    yield _sse(kind, payload)
+                _fold_after_turn(session_id)
+        except HTTPException as e:
+            yield _sse("error", e.detail)
+        except Exception as e:
+            structlogger.error("Exception in stream", session_id=session_id, detail=e)
+            yield _sse("error", str(e))
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Router assistant API server")
+    parser.add_argument("--host", default=API_CONFIG.get('host', '127.0.0.1'))
+    parser.add_argument("--port", type=int, default=API_CONFIG.get('port', 8000))
+    parser.add_argument("--workers", type=int, default=API_CONFIG.get('workers', 1),
+                        help="worker processes, each with its own copy of the dataset")
+    args = parser.parse_args()
+    uvicorn.run("api_server:app", host=args.host, port=args.port, workers=args.workers)
@@ -1,7 +1,14 @@
+import os
+import uuid
 import streamlit as st
-from main import create_graph
-from utils_kk.misl_function.misl_getData import get_data
-from utils_kk.variables.variable_definitions import customGraph
+
+# with ROUTER_API_URL set the app is a thin client of api_server.py, which holds the data and the graph
+API_URL = os.getenv("ROUTER_API_URL")
+if API_URL:
+    from utils_kk.misl_function.misl_apiClient import ApiClient
+else:
+    from main import create_graph, stream_turn, turn_input, thread_config, transcript, NODE_PROGRESS
+    from utils_kk.misl_function.misl_dataStore import ensure_dataset_loaded, refresh_dataset, refresh_dataset_if_due
 
 # Page configuration
 st.set_page_config(
@@ -26,12 +33,26 @@ with st.sidebar:
     - 📈 Query router statistics
     - 🛠️ Perform root cause analysis
     """)
+    st.markdown("### Data")
+    if st.button("🔄 Refresh router data"):
+        with st.spinner("🔄 Ingesting new telemetry files..."):
+            dataset_version = st.session_state.api.refresh_dataset() if API_URL else refresh_dataset()
+            st.caption(f"Dataset version: {dataset_version}")
 
 # Initialize session state
-if 'flow' not in st.session_state:
+if API_URL and 'api' not in st.session_state:
+    st.session_state.api = ApiClient(API_URL)
+
+if not API_URL and 'flow' not in st.session_state:
     with st.spinner("🔄 Initializing agent..."):
         st.session_state.flow = create_graph()
         
+# one checkpointed conversation per browser session; the thread id in the URL resumes it after a reload or restart
+if 'thread_id' not in st.session_state:
+    st.session_state.thread_id = st.query_params.get("thread", None) or \
+        (st.session_state.api.create_session() if API_URL else str(uuid.uuid4()))
+    st.query_params["thread"] = st.session_state.thread_id
+
 if 'messages' not in st.session_state:
     st.session_state.messages = [
         {
@@ -39,35 +60,28 @@ if 'messages' not in st.session_state:
             "content": "Hello! 👋 I'm your Router Analysis Assistant. I can help you analyze router telemetry data, diagnose reboot issues, and answer questions about router performance. What would you like to know?"
         }
     ]
+    # turns of a resumed conversation still in its checkpoint; older ones only live on in its summary
+    if API_URL:
+        st.session_state.messages += st.session_state.api.transcript(st.session_state.thread_id)
+    else:
+        st.session_state.messages += transcript(st.session_state.flow.get_state(thread_config(st.session_state.thread_id)).values)
 
-if "universal_state" not in st.session_state:
-    st.session_state.universal_state: customGraph = {
-        "question": "",
-        "generation_scratchpad": [],
-        "chat_history": [],
-        "intent_classification": "",
-        "bypass_intention": False,
-        "intermediate_result": "",
-        "final_result": "",
-        "verification": None,
-        "serialnumber": None,
-        "data": get_data()
-    }
+# Router data is loaded once per process and shared by every browser session
+if not API_URL:
+    with st.spinner("🔄 Loading router data..."):
+        ensure_dataset_loaded()
 
-def update_global_state_streamlit(state: customGraph):
 
-    for key, value in state.items():  
+def turn_events(question: str):
+    """("progress", step label), ("token", text) and ("result", answer) events of one turn"""
+    if API_URL:
+        yield from st.session_state.api.stream_turn(st.session_state.thread_id, question)
+        return
+    # newly ingested telemetry is visible from the next turn of every session
+    state = turn_input(question, refresh_dataset_if_due())
+    for kind, payload in stream_turn(st.session_state.flow, state, thread_config(st.session_state.thread_id)):
+        yield kind, NODE_PROGRESS[payload] if kind == "progress" else payload
 
-        if key in ('chat_history'):
-            for msgs in value:
-                if msgs not in st.session_state.universal_state[key]:
-                    st.session_state.universal_state[key].append(msgs)
-
-        if (key == 'serialnumber') and (st.session_state.universal_state[key] == None):
-            st.session_state.universal_state[key] = value
-            
-        
-    return st.session_state.universal_state
 
 # Display chat messages
 for message in st.session_state.messages:
@@ -78,35 +92,41 @@ for message in st.session_state.messages:
 if prompt := st.chat_input("Ask me about router data, reboots, or performance metrics..."):
     # Add user message to chat
     st.session_state.messages.append({"role": "user", "content": prompt})
-    st.session_state.universal_state['question'] = prompt
     with st.chat_message("user"):
         st.markdown(prompt)
     
-    # Generate assistant response
+    # Generate assistant response, streamed as the graph produces it
     with st.chat_message("assistant"):
-        with st.spinner("🔍 Analyzing..."):
-            try:
-                response = st.session_state.flow.invoke(st.session_state.universal_state)
-                st.session_state.universal_state = update_global_state_streamlit(response)
-                
-                # print("Universal State", st.session_state.universal_state)
-                # print("\n\n\n\n")
-                # print("-"* 100)
-                final_result = response.get("final_result", "No result returned.")
-                
-                # Display the response
-                st.markdown(final_result)
-                
-                # Add assistant response to chat history
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": final_result
-                })
-                
-            except Exception as e:
-                error_message = f"❌ Error: {str(e)}"
-                st.error(error_message)
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": error_message
-                })
\ No newline at end of file
+        status = st.status("🔍 Analyzing...", expanded=False)
+        turn = dict()
+
+        def answer_tokens():
+            for kind, payload in turn_events(prompt):
+                if kind == "progress":
+                    status.write(f"✔️ {payload}")
+                    status.update(label=f"🔍 {payload}...")
+                elif kind == "token":
+                    yield payload
+                else:
+                    turn["response"] = payload
+
+        try:
+            st.write_stream(answer_tokens())
+            status.update(label="✅ Done", state="complete")
+            response = turn["response"]
+            final_result = response.get("final_result", "No result returned.")
+            
+            # Add assistant response to chat history
+            st.session_state.messages.append({
+                "role": "assistant",
+                "content": final_result
+            })
+            
+        except Exception as e:
+            status.update(label="❌ Failed", state="error")
+            error_message = f"❌ Error: {str(e)}"
+            st.error(error_message)
+            st.session_state.messages.append({
+                "role": "assistant",
+                "content": error_message
+            })
@@ -1,35 +1,69 @@
-from utils_kk.misl_function.misl_getData import get_data
+import asyncio
+import argparse
+import threading
+import uuid
+from utils_kk.misl_function.misl_dataStore import ensure_dataset_loaded, refresh_dataset_if_due
+from langchain_core.runnables import RunnableLambda
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, RemoveMessage
 from langgraph.graph import StateGraph, MessagesState
 from langgraph.graph import START, END
-from langgraph.checkpoint.memory import MemorySaver
-from utils_kk.nodes.node_intentClassification import intent_classification_node
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+from utils_kk.misl_function.misl_checkpoint import get_checkpointer
+from utils_kk.nodes.node_intentClassification import intent_classification_node, aintent_classification_node
 from utils_kk.variables.variable_definitions import customGraph
-from utils_kk.nodes.node_pandasProcessing import pandas_agent_processing, validate_pandas_agent, merge_answer
-from utils_kk.nodes.node_rca import rca_agent
-from utils_kk.nodes.node_chitChat import chitChat_agent
+from utils_kk.nodes.node_pandasProcessing import pandas_agent_processing, apandas_agent_processing, \
+                                                 validate_pandas_agent, merge_answer
+from utils_kk.nodes.node_rca import rca_agent, arca_agent
+from utils_kk.nodes.node_chitChat import chitChat_agent, achitChat_agent
+from utils_kk.nodes.node_historyCompaction import fold_history, afold_history
 from utils_kk.branching.branch_control import intent_classification_branch, pandas_agent_branch
 from dotenv import load_dotenv
 load_dotenv(override=True)
 
 
-def update_global_state(state: customGraph):
+def thread_config(thread_id: str) -> dict:
+    """Graph config of one conversation; its state is the latest checkpoint of the thread"""
+    return {"configurable": {"thread_id": thread_id}}
 
-    for key, value in state.items():        
-        if key in ('chat_history'):
-            for msgs in value:
-                if msgs not in universal_state[key]:
-                    universal_state[key].append(msgs)
 
-        if (key == 'serialnumber') and (universal_state[key] == None):
-            universal_state[key] = value
-            
-        
-    return universal_state
+def turn_input(question: str, dataset_version: str) -> customGraph:
+    """Graph input of one turn
 
-def create_graph():
+    chat_history, history_summary and serialnumber come from the thread's
+    checkpoint; the per-turn fields are reset here, and generation_scratchpad
+    is emptied since its reducer would otherwise append to the previous turn.
+    """
+    return {
+        "question": question,
+        "dataset_version": dataset_version,
+        "generation_scratchpad": [RemoveMessage(id=REMOVE_ALL_MESSAGES)],
+        "intent_classification": "",
+        "bypass_intention": False,
+        "intermediate_result": "",
+        "final_result": "",
+        "verification": None,
+        "matched_columns": None,
+        "explanation": None,
+        "agent_scope": None
+    }
+
+
+def transcript(state: customGraph) -> list:
+    """User and assistant messages of a thread's chat_history as {"role", "content"} entries"""
+    return [{"role": "user" if isinstance(message, HumanMessage) else "assistant", "content": message.content}
+            for message in state.get("chat_history", []) if isinstance(message, (HumanMessage, AIMessage))]
+
+
+def _node(func, afunc):
+    """Graph node with a blocking and an async implementation; flow.invoke runs func, flow.ainvoke/astream run afunc"""
+    return RunnableLambda(func, afunc=afunc, name=func.__name__)
+
+
+def create_graph(checkpointer=None):
+    """Compiled graph; conversations are checkpointed per thread id, by default in the configured SQLite file"""
     graph = StateGraph(state_schema=customGraph)
-    graph.add_node("intent_classification_node", intent_classification_node)
-    graph.add_node("chitChat_node", chitChat_agent)
+    graph.add_node("intent_classification_node", _node(intent_classification_node, aintent_classification_node))
+    graph.add_node("chitChat_node", _node(chitChat_agent, achitChat_agent))
     graph.add_edge(START, "intent_classification_node")
     graph.add_conditional_edges("intent_classification_node", intent_classification_branch, 
                                {
@@ -40,7 +74,7 @@ def create_graph():
     )
 
     ## Flow-1
-    graph.add_node("pandas-agent processing", pandas_agent_processing)
+    graph.add_node("pandas-agent processing", _node(pandas_agent_processing, apandas_agent_processing))
     graph.add_node("validate_pandas_agent", validate_pandas_agent)
     graph.add_node("merge_answer", merge_answer)
     graph.add_edge("pandas-agent processing", "validate_pandas_agent")
@@ -54,36 +88,180 @@ def create_graph():
     graph.add_edge("merge_answer", END)
     
     ## Flow-2
-    graph.add_node("rca", rca_agent)
+    graph.add_node("rca", _node(rca_agent, arca_agent))
     graph.add_edge("rca", END)
 
-    store = MemorySaver()
-    flow = graph.compile()
+    # turns that left the verbatim window are folded into the rolling summary after the answer, see fold_history
+
+    flow = graph.compile(checkpointer=checkpointer or get_checkpointer())
     return flow
 
 
-if __name__ == "__main__":
-    flow = create_graph()
+# nodes whose model output is the answer shown to the user, streamed token by token
+# answer text of chit-chat streams as it is generated; the agents' text is released once their answer is final
+STREAMED_NODES = ("chitChat_node",)
+BUFFERED_NODES = ("rca", "pandas-agent processing")
+# buffered answers of these nodes are held until the node of the value accepts them
+VALIDATED_NODES = {"pandas-agent processing": "validate_pandas_agent"}
+NODE_PROGRESS = {
+    "intent_classification_node": "Understanding the question",
+    "chitChat_node": "Writing a reply",
+    "pandas-agent processing": "Querying the router telemetry",
+    "validate_pandas_agent": "Checking the answer",
+    "merge_answer": "Preparing the answer",
+    "rca": "Running the root cause analysis",
+}
+STREAM_MODES = ["messages", "updates", "values"]
 
-    universal_state: customGraph = {
-        "question": "",
-        "generation_scratchpad": [],
-        "chat_history": [],
-        "intent_classification": "",
-        "serialnumber": None,
-        "bypass_intention": False,
-        "intermediate_result": "",
-        "final_result": "",
-        "verification": None,
-        "data": get_data()
-    }
-    
+
+class TurnEvents:
+    """Maps the graph stream items of one turn to ("progress" | "token" | "result", payload) events.
+
+    Tokens of the agent nodes are collected per model call. A call whose first
+    chunk carries text and no tool call chunks is answering, so its text is
+    streamed as it arrives; a call that requests tools is an intermediate step
+    and is dropped. Answers that still have to be validated are buffered
+    instead: when the node finishes the text of its last call is held until the
+    validation node accepts it, so a rejected answer is never shown and the
+    retry's answer takes its place.
+    """
+
+    def __init__(self):
+        self.calls = dict()
+        self.held = None
+
+    def events(self, mode: str, chunk) -> list:
+        if mode == "messages":
+            message, metadata = chunk
+            node = metadata.get("langgraph_node")
+            # only streamed chunks; full messages are the node's state writes, already covered by tokens
+            if not isinstance(message, AIMessageChunk):
+                return []
+            if node in STREAMED_NODES and isinstance(message.content, str) and message.content:
+                return [("token", message.content)]
+            if node in BUFFERED_NODES:
+                return self._collect(node, message)
+        elif mode == "updates":
+            events = []
+            for node, update in chunk.items():
+                if node in NODE_PROGRESS:
+                    events.append(("progress", node))
+                if node in BUFFERED_NODES:
+                    answer, streamed = self._answer()
+                    if node in VALIDATED_NODES:
+                        self.held = answer
+                    elif answer and not streamed:
+                        events.append(("token", answer))
+                if node in VALIDATED_NODES.values():
+                    if (update or {}).get("verification", None) == "VALID" and self.held:
+                        events.append(("token", self.held))
+                    self.held = None
+            return events
+        elif mode == "values":
+            return [("result", chunk)]
+        return []
+
+    def _collect(self, node: str, message: AIMessageChunk) -> list:
+        """Record one chunk of an agent call; returns the tokens to stream now"""
+        call = self.calls.setdefault(message.id, {"text": [], "tools": False, "live": None})
+        text = message.content if isinstance(message.content, str) else ""
+        call["tools"] = call["tools"] or bool(message.tool_call_chunks)
+        call["text"].append(text)
+        if call["live"] is None and (text or message.tool_call_chunks):
+            # the first chunk with content tells an answer from a tool request
+            call["live"] = node not in VALIDATED_NODES and not call["tools"]
+            return [("token", "".join(call["text"]))] if call["live"] else []
+        if call["live"] and not call["tools"] and text:
+            return [("token", text)]
+        return []
+
+    def _answer(self) -> tuple:
+        """Text of the last model call of the finished node that did not request tools, and whether it was streamed"""
+        answers = [("".join(call["text"]), bool(call["live"])) for call in self.calls.values() if not call["tools"]]
+        self.calls = dict()
+        return answers[-1] if answers else ("", False)
+
+
+def stream_turn(flow, state: customGraph, config: dict = None):
+    """Run one turn and yield its events as they happen
+
+    Yields:
+        tuple: ("progress", node name) when a node finished, ("token", text) for answer
+               text (see TurnEvents), and ("result", final state) once at the end. When no
+               answer text was streamed, the final answer is yielded as a single token
+               before the result.
+    """
+    turn_events, streamed, result = TurnEvents(), False, None
+    for mode, chunk in flow.stream(state, config, stream_mode=STREAM_MODES):
+        for event in turn_events.events(mode, chunk):
+            if event[0] == "result":
+                result = event[1]
+                continue
+            streamed = streamed or event[0] == "token"
+            yield event
+
+    if not streamed and result and result.get("final_result"):
+        yield "token", str(result["final_result"])
+    yield "result", result
+
+
+async def astream_turn(flow, state: customGraph, config: dict = None):
+    """Async stream_turn on the graph's astream path"""
+    turn_events, streamed, result = TurnEvents(), False, None
+    async for mode, chunk in flow.astream(state, config, stream_mode=STREAM_MODES):
+        for event in turn_events.events(mode, chunk):
+            if event[0] == "result":
+                result = event[1]
+                continue
+            streamed = streamed or event[0] == "token"
+            yield event
+
+    if not streamed and result and result.get("final_result"):
+        yield "token", str(result["final_result"])
+    yield "result", result
+
+
+async def achat(flow, thread_id: str):
+    """Console chat on the async graph path"""
+    fold = None
     while True:
-        universal_state['question'] = input("User: ")
-        response = flow.invoke(universal_state)
-        universal_state = update_global_state(response)
-    
+        question = await asyncio.to_thread(input, "User: ")
+        dataset_version = await asyncio.to_thread(refresh_dataset_if_due)
+        # the previous turn's fold finishes before this turn reads the thread
+        if fold is not None:
+            await fold
+        response = await flow.ainvoke(turn_input(question, dataset_version), thread_config(thread_id))
+
         print(response['final_result'])
+        fold = asyncio.create_task(afold_history(flow, thread_config(thread_id)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Router assistant console chat")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="run the graph with ainvoke")
+    parser.add_argument("--thread", default=None, help="thread id of a conversation to resume")
+    args = parser.parse_args()
+    flow = create_graph()
+    ensure_dataset_loaded()
+    thread_id = args.thread or str(uuid.uuid4())
+    print(f"Conversation {thread_id}")
+
+    if args.use_async:
+        asyncio.run(achat(flow, thread_id))
+
+    else:
+        fold = None
+        while True:
+            question = input("User: ")
+            if fold is not None:
+                fold.join()
+            for kind, payload in stream_turn(flow, turn_input(question, refresh_dataset_if_due()),
+                                             thread_config(thread_id)):
+                if kind == "token":
+                    print(payload, end="", flush=True)
+            print()
+            fold = threading.Thread(target=fold_history, args=(flow, thread_config(thread_id)))
+            fold.start()
 
 
 
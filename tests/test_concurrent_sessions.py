@@ -0,0 +1,117 @@
+import asyncio
+import time
+from pathlib import Path
+import pandas as pd
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+SESSIONS = 32
+LATENCY = 0.2
+# feature validation, intent and chit-chat: the model calls of one chit-chat turn
+CALLS_PER_TURN = 3
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    """Compiled graph with in-memory checkpoints over a published synthetic dataset, no Azure settings"""
+    # config.yaml and the prompt files are read relative to the repository root
+    monkeypatch.chdir(ROOT)
+    from langgraph.checkpoint.memory import MemorySaver
+    from main import create_graph
+    from utils_kk.misl_function.misl_dataStore import publish_dataset
+
+    for name in ["AZURE_OPENAI_API_BASE", "AZURE_OPENAI_API_KEY", "OPENAI_API_VERSION", "AZURE_OPENAI_DEPLOYMENT_NAME"]:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("num_retries", "2")
+    monkeypatch.setenv("retry_backoff", "0")
+
+    serials = [f"90100000000V4120{i:05d}" for i in range(SESSIONS)]
+    version = publish_dataset(pd.DataFrame({"serialnumber": serials, "time": pd.Timestamp("2024-08-01"),
+                                            "cpuusage": 10.0}))
+    return create_graph(checkpointer=MemorySaver()), serials, version
+
+
+def _question(serial_number: str) -> str:
+    return f"Hi, my router is {serial_number}, how are you today?"
+
+
+def test_concurrent_ainvoke_sessions(graph):
+    from main import thread_config, turn_input
+    from utils_kk.llm_initializations import override_llm
+    from utils_kk.misl_function.misl_benchmarks import StandInChatModel
+
+    flow, serials, version = graph
+
+    async def run_sessions():
+        return await asyncio.gather(*(flow.ainvoke(turn_input(_question(serial_number), version),
+                                                   thread_config(serial_number)) for serial_number in serials))
+
+    with override_llm(StandInChatModel(latency=LATENCY)):
+        started = time.perf_counter()
+        responses = asyncio.run(run_sessions())
+        seconds = time.perf_counter() - started
+
+    assert [response["serialnumber"] for response in responses] == serials
+    assert all(response["final_result"] for response in responses)
+    # sequential turns would take SESSIONS * CALLS_PER_TURN * LATENCY
+    assert seconds < SESSIONS * CALLS_PER_TURN * LATENCY / 4
+
+
+def test_concurrent_astream_sessions(graph):
+    from main import astream_turn, thread_config, turn_input
+    from utils_kk.llm_initializations import override_llm
+    from utils_kk.misl_function.misl_benchmarks import StandInChatModel
+
+    flow, serials, version = graph
+
+    async def stream_session(serial_number):
+        events = []
+        async for kind, payload in astream_turn(flow, turn_input(_question(serial_number), version),
+                                                thread_config(serial_number)):
+            events.append((kind, payload))
+        return events
+
+    async def run_sessions():
+        return await asyncio.gather(*(stream_session(serial_number) for serial_number in serials))
+
+    with override_llm(StandInChatModel(latency=LATENCY)):
+        started = time.perf_counter()
+        sessions = asyncio.run(run_sessions())
+        seconds = time.perf_counter() - started
+
+    for serial_number, events in zip(serials, sessions):
+        kind, result = events[-1]
+        assert kind == "result" and result["serialnumber"] == serial_number
+        tokens = "".join(payload for kind, payload in events if kind == "token")
+        assert tokens.strip() == result["final_result"].strip()
+        assert any(kind == "progress" for kind, _ in events)
+    assert seconds < SESSIONS * CALLS_PER_TURN * LATENCY / 4
+
+    # every session kept its own conversation
+    state = asyncio.run(flow.aget_state(thread_config(serials[0]))).values
+    assert [message.content for message in state["chat_history"]][0] == _question(serials[0])
+
+
+def test_history_folds_after_the_turn(graph):
+    from main import thread_config, turn_input
+    from utils_kk.llm_initializations import override_llm
+    from utils_kk.misl_function.misl_benchmarks import StandInChatModel
+    from utils_kk.misl_function.misl_chatHistory import CHAT_HISTORY_CONFIG
+    from utils_kk.nodes.node_historyCompaction import afold_history
+
+    flow, serials, version = graph
+    config, keep_turns = thread_config(serials[0]), CHAT_HISTORY_CONFIG.get('keep_turns', 3)
+
+    async def run_turns():
+        for _ in range(keep_turns + 2):
+            await flow.ainvoke(turn_input(_question(serials[0]), version), config)
+        before = (await flow.aget_state(config)).values
+        await afold_history(flow, config)
+        return before, (await flow.aget_state(config)).values
+
+    with override_llm(StandInChatModel(latency=0)):
+        before, after = asyncio.run(run_turns())
+
+    # turns leave the history as is; the fold summarises the turns past the verbatim window
+    assert not before.get("history_summary") and len(before["chat_history"]) == 2 * (keep_turns + 2)
+    assert after["history_summary"] and len(after["chat_history"]) == 2 * keep_turns
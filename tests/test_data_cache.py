@@ -0,0 +1,24 @@
+import pandas as pd
+import yaml
+from utils_kk.misl_function.misl_dataCache import compute_source_fingerprint
+
+
+def _fingerprint(tmp_path, config: dict) -> str:
+    (tmp_path / "config.yaml").write_text(yaml.safe_dump(config))
+    return compute_source_fingerprint(f"{tmp_path}/data/", str(tmp_path / "config.yaml"))
+
+
+def test_fingerprint_keys_on_data_and_read_sections(tmp_path):
+    (tmp_path / "data").mkdir()
+    pd.DataFrame({"serialnumber": ["a"], "cpuusage": [1.0]}).to_parquet(tmp_path / "data" / "part0.parquet")
+    config = {"RDK_parameters": ["serialnumber", "cpuusage"], "compact_mode": {"enabled": False},
+              "api_server": {"port": 8000}}
+    fingerprint = _fingerprint(tmp_path, config)
+
+    # runtime sections leave the router frame unchanged
+    assert _fingerprint(tmp_path, {**config, "api_server": {"port": 9000}, "sandbox": {"enabled": True}}) == fingerprint
+    assert _fingerprint(tmp_path, {**config, "compact_mode": {"enabled": True}}) != fingerprint
+    assert _fingerprint(tmp_path, {**config, "RDK_parameters": ["serialnumber"]}) != fingerprint
+
+    pd.DataFrame({"serialnumber": ["b"], "cpuusage": [2.0]}).to_parquet(tmp_path / "data" / "part1.parquet")
+    assert _fingerprint(tmp_path, config) != fingerprint
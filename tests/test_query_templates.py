@@ -0,0 +1,43 @@
+import pandas as pd
+import pytest
+from utils_kk.tool_functions.router_index import RouterTimeIndex
+from utils_kk.tool_functions.query_templates import match_query_template, run_query_template
+
+SERIAL = "90100000000V412000000"
+
+
+@pytest.fixture(scope="module")
+def router_index():
+    times = pd.date_range("2024-08-01", periods=48, freq="h")
+    return RouterTimeIndex(pd.DataFrame({"serialnumber": SERIAL, "time": times, "cpuusage": range(48),
+                                         "hardware_reboot": [1 if hour % 12 == 0 else 0 for hour in range(48)],
+                                         "status": pd.Categorical(["up"] * 48)}))
+
+
+def _name(router_index, question, columns):
+    match = match_query_template(question, columns, router_index, SERIAL)
+    return None if match is None else match[0].name
+
+
+@pytest.mark.parametrize("question, columns, expected", [
+    ("When was the latest reboot?", ["hardware_reboot", "last_reboot_reason_split", "deviceuptime"], "latest_reboot"),
+    ("How many reboots in the last 3 days?", ["hardware_reboot"], "reboot_count"),
+    ("What was the max cpu in the past 24h?", ["cpuusage"], "metric_stat"),
+    ("max cpu in the last 5 min", ["cpuusage"], "metric_stat"),
+    # parts a single lookup would drop
+    ("when was the last reboot and what was the max cpu", ["cpuusage"], None),
+    ("when was the last reboot and what was the max cpu", [], None),
+    ("max cpu and average cpu", ["cpuusage"], None),
+    # other reboot kinds, causes and unparsed time references
+    ("when was the last software reboot", [], None),
+    ("why did it reboot last week?", [], None),
+    ("max cpu last tuesday morning", ["cpuusage"], None),
+])
+def test_match_query_template(router_index, question, columns, expected):
+    assert _name(router_index, question, columns) == expected
+
+
+def test_metric_stat_window(router_index):
+    facts = run_query_template(*match_query_template("max cpu in the past 24h", ["cpuusage"], router_index, SERIAL),
+                               router_index, SERIAL)
+    assert facts["value"] == 47 and facts["samples"] == 25
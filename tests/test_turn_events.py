@@ -0,0 +1,37 @@
+from langchain_core.messages import AIMessageChunk
+
+from main import TurnEvents
+
+
+def _chunk(call_id: str, text: str = "", tool: bool = False) -> AIMessageChunk:
+    tool_call_chunks = [{"name": "python_repl", "args": "{}", "id": "t1", "index": 0}] if tool else []
+    return AIMessageChunk(id=call_id, content=text, tool_call_chunks=tool_call_chunks)
+
+
+def _feed(events: TurnEvents, node: str, chunks: list) -> list:
+    tokens = []
+    for message in chunks:
+        tokens += events.events("messages", (message, {"langgraph_node": node}))
+    return tokens
+
+
+def test_rca_answer_streams_while_tool_calls_are_dropped():
+    events = TurnEvents()
+    assert _feed(events, "rca", [_chunk("run-1", tool=True), _chunk("run-1", tool=True)]) == []
+    # leading empty chunk is held until the call shows it is answering
+    tokens = _feed(events, "rca", [_chunk("run-2"), _chunk("run-2", "Root "), _chunk("run-2", "cause")])
+    assert tokens == [("token", "Root "), ("token", "cause")]
+    # the node end does not repeat what already streamed
+    assert events.events("updates", {"rca": {}}) == [("progress", "rca")]
+
+
+def test_validated_answer_is_held_until_accepted():
+    events, node = TurnEvents(), "pandas-agent processing"
+    assert _feed(events, node, [_chunk("run-1", "first "), _chunk("run-1", "try")]) == []
+    assert all(kind != "token" for kind, _ in events.events("updates", {node: {}}))
+    assert events.events("updates", {"validate_pandas_agent": {"verification": "INVALID"}}) == \
+        [("progress", "validate_pandas_agent")]
+
+    _feed(events, node, [_chunk("run-2", "second")])
+    events.events("updates", {node: {}})
+    assert ("token", "second") in events.events("updates", {"validate_pandas_agent": {"verification": "VALID"}})
@@ -1,14 +1,72 @@
 import os
+from contextlib import contextmanager
+from functools import lru_cache
 from langchain_openai import AzureChatOpenAI
+from langchain_core.load import dumps
+from langchain_core.prompt_values import PromptValue
 from dotenv import load_dotenv
+from utils_kk.misl_function.misl_llmCache import build_llm_cache
 load_dotenv(override=True)
 
 
-llm = AzureChatOpenAI(
-    azure_endpoint=os.getenv("AZURE_OPENAI_API_BASE"),
-    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-    api_version=os.getenv("OPENAI_API_VERSION"),
-    temperature=0,
-    deployment_name=os.getenv('AZURE_OPENAI_DEPLOYMENT_NAME'),
-    model_name=os.getenv('AZURE_OPENAI_ASSISTANT_MODEL'),
-)
+@lru_cache(maxsize=None)
+def _azure_llms() -> tuple:
+    """Azure model and the same deployment with a response cache, built on first use
+
+    Built lazily so that importing the nodes needs no Azure settings, e.g. when
+    every call is served by override_llm.
+    """
+    llm = AzureChatOpenAI(
+        azure_endpoint=os.getenv("AZURE_OPENAI_API_BASE"),
+        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        api_version=os.getenv("OPENAI_API_VERSION"),
+        temperature=0,
+        deployment_name=os.getenv('AZURE_OPENAI_DEPLOYMENT_NAME'),
+        model_name=os.getenv('AZURE_OPENAI_ASSISTANT_MODEL'),
+    )
+    # the cached copy serves the deterministic intent-classification chains
+    llm_cache = build_llm_cache()
+    cached_llm = llm.model_copy(update={"cache": llm_cache}) if llm_cache is not None else llm
+    return llm, cached_llm
+
+
+_llm_override = None
+
+
+def get_llm(cached: bool = False):
+    """Chat model used by the nodes, resolved at call time so it can be swapped
+
+    Args:
+        cached (bool): the response-cached model, for deterministic chains
+
+    Returns:
+        BaseChatModel: the override when one is set, otherwise the Azure model
+    """
+    if _llm_override is not None:
+        return _llm_override
+    llm, cached_llm = _azure_llms()
+    return cached_llm if cached else llm
+
+
+def evict_cached_response(prompt_value: PromptValue):
+    """Drop the cached response of a prompt sent to get_llm(cached=True), e.g. one that failed its schema check
+
+    The key is built the way the chat model looks the prompt up: the serialized
+    messages and the model's llm string.
+    """
+    chat_model = get_llm(cached=True)
+    cache = getattr(chat_model, "cache", None)
+    if hasattr(cache, "evict"):
+        cache.evict(dumps(prompt_value.to_messages()), chat_model._get_llm_string())
+
+
+@contextmanager
+def override_llm(chat_model):
+    """Serve every node from `chat_model` inside the block, e.g. a stand-in for load tests"""
+    global _llm_override
+    previous = _llm_override
+    _llm_override = chat_model
+    try:
+        yield chat_model
+    finally:
+        _llm_override = previous
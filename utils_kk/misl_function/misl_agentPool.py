@@ -0,0 +1,61 @@
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+import structlog
+
+structlogger = structlog.get_logger(__name__)
+
+
+class AgentPool:
+    """Warm agents kept per key, least recently used keys evicted first.
+
+    An agent is leased to one turn at a time: its Python REPL keeps the
+    variables of earlier turns, so two concurrent turns must not share it.
+    A lease on a key whose agents are all busy builds an extra agent, which
+    joins the pool when the lease ends.
+    """
+
+    def __init__(self, max_agents: int = 32):
+        self.max_agents = max_agents
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._idle = OrderedDict()
+
+    def _size(self) -> int:
+        return sum(len(agents) for agents in self._idle.values())
+
+    def acquire(self, key, factory):
+        """Idle agent of `key`, or a new one from `factory()`"""
+        with self._lock:
+            agents = self._idle.get(key)
+            if agents:
+                self._idle.move_to_end(key)
+                self.hits += 1
+                return agents.pop()
+            self.misses += 1
+
+        structlogger.debug("-- Building agent", key=key)
+        return factory()
+
+    def release(self, key, agent):
+        with self._lock:
+            self._idle.setdefault(key, []).append(agent)
+            self._idle.move_to_end(key)
+            while self._size() > self.max_agents:
+                oldest = next(iter(self._idle))
+                self._idle[oldest].pop(0)
+                if not self._idle[oldest]:
+                    del self._idle[oldest]
+
+    @contextmanager
+    def lease(self, key, factory):
+        agent = self.acquire(key, factory)
+        try:
+            yield agent
+        finally:
+            self.release(key, agent)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "keys": len(self._idle), "agents": self._size()}
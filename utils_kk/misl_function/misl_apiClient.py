@@ -0,0 +1,51 @@
+import json
+import httpx
+
+
+class ApiClient:
+    """Client of api_server.py with the same turn events as main.stream_turn.
+
+    Lets a front-end such as app_stream.py use a shared server, with its
+    loaded dataset and compiled graph, instead of running the graph itself.
+    """
+
+    def __init__(self, base_url: str, timeout: float = 600):
+        self._client = httpx.Client(base_url=base_url.rstrip("/"), timeout=timeout)
+
+    def _json(self, response: httpx.Response) -> dict:
+        response.raise_for_status()
+        return response.json()
+
+    def create_session(self) -> str:
+        return self._json(self._client.post("/sessions"))["session_id"]
+
+    def transcript(self, session_id: str) -> list:
+        """{"role", "content"} messages still in the session's checkpoint, empty for a new session"""
+        response = self._client.get(f"/sessions/{session_id}")
+        if response.status_code == 404:
+            return []
+        return self._json(response)["messages"]
+
+    def refresh_dataset(self) -> str:
+        return self._json(self._client.post("/dataset/refresh"))["dataset_version"]
+
+    def ask(self, session_id: str, question: str) -> dict:
+        return self._json(self._client.post(f"/sessions/{session_id}/ask", json={"question": question}))
+
+    def stream_turn(self, session_id: str, question: str):
+        """Run one turn on the server
+
+        Yields:
+            tuple: ("progress", step label), ("token", text) and ("result", answer) events
+        """
+        with self._client.stream("POST", f"/sessions/{session_id}/stream", json={"question": question}) as response:
+            response.raise_for_status()
+            kind = None
+            for line in response.iter_lines():
+                if line.startswith("event: "):
+                    kind = line[len("event: "):]
+                elif line.startswith("data: "):
+                    payload = json.loads(line[len("data: "):])
+                    if kind == "error":
+                        raise RuntimeError(payload)
+                    yield kind, payload
@@ -0,0 +1,254 @@
+import os
+import sys
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, project_root)
+
+import argparse
+import glob
+import hashlib
+import json
+import threading
+import numpy as np
+import pandas as pd
+import yaml
+import structlog
+from utils_kk.misl_function.misl_getData import CONFIG_FILELOC
+from utils_kk.tool_functions.data_transformer import read_directory_parquet, rename_RDK_parameters, \
+                                   generate_extra_features, load_RDK_parameters, EXTRA_FEATURES, RDK_RENAME_MAP
+
+structlogger = structlog.get_logger(__name__)
+
+BASELINE_DIR = "knowledge_folder/datapoints/DE_baseline_router_data/"
+STORE_FILE = "quantiles.parquet"
+FLEET = "fleet"
+# bump when the store computation changes in a way store_fingerprint cannot see
+STORE_VERSION = 1
+
+
+def load_baseline_store_config(config_fileloc: str = CONFIG_FILELOC) -> dict:
+    with open(config_fileloc) as file:
+        return yaml.safe_load(file)['baseline_store']
+
+
+def store_fingerprint(data_dir: str = BASELINE_DIR, config_fileloc: str = CONFIG_FILELOC) -> str:
+    """Fingerprint of what the store is computed from
+
+    Covers the baseline files (names, sizes, mtimes), the baseline_store and
+    RDK_parameters sections of config.yaml and the rename map; edits to other
+    sections keep the store.
+    """
+    with open(config_fileloc) as file:
+        config = yaml.safe_load(file)
+    sources = []
+    for file_name in sorted(glob.glob(data_dir + '*.parquet')):
+        stat = os.stat(file_name)
+        sources.append([os.path.basename(file_name), stat.st_size, stat.st_mtime_ns])
+
+    store_config = {key: value for key, value in config['baseline_store'].items() if key != 'directory'}
+    payload = {"store_version": STORE_VERSION, "sources": sources, "baseline_store": store_config,
+               "rdk_parameters": config['RDK_parameters'], "rename_map": RDK_RENAME_MAP}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def store_path(base_dir: str = None) -> str:
+    """Quantile file of the current baseline data, one per store fingerprint"""
+    base_dir = base_dir or load_baseline_store_config()['directory']
+    return os.path.join(base_dir, store_fingerprint()[:16], STORE_FILE)
+
+
+def segment_key(columns, values) -> str:
+    """Segment name like "productclass=X, hardware_version=Y" """
+    return ", ".join(f"{column}={value}" for column, value in zip(columns, values))
+
+
+def percentile_rank(grid: np.ndarray, percentiles: np.ndarray, value: float) -> float:
+    """Share of the baseline samples below `value`, in percent, read off a quantile grid
+
+    Values between two grid points are interpolated linearly; a value equal to a
+    run of identical grid points (a flag or a saturated metric) gets the middle
+    of that run.
+    """
+    lo = int(np.searchsorted(grid, value, side='left'))
+    hi = int(np.searchsorted(grid, value, side='right'))
+    if lo == hi:
+        if lo == 0:
+            return 0.0
+        if lo == len(grid):
+            return 100.0
+        share = (value - grid[lo - 1]) / (grid[lo] - grid[lo - 1])
+        return float(percentiles[lo - 1] + share * (percentiles[lo] - percentiles[lo - 1]))
+    return float((percentiles[lo] + percentiles[hi - 1]) / 2)
+
+
+class BaselineStore:
+    """Fleet distributions of every numeric metric as fixed percentile grids.
+
+    Each (segment, metric) holds the metric's quantiles at `percentiles` over
+    the baseline routers' samples, plus sample count and mean. Segments are
+    the distinct values of the configured segment columns (e.g. productclass
+    and hardware_version); the whole fleet is the "fleet" segment and the
+    fallback of small or unknown segments.
+    """
+
+    def __init__(self, table: pd.DataFrame, segment_by: list = ()):
+        self.segment_by = list(segment_by)
+        self.percentiles = np.array([float(column[1:]) for column in table.columns if column.startswith('p')])
+        quantile_columns = [column for column in table.columns if column.startswith('p')]
+        grids = table[quantile_columns].to_numpy(dtype='float64')
+        self.entries = {(segment, metric): (grid, count, mean) for segment, metric, count, mean, grid
+                        in zip(table['segment'], table['metric'], table['count'], table['mean'], grids)}
+        self.metrics = list(dict.fromkeys(table['metric']))
+
+    def segment_of(self, row) -> str:
+        """Segment of a router from one of its rows, e.g. its latest sample"""
+        if not self.segment_by or any(column not in row for column in self.segment_by):
+            return FLEET
+        return segment_key(self.segment_by, [row[column] for column in self.segment_by])
+
+    def entry(self, metric: str, segment: str = FLEET):
+        """(grid, count, mean, segment used) of a metric, the fleet entry when the segment has none"""
+        if (segment, metric) in self.entries:
+            return (*self.entries[(segment, metric)], segment)
+        if (FLEET, metric) in self.entries:
+            return (*self.entries[(FLEET, metric)], FLEET)
+        return None
+
+    def rank(self, metric: str, value: float, segment: str = FLEET):
+        """Percentile rank of a value among the baseline samples of a metric, None when unknown"""
+        entry = self.entry(metric, segment)
+        if entry is None or value is None or pd.isna(value):
+            return None
+        return percentile_rank(entry[0], self.percentiles, value)
+
+    def quantile(self, metric: str, percentile: float, segment: str = FLEET):
+        entry = self.entry(metric, segment)
+        return None if entry is None else float(np.interp(percentile, self.percentiles, entry[0]))
+
+
+def router_percentiles(store: BaselineStore, rows: pd.DataFrame, metrics: list = None, max_metrics: int = 15,
+                       outside: tuple = (5, 95)) -> pd.DataFrame:
+    """Percentile ranks of a router's metric medians within the baseline
+
+    The store holds per-sample distributions, so the router is summarised by the
+    median of its samples: a 0/1 flag or a spiky metric is then compared like
+    with like instead of as a rate against single samples.
+
+    Args:
+        store (BaselineStore): baseline quantile store
+        rows (pd.DataFrame): the router's rows over the period analysed, time ascending
+        metrics (list, optional): metrics to report; by default those whose rank is outside `outside`
+        max_metrics (int): most metrics reported, the furthest from the median first
+        outside (tuple): percentile ranks between which a metric counts as normal
+
+    Returns:
+        pd.DataFrame: one row per metric with the router value, fleet quantiles, IQR fences and rank
+    """
+    if rows.empty:
+        return pd.DataFrame()
+    segment = store.segment_of(rows.iloc[-1])
+    candidates = [metric for metric in (metrics or store.metrics) if metric in rows.columns]
+    values = rows[candidates].apply(pd.to_numeric, errors='coerce').median()
+
+    report = []
+    for metric in candidates:
+        rank = store.rank(metric, values[metric], segment)
+        if rank is None or (not metrics and outside[0] < rank < outside[1]):
+            continue
+        q1, q3 = store.quantile(metric, 25, segment), store.quantile(metric, 75, segment)
+        report.append({"metric": metric, "router_median": round(float(values[metric]), 3),
+                       "fleet_p5": store.quantile(metric, 5, segment), "fleet_median": store.quantile(metric, 50, segment),
+                       "fleet_p95": store.quantile(metric, 95, segment),
+                       "lower_fence": q1 - 1.5 * (q3 - q1), "upper_fence": q3 + 1.5 * (q3 - q1),
+                       "percentile_rank": round(rank, 1), "segment": store.entry(metric, segment)[3]})
+
+    report = pd.DataFrame(report)
+    if report.empty:
+        return report
+    report = report.iloc[(report['percentile_rank'] - 50).abs().argsort()[::-1]].head(max_metrics)
+    return report.round(3).reset_index(drop=True)
+
+
+def read_baseline_data(data_dir: str = BASELINE_DIR, config_fileloc: str = CONFIG_FILELOC) -> pd.DataFrame:
+    """Baseline routers' telemetry with the same columns and derived features as the router data"""
+    data = read_directory_parquet(data_dir)
+    data = data[[column for column in load_RDK_parameters(config_fileloc) if column in data.columns]]
+    data = rename_RDK_parameters(data)
+    if all(source_column in data.columns for _, _, source_column in EXTRA_FEATURES):
+        data = generate_extra_features(data)
+    return data
+
+
+def build_baseline_store(base_dir: str = None) -> str:
+    """Compute the percentile grids of the baseline data and write them to the store file
+
+    Args:
+        base_dir (str, optional): store root directory, defaults to config.yaml
+
+    Returns:
+        str: path of the store file
+    """
+    config = load_baseline_store_config()
+    path = store_path(base_dir)
+    segment_by = list(config.get('segment_by', []))
+    percentiles = np.linspace(0, 100, config.get('grid_points', 101))
+
+    data = read_baseline_data()
+    metrics = [column for column in data.columns if pd.api.types.is_numeric_dtype(data[column])
+               and not pd.api.types.is_bool_dtype(data[column]) and column not in segment_by]
+    structlogger.info("-- Building baseline store", rows=len(data), metrics=len(metrics), segment_by=segment_by)
+
+    segments = [(FLEET, data)]
+    if segment_by and all(column in data.columns for column in segment_by):
+        for values, rows in data.groupby(segment_by, dropna=False, observed=True):
+            values = values if isinstance(values, tuple) else (values,)
+            # small segments are left to the fleet grid
+            if len(rows) >= config.get('min_segment_rows', 1000):
+                segments.append((segment_key(segment_by, values), rows))
+
+    frames = []
+    for segment, rows in segments:
+        values = rows[metrics]
+        quantiles = values.quantile(percentiles / 100).T
+        quantiles.columns = [f"p{percentile:g}" for percentile in percentiles]
+        quantiles.insert(0, 'mean', values.mean())
+        quantiles.insert(0, 'count', values.count())
+        quantiles.insert(0, 'metric', metrics)
+        quantiles.insert(0, 'segment', segment)
+        # metrics without a single sample in the segment have no distribution
+        frames.append(quantiles[quantiles['count'] > 0])
+
+    table = pd.concat(frames, ignore_index=True)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    table.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    structlogger.info("-- Baseline store written", path=path, segments=len(segments), entries=len(table))
+    return path
+
+
+_stores = dict()
+_stores_lock = threading.Lock()
+
+
+def get_baseline_store(base_dir: str = None) -> BaselineStore:
+    """Baseline store of the baseline data, built on first use when the offline build has not run
+
+    Resolved once per process: the baseline data is a fixed reference set, and
+    a store rebuilt offline is picked up at the next start.
+    """
+    with _stores_lock:
+        if base_dir not in _stores:
+            path = store_path(base_dir)
+            if not os.path.exists(path):
+                structlogger.warning("-- Baseline store missing, building it", path=path)
+                build_baseline_store(base_dir)
+            _stores[base_dir] = BaselineStore(pd.read_parquet(path), load_baseline_store_config().get('segment_by', []))
+            structlogger.info("-- Baseline store loaded", path=path)
+        return _stores[base_dir]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the fleet baseline quantile store")
+    parser.add_argument("--directory", default=None, help="store root directory, defaults to config.yaml")
+    args = parser.parse_args()
+    print(build_baseline_store(base_dir=args.directory))
@@ -0,0 +1,172 @@
+import os
+import sys
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, project_root)
+
+import argparse
+import asyncio
+import json
+import time
+import numpy as np
+import pandas as pd
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from utils_kk.tool_functions.data_transformer import generate_extra_features
+
+
+def _timeit(func, *args, repeat: int = 3) -> float:
+    """Best wall-clock time of `repeat` runs, in seconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def synthetic_extra_feature_frame(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    """Router-shaped frame with the source columns of EXTRA_FEATURES"""
+    rng = np.random.default_rng(seed)
+    channels = np.array(['1,6,11', '36,40,44,48', '6', 'NULL', '', None], dtype=object)
+    restarts = np.array(['0', '1', 0, 1, None], dtype=object)
+    return pd.DataFrame({
+        "wifi_radio_1_channelsinuse": channels[rng.integers(0, len(channels), n_rows)],
+        "wifi_radio_2_channelsinuse": channels[rng.integers(0, len(channels), n_rows)],
+        "telemetry_restart": restarts[rng.integers(0, len(restarts), n_rows)],
+    })
+
+
+def legacy_generate_extra_features(df: pd.DataFrame) -> pd.DataFrame:
+    """Row-wise reference implementation generate_extra_features replaced"""
+    df["wifi_radio_1_total_channels_active"] = df["wifi_radio_1_channelsinuse"].apply(lambda x: len(x.split(',')) if (isinstance(x, str) & (x!='NULL')) else 1)
+    df["wifi_radio_2_total_channels_active"] = df["wifi_radio_2_channelsinuse"].apply(lambda x: len(x.split(',')) if (isinstance(x, str) & (x!='NULL')) else 1)
+    df["telemetry_restart"] = df["telemetry_restart"].apply(lambda x: int(0 if x is None else x))
+    return df
+
+
+def benchmark_generate_extra_features(n_rows: int = 1_000_000) -> dict:
+    """Vectorized generate_extra_features against the row-wise version on a synthetic frame"""
+    df = synthetic_extra_feature_frame(n_rows)
+    legacy = legacy_generate_extra_features(df.copy())
+    vectorized = generate_extra_features(df.copy())
+    pd.testing.assert_frame_equal(legacy, vectorized)
+
+    legacy_seconds = _timeit(lambda: legacy_generate_extra_features(df.copy()))
+    vectorized_seconds = _timeit(lambda: generate_extra_features(df.copy()))
+    return {
+        "benchmark": "generate_extra_features",
+        "rows": n_rows,
+        "legacy_seconds": round(legacy_seconds, 4),
+        "vectorized_seconds": round(vectorized_seconds, 4),
+        "speedup": round(legacy_seconds / vectorized_seconds, 1),
+    }
+
+
+class StandInChatModel(BaseChatModel):
+    """Chat model answering the graph's prompts with canned replies after a fixed latency"""
+
+    latency: float = 0.2
+
+    @property
+    def _llm_type(self) -> str:
+        return "stand-in"
+
+    @staticmethod
+    def _reply(messages) -> str:
+        prompt = "\n".join(str(message.content) for message in messages)
+        if "Extract the router serial number" in prompt:
+            return json.dumps({"serial_number": None})
+        if "Feature Validation Assistant" in prompt:
+            return json.dumps({"status": "AVAILABLE", "matched_columns": ["cpuusage"],
+                               "explanation": "cpu usage is available", "suggested_response": None})
+        if "Intent Classifier" in prompt:
+            return json.dumps({"intent": "chit-chat", "missing_fields": [], "suggested_question": "none",
+                               "matched_columns": ["cpuusage"], "explanation": "small talk"})
+        return "Happy to help with your router."
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._reply(messages)))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._reply(messages)))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        for token in self._reply(messages).split(" "):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=f"{token} "))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        for token in self._reply(messages).split(" "):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=f"{token} "))
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+def benchmark_concurrent_sessions(n_sessions: int = 48, latency: float = 0.2) -> dict:
+    """Concurrent conversations on the async graph path, served by one event loop and a stand-in LLM
+
+    Every turn makes three model calls (feature validation, intent, chit-chat),
+    so a blocking turn takes about 3 * latency; on the async path all
+    sessions should finish in roughly the time of one.
+    """
+    from main import create_graph, thread_config
+    from langgraph.checkpoint.memory import MemorySaver
+    from utils_kk.llm_initializations import override_llm
+    from utils_kk.misl_function.misl_dataStore import publish_dataset
+
+    serials = [f"90100000000V4120{i:05d}" for i in range(n_sessions)]
+    version = publish_dataset(pd.DataFrame({"serialnumber": serials,
+                                            "time": pd.Timestamp("2024-08-01"),
+                                            "cpuusage": 10.0}))
+    # in-memory checkpoints, the benchmark measures the model calls rather than SQLite writes
+    flow = create_graph(checkpointer=MemorySaver())
+
+    def session_state(serial_number):
+        return {"question": f"Hi, my router is {serial_number}, how are you today?", "generation_scratchpad": [],
+                "chat_history": [], "intent_classification": "", "serialnumber": None, "bypass_intention": False,
+                "intermediate_result": "", "final_result": "", "verification": None, "dataset_version": version}
+
+    async def run_sessions():
+        return await asyncio.gather(*(flow.ainvoke(session_state(serial_number), thread_config(serial_number))
+                                      for serial_number in serials))
+
+    with override_llm(StandInChatModel(latency=latency)):
+        started = time.perf_counter()
+        flow.invoke(session_state(serials[0]), thread_config("blocking"))
+        blocking_turn_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        responses = asyncio.run(run_sessions())
+        concurrent_seconds = time.perf_counter() - started
+
+    assert all(response["final_result"] for response in responses)
+    assert [response["serialnumber"] for response in responses] == serials
+    return {
+        "benchmark": "concurrent_sessions",
+        "sessions": n_sessions,
+        "blocking_turn_seconds": round(blocking_turn_seconds, 3),
+        "concurrent_seconds": round(concurrent_seconds, 3),
+        "speedup_vs_sequential": round(n_sessions * blocking_turn_seconds / concurrent_seconds, 1),
+    }
+
+
+BENCHMARKS = {
+    "extra_features": benchmark_generate_extra_features,
+    "concurrent_sessions": benchmark_concurrent_sessions,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the router data pipeline")
+    parser.add_argument("names", nargs="*", default=list(BENCHMARKS), help="benchmarks to run")
+    args = parser.parse_args()
+    for name in args.names:
+        print(BENCHMARKS[name]())
@@ -0,0 +1,119 @@
+import math
+from functools import lru_cache
+import yaml
+import structlog
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_core.messages.utils import get_buffer_string
+
+structlogger = structlog.get_logger(__name__)
+
+CONFIG_FILELOC = 'config/config.yaml'
+# rough size of a token in characters, when no tokenizer is available
+CHARS_PER_TOKEN = 4
+TRUNCATION_MARK = " …[truncated]"
+
+
+def load_chat_history_config(config_fileloc: str = CONFIG_FILELOC) -> dict:
+    with open(config_fileloc) as file:
+        return yaml.safe_load(file).get('chat_history', {})
+
+
+CHAT_HISTORY_CONFIG = load_chat_history_config()
+
+
+@lru_cache(maxsize=None)
+def _encoding(name: str):
+    """tiktoken encoding, None when tiktoken or its encoding file is unavailable (e.g. offline)"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        structlogger.warning("-- Tokenizer unavailable, estimating tokens from characters", encoding=name, detail=e)
+        return None
+
+
+def count_tokens(text: str, encoding: str = None) -> int:
+    """Number of tokens of a text, counted locally"""
+    tokenizer = _encoding(encoding or CHAT_HISTORY_CONFIG.get('encoding', 'o200k_base'))
+    if tokenizer is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(tokenizer.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int, encoding: str = None) -> str:
+    """Text cut to at most `max_tokens` tokens, marked when it was cut"""
+    if count_tokens(text, encoding) <= max_tokens:
+        return text
+    tokenizer = _encoding(encoding or CHAT_HISTORY_CONFIG.get('encoding', 'o200k_base'))
+    if tokenizer is None:
+        return text[:max_tokens * CHARS_PER_TOKEN] + TRUNCATION_MARK
+    return tokenizer.decode(tokenizer.encode(text, disallowed_special=())[:max_tokens]) + TRUNCATION_MARK
+
+
+def truncate_message(message: BaseMessage, max_tokens: int) -> BaseMessage:
+    """Message with its text cut to at most `max_tokens` tokens"""
+    if not isinstance(message.content, str):
+        return message
+    content = truncate_tokens(message.content, max_tokens)
+    return message if content is message.content else message.model_copy(update={"content": content})
+
+
+def recent_start(messages: list, keep_turns: int) -> int:
+    """Index of the first message of the last `keep_turns` turns; a turn starts at a user message"""
+    starts = [position for position, message in enumerate(messages) if isinstance(message, HumanMessage)]
+    if len(starts) <= keep_turns:
+        return 0
+    return starts[-keep_turns] if keep_turns > 0 else len(messages)
+
+
+def history_messages(state: dict, prompt_type: str) -> list:
+    """Chat history of a prompt within its token budget
+
+    The messages still in chat_history (normally the last `keep_turns` turns
+    and the current question; older ones are folded into the rolling summary)
+    are kept verbatim, each cut to `max_message_tokens`, behind the summary.
+    When they do not fit the budget of `prompt_type` the oldest are dropped;
+    the latest message is always kept.
+
+    Args:
+        state (customGraph): graph state with chat_history and history_summary
+        prompt_type (str): key of chat_history.budgets in config.yaml, e.g. "pandas_agent"
+
+    Returns:
+        list: messages to render into the prompt
+    """
+    config = CHAT_HISTORY_CONFIG
+    budget = config.get('budgets', {}).get(prompt_type, config.get('default_budget', 2000))
+    messages = list(state.get("chat_history", None) or [])
+    recent = [truncate_message(message, config.get('max_message_tokens', 500)) for message in messages]
+
+    history = []
+    summary = state.get("history_summary", None)
+    if summary:
+        history.append(SystemMessage(content=f"Summary of the earlier conversation: {summary}"))
+    used = sum(count_tokens(get_buffer_string([message])) for message in history)
+
+    kept = []
+    for message in reversed(recent):
+        tokens = count_tokens(get_buffer_string([message]))
+        if kept and used + tokens > budget:
+            break
+        kept.append(message)
+        used += tokens
+
+    if len(kept) < len(recent):
+        structlogger.debug("-- Chat history over budget", prompt_type=prompt_type, budget=budget,
+                           dropped=len(recent) - len(kept))
+    return history + kept[::-1]
+
+
+def history_text(state: dict, prompt_type: str) -> str:
+    """history_messages rendered as "Human: ... / AI: ..." lines"""
+    return get_buffer_string(history_messages(state, prompt_type))
+
+
+def pending_fold(state: dict) -> list:
+    """Messages of chat_history older than the verbatim window, to be folded into the summary"""
+    messages = list(state.get("chat_history", None) or [])
+    stop = recent_start(messages, CHAT_HISTORY_CONFIG.get('keep_turns', 3))
+    return messages[:stop]
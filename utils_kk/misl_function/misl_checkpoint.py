@@ -0,0 +1,258 @@
+import os
+import random
+import sqlite3
+import threading
+from collections.abc import AsyncIterator, Iterator, Sequence
+from typing import Any, Optional
+import yaml
+import structlog
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import WRITES_IDX_MAP, BaseCheckpointSaver, ChannelVersions, Checkpoint, \
+                                     CheckpointMetadata, CheckpointTuple, get_checkpoint_id, get_checkpoint_metadata
+from langgraph.checkpoint.memory import MemorySaver
+
+structlogger = structlog.get_logger(__name__)
+
+CONFIG_FILELOC = 'config/config.yaml'
+
+
+class SqliteCheckpointSaver(BaseCheckpointSaver):
+    """LangGraph checkpointer storing conversations in a local SQLite file.
+
+    Same layout as langgraph's in-memory saver: a checkpoint row holds the
+    channel versions only, and each channel value is a separate blob keyed by
+    (thread, channel, version), so a step writes the channels it changed and
+    not the whole state. Only the `keep_checkpoints` most recent checkpoints
+    of a thread are kept, together with the blobs they still reference.
+    """
+
+    def __init__(self, path: str, keep_checkpoints: Optional[int] = 20):
+        super().__init__()
+        self.path = path
+        self.keep_checkpoints = keep_checkpoints
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            "thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL, parent_id TEXT, "
+            "type TEXT NOT NULL, checkpoint BLOB NOT NULL, metadata_type TEXT NOT NULL, metadata BLOB NOT NULL, "
+            "PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id))")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            "thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, channel TEXT NOT NULL, version TEXT NOT NULL, "
+            "sequence INTEGER NOT NULL, type TEXT NOT NULL, value BLOB, "
+            "PRIMARY KEY (thread_id, checkpoint_ns, channel, version))")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS writes ("
+            "thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL, task_id TEXT NOT NULL, "
+            "idx INTEGER NOT NULL, channel TEXT NOT NULL, type TEXT NOT NULL, value BLOB, task_path TEXT NOT NULL, "
+            "PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx))")
+        self._connection.commit()
+
+    def _load_blobs(self, thread_id: str, checkpoint_ns: str, versions: ChannelVersions) -> dict:
+        channel_values = dict()
+        for channel, version in versions.items():
+            row = self._connection.execute(
+                "SELECT type, value FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                (thread_id, checkpoint_ns, channel, str(version))).fetchone()
+            if row is not None and row[0] != "empty":
+                channel_values[channel] = self.serde.loads_typed((row[0], row[1]))
+        return channel_values
+
+    def _tuple(self, thread_id: str, checkpoint_ns: str, row) -> CheckpointTuple:
+        checkpoint_id, parent_id, checkpoint_type, checkpoint, metadata_type, metadata = row
+        checkpoint = self.serde.loads_typed((checkpoint_type, checkpoint))
+        writes = self._connection.execute(
+            "SELECT task_id, channel, type, value FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id)).fetchall()
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                     "checkpoint_id": checkpoint_id}},
+            checkpoint={**checkpoint,
+                        "channel_values": self._load_blobs(thread_id, checkpoint_ns, checkpoint["channel_versions"])},
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config=({"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                             "checkpoint_id": parent_id}} if parent_id else None),
+            pending_writes=[(task_id, channel, self.serde.loads_typed((value_type, value)))
+                            for task_id, channel, value_type, value in writes],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """Checkpoint of the config's checkpoint_id, the latest of the thread without one"""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        columns = "SELECT checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata FROM checkpoints "
+        with self._lock:
+            if checkpoint_id := get_checkpoint_id(config):
+                row = self._connection.execute(
+                    columns + "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id)).fetchone()
+            else:
+                # checkpoint ids are time ordered
+                row = self._connection.execute(
+                    columns + "WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns)).fetchone()
+            return None if row is None else self._tuple(thread_id, checkpoint_ns, row)
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[dict[str, Any]] = None,
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        """Checkpoints matching the config, the metadata filter and `before`, newest first"""
+        query, params = ("SELECT thread_id, checkpoint_ns, checkpoint_id, parent_id, type, checkpoint, "
+                         "metadata_type, metadata FROM checkpoints WHERE 1 = 1"), []
+        if config:
+            query += " AND thread_id = ?"
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                query += " AND checkpoint_ns = ?"
+                params.append(config["configurable"]["checkpoint_ns"])
+            if checkpoint_id := get_checkpoint_id(config):
+                query += " AND checkpoint_id = ?"
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            query += " AND checkpoint_id < ?"
+            params.append(before_id)
+        query += " ORDER BY checkpoint_id DESC"
+
+        with self._lock:
+            rows = self._connection.execute(query, params).fetchall()
+        for thread_id, checkpoint_ns, *row in rows:
+            if limit is not None and limit <= 0:
+                break
+            metadata = self.serde.loads_typed((row[4], row[5]))
+            if filter and not all(metadata.get(key) == value for key, value in filter.items()):
+                continue
+            if limit is not None:
+                limit -= 1
+            with self._lock:
+                item = self._tuple(thread_id, checkpoint_ns, row)
+            yield item
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        """Store a checkpoint and the values of the channels written since the previous one"""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        checkpoint = checkpoint.copy()
+        values = checkpoint.pop("channel_values")
+        blobs = []
+        for channel, version in new_versions.items():
+            value_type, value = self.serde.dumps_typed(values[channel]) if channel in values else ("empty", b"")
+            blobs.append((thread_id, checkpoint_ns, channel, str(version), _sequence(version), value_type, value))
+        checkpoint_type, checkpoint_value = self.serde.dumps_typed(checkpoint)
+        metadata_type, metadata_value = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+
+        with self._lock:
+            self._connection.executemany("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?, ?)", blobs)
+            self._connection.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                 checkpoint_type, checkpoint_value, metadata_type, metadata_value))
+            self._prune(thread_id, checkpoint_ns)
+            self._connection.commit()
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                 "checkpoint_id": checkpoint["id"]}}
+
+    def _prune(self, thread_id: str, checkpoint_ns: str):
+        """Drop the checkpoints of a thread beyond keep_checkpoints and the blobs only they referenced"""
+        if not self.keep_checkpoints:
+            return
+        oldest = self._connection.execute(
+            "SELECT checkpoint_id, type, checkpoint FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "ORDER BY checkpoint_id DESC LIMIT 1 OFFSET ?", (thread_id, checkpoint_ns, self.keep_checkpoints - 1)).fetchone()
+        if oldest is None:
+            return
+        key = (thread_id, checkpoint_ns, oldest[0])
+        self._connection.execute(
+            "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?", key)
+        self._connection.execute("DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?", key)
+        # channel versions only grow, so the kept checkpoints reference no version older than the oldest one does
+        versions = self.serde.loads_typed((oldest[1], oldest[2]))["channel_versions"]
+        self._connection.executemany(
+            "DELETE FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND sequence < ?",
+            [(thread_id, checkpoint_ns, channel, _sequence(version)) for channel, version in versions.items()])
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str,
+                   task_path: str = "") -> None:
+        """Store the pending writes of a task; regular writes already stored for the task are kept"""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            value_type, value = self.serde.dumps_typed(value)
+            rows.append((thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx),
+                         channel, value_type, value, task_path))
+        with self._lock:
+            # special writes (errors, interrupts) replace earlier ones, regular writes are written once
+            self._connection.executemany("INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                         [row for row in rows if row[4] < 0])
+            self._connection.executemany("INSERT OR IGNORE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                         [row for row in rows if row[4] >= 0])
+            self._connection.commit()
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            for table in ("checkpoints", "blobs", "writes"):
+                self._connection.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+            self._connection.commit()
+
+    # SQLite calls are short and local; the async methods run them inline like the in-memory saver
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return self.get_tuple(config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        for item in self.list(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str,
+                          task_path: str = "") -> None:
+        return self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return self.delete_thread(thread_id)
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        next_version = _sequence(current) + 1 if current is not None else 1
+        return f"{next_version:032}.{random.random():016}"
+
+    def threads(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(DISTINCT thread_id) FROM checkpoints").fetchone()[0]
+
+
+def _sequence(version) -> int:
+    """Counter part of a channel version, "<counter>.<random>" or a plain int"""
+    return version if isinstance(version, int) else int(str(version).split(".")[0])
+
+
+def load_checkpoint_config(config_fileloc: str = CONFIG_FILELOC) -> dict:
+    with open(config_fileloc) as file:
+        return yaml.safe_load(file).get('checkpoint', {'enabled': False})
+
+
+_checkpointer = None
+_checkpointer_lock = threading.Lock()
+
+
+def get_checkpointer(config_fileloc: str = CONFIG_FILELOC) -> BaseCheckpointSaver:
+    """Process-wide checkpointer configured in config.yaml; conversations stay in memory when disabled"""
+    global _checkpointer
+    with _checkpointer_lock:
+        if _checkpointer is None:
+            config = load_checkpoint_config(config_fileloc)
+            if config.get('enabled', False):
+                structlogger.info("-- Conversation checkpoints", path=config['path'])
+                _checkpointer = SqliteCheckpointSaver(config['path'], keep_checkpoints=config.get('keep_checkpoints', 20))
+            else:
+                _checkpointer = MemorySaver()
+        return _checkpointer
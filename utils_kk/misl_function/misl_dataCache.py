@@ -0,0 +1,88 @@
+import os
+import glob
+import json
+import hashlib
+import pandas as pd
+import pyarrow.feather as feather
+import yaml
+import structlog
+from utils_kk.tool_functions.data_transformer import RDK_RENAME_MAP
+
+structlogger = structlog.get_logger(__name__)
+
+# bump when the preprocessing chain changes in a way the inputs below cannot see
+CACHE_VERSION = 2
+SNAPSHOT_PREFIX = "router_data_"
+# config.yaml sections get_data reads; other sections are runtime settings that leave the frame unchanged
+SOURCE_CONFIG_SECTIONS = ('RDK_parameters', 'compact_mode')
+
+
+def compute_source_fingerprint(data_dir: str, config_fileloc: str) -> str:
+    """Fingerprint of everything the preprocessed router frame depends on
+
+    Args:
+        data_dir (str): directory holding the raw parquet files
+        config_fileloc (str): location of config.yaml with the RDK parameters
+
+    Returns:
+        str: sha256 hex digest over source file names, sizes and mtimes,
+             the SOURCE_CONFIG_SECTIONS of the config file and the rename map
+    """
+    with open(config_fileloc) as file:
+        config = yaml.safe_load(file)
+    sources = []
+    for file_name in sorted(glob.glob(data_dir + '*.parquet')):
+        stat = os.stat(file_name)
+        sources.append([os.path.basename(file_name), stat.st_size, stat.st_mtime_ns])
+
+    payload = {
+        "cache_version": CACHE_VERSION,
+        "sources": sources,
+        "config": {section: config.get(section, None) for section in SOURCE_CONFIG_SECTIONS},
+        "rename_map": hashlib.sha256(json.dumps(RDK_RENAME_MAP, sort_keys=True).encode()).hexdigest(),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def snapshot_path(cache_dir: str, fingerprint: str) -> str:
+    return os.path.join(cache_dir, f"{SNAPSHOT_PREFIX}{fingerprint[:16]}.feather")
+
+
+def load_snapshot(cache_dir: str, fingerprint: str):
+    """Load the preprocessed router frame for a fingerprint, None on a miss"""
+    path = snapshot_path(cache_dir, fingerprint)
+    if not os.path.exists(path):
+        structlogger.info("-- Data snapshot miss", detail=path)
+        return None
+
+    try:
+        router_data = feather.read_feather(path)
+    except Exception as e:
+        structlogger.error("Unreadable data snapshot, rebuilding", detail=e)
+        return None
+
+    structlogger.info("-- Data snapshot hit", detail=path)
+    return router_data
+
+
+def save_snapshot(router_data: pd.DataFrame, cache_dir: str, fingerprint: str) -> str:
+    """Write the preprocessed router frame atomically and drop stale snapshots"""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = snapshot_path(cache_dir, fingerprint)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+
+    try:
+        feather.write_feather(router_data.reset_index(drop=True), tmp_path)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        structlogger.error("Failed to write data snapshot", detail=e)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+
+    for stale in glob.glob(os.path.join(cache_dir, f"{SNAPSHOT_PREFIX}*.feather")):
+        if stale != path:
+            os.remove(stale)
+
+    structlogger.info("-- Data snapshot written", detail=path)
+    return path
@@ -0,0 +1,146 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+import pandas as pd
+import yaml
+import structlog
+from utils_kk.tool_functions.router_index import RouterTimeIndex
+from utils_kk.misl_function.misl_getData import get_router_index, get_data_delta, list_source_files, CONFIG_FILELOC
+
+structlogger = structlog.get_logger(__name__)
+
+# Process-wide, read-only router telemetry shared by every graph session.
+# Graph state only carries the dataset version id; nodes resolve it here.
+MAX_DATASET_VERSIONS = 2
+with open(CONFIG_FILELOC) as file:
+    REFRESH_CONFIG = yaml.safe_load(file).get('data_refresh', {})
+
+_lock = threading.RLock()
+_datasets = OrderedDict()
+# version -> source files it was built from (name -> (size, mtime_ns)), None when unknown
+_sources = dict()
+_current_version = None
+_refresh_lock = threading.Lock()
+_last_refresh = time.monotonic()
+
+
+def publish_dataset(router_data: pd.DataFrame | RouterTimeIndex, version: str = None, source_files: dict = None) -> str:
+    """Register router data as the current dataset version
+
+    Args:
+        router_data (pd.DataFrame | RouterTimeIndex): preprocessed router data or its index
+        version (str, optional): version id, generated when omitted
+        source_files (dict, optional): data directory files the data was built from, see list_source_files
+
+    Returns:
+        str: version id to store in the graph state
+    """
+    global _current_version
+    if not isinstance(router_data, RouterTimeIndex):
+        router_data = RouterTimeIndex(router_data)
+    version = version or uuid.uuid4().hex[:12]
+
+    with _lock:
+        _datasets[version] = router_data
+        _datasets.move_to_end(version)
+        _sources[version] = source_files
+        _current_version = version
+        # keep the previous version alive for turns that are still running on it
+        while len(_datasets) > MAX_DATASET_VERSIONS:
+            retired, _ = _datasets.popitem(last=False)
+            _sources.pop(retired, None)
+
+    structlogger.info("-- Dataset published", version=version, rows=len(router_data))
+    return version
+
+
+def current_version() -> str:
+    return _current_version
+
+
+def dataset_source_files(version: str = None) -> dict:
+    """Source files a dataset version was built from (see list_source_files), None when unknown"""
+    with _lock:
+        return _sources.get(version or _current_version, None)
+
+
+def get_dataset(version: str = None) -> RouterTimeIndex:
+    """Resolve a dataset version id, falling back to the current version"""
+    with _lock:
+        if version in _datasets:
+            return _datasets[version]
+        if _current_version is None:
+            raise LookupError("No router dataset has been published")
+        if version is not None:
+            structlogger.debug("Dataset version retired, serving current", detail=version)
+        return _datasets[_current_version]
+
+
+def ensure_dataset_loaded(loader=None) -> str:
+    """Load and publish the router data once per process
+
+    Args:
+        loader (callable, optional): returns the router data, defaults to get_router_index
+
+    Returns:
+        str: current dataset version id
+    """
+    with _lock:
+        if _current_version is None:
+            # listed before reading: a file landing in between is read now and again by the
+            # next refresh, whose merge drops the rows that are already loaded
+            source_files = list_source_files() if loader is None else None
+            publish_dataset((loader or get_router_index)(), source_files=source_files)
+        return _current_version
+
+
+def refresh_dataset() -> str:
+    """Ingest the data directory files that arrived since the current version was built
+
+    Only the new files are read and preprocessed; their rows are merged into the
+    current router index and published as a new version, which running sessions
+    pick up at their next turn. A rewritten or deleted file cannot be applied as
+    a delta and triggers a full reload.
+
+    Returns:
+        str: current dataset version id, unchanged when no file arrived
+    """
+    global _last_refresh
+    with _refresh_lock:
+        version = ensure_dataset_loaded()
+        _last_refresh = time.monotonic()
+        known = _sources.get(version, None)
+        files = list_source_files()
+        if files == known:
+            return version
+
+        if known is None or any(files.get(name, None) != stat for name, stat in known.items()):
+            structlogger.info("-- Source files changed, full reload", files=len(files))
+            return publish_dataset(get_router_index(), source_files=files)
+
+        new_files = [name for name in files if name not in known]
+        started = time.perf_counter()
+        router_index = get_dataset(version)
+        merged = router_index.merge(get_data_delta(new_files))
+        structlogger.info("-- Ingested new files", files=new_files, rows=len(merged) - len(router_index),
+                          seconds=round(time.perf_counter() - started, 3))
+        if merged is router_index:
+            # every row was already loaded
+            with _lock:
+                _sources[version] = files
+            return version
+        return publish_dataset(merged, source_files=files)
+
+
+def refresh_dataset_if_due() -> str:
+    """refresh_dataset when the refresh interval of config.yaml has passed, else the current version"""
+    interval = REFRESH_CONFIG.get('interval_seconds', None)
+    if interval and time.monotonic() - _last_refresh >= interval:
+        return refresh_dataset()
+    return ensure_dataset_loaded()
+
+
+def resolve_data(state: dict) -> RouterTimeIndex:
+    """Resolve the dataset referenced by a graph state"""
+    return get_dataset(state.get("dataset_version", None))
@@ -1,15 +1,78 @@
+import os
+import glob
+import yaml
+import structlog
+import pyarrow.dataset as ds
 from utils_kk.tool_functions.data_transformer import read_directory_parquet, select_RDK_parameters, rename_RDK_parameters, \
-                                   generate_extra_features, retrieve_serialnumber, get_baseline_statistics, \
-                                   column_info
+                                   generate_extra_features, retrieve_serialnumber, \
+                                   column_info, compact_router_data
+from utils_kk.tool_functions.router_index import RouterTimeIndex
+from utils_kk.misl_function.misl_dataCache import compute_source_fingerprint, load_snapshot, save_snapshot
 
-def get_data():
-    data_dir = "knowledge_folder/datapoints/DE_router_data_all/"
-    config_fileloc = 'config/config.yaml'
+structlogger = structlog.get_logger(__name__)
 
-    router_data = read_directory_parquet(data_dir)
-    router_data = select_RDK_parameters(router_data, config_fileloc)
+DATA_DIR = "knowledge_folder/datapoints/DE_router_data_all/"
+CONFIG_FILELOC = 'config/config.yaml'
+
+def get_data(max_workers: int = None, use_cache: bool = True):
+    data_dir = DATA_DIR
+    config_fileloc = CONFIG_FILELOC
+
+    with open(config_fileloc) as file:
+        config = yaml.safe_load(file)
+
+    cache_config = config.get('data_cache', {})
+    use_cache = use_cache and cache_config.get('enabled', False)
+    if use_cache:
+        fingerprint = compute_source_fingerprint(data_dir, config_fileloc)
+        router_data = load_snapshot(cache_config['directory'], fingerprint)
+        if router_data is not None:
+            return router_data
+
+    # only the configured RDK parameters are read from disk
+    router_data = read_directory_parquet(data_dir, columns=config['RDK_parameters'],
+                                         max_workers=max_workers)
     # router_data = retrieve_serialnumber(router_data, serialnumber_selected)
-    router_data = rename_RDK_parameters(router_data)
-    router_data = generate_extra_features(router_data)
+    router_data = preprocess_router_data(router_data, config_fileloc)
+    # keep rows ordered by (serialnumber, time) so the router index is a boundary scan
+    router_data = router_data.sort_values(by=['serialnumber', 'time'], kind='stable', ignore_index=True)
+
+    compact_config = config.get('compact_mode', {})
+    if compact_config.get('enabled', False):
+        router_data, report = compact_router_data(router_data, compact_config.get('max_category_ratio', 0.5))
+        structlogger.info("-- Compact mode", bytes_before=int(report['bytes_before'].sum()),
+                          bytes_after=int(report['bytes_after'].sum()),
+                          top_savings=report['bytes_saved'].head(10).to_dict())
+
+    if use_cache:
+        save_snapshot(router_data, cache_config['directory'], fingerprint)
     return router_data
-    
\ No newline at end of file
+
+def preprocess_router_data(router_data, config_fileloc: str = CONFIG_FILELOC):
+    """Raw telemetry rows to the columns and derived features of the router dataset"""
+    router_data = select_RDK_parameters(router_data, config_fileloc)
+    router_data = rename_RDK_parameters(router_data)
+    return generate_extra_features(router_data)
+
+
+def list_source_files(data_dir: str = DATA_DIR) -> dict:
+    """Parquet files of the data directory as file name -> (size, mtime_ns)"""
+    files = dict()
+    for file_name in sorted(glob.glob(data_dir + '*.parquet')):
+        stat = os.stat(file_name)
+        files[os.path.basename(file_name)] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+def get_data_delta(file_names: list, data_dir: str = DATA_DIR):
+    """Preprocessed rows of some files of the data directory only, for incremental ingestion"""
+    with open(CONFIG_FILELOC) as file:
+        config = yaml.safe_load(file)
+    paths = [os.path.join(data_dir, file_name) for file_name in file_names]
+    router_data = ds.dataset(paths, format='parquet').to_table(columns=config['RDK_parameters'], use_threads=True).to_pandas()
+    return preprocess_router_data(router_data, CONFIG_FILELOC)
+
+
+def get_router_index(max_workers: int = None, use_cache: bool = True) -> RouterTimeIndex:
+    return RouterTimeIndex(get_data(max_workers=max_workers, use_cache=use_cache))
+
@@ -0,0 +1,162 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+import yaml
+import structlog
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.load import dumps, loads
+
+structlogger = structlog.get_logger(__name__)
+
+CONFIG_FILELOC = 'config/config.yaml'
+
+
+def cache_key(prompt: str, llm_string: str) -> str:
+    """sha256 of the rendered prompt and the model configuration
+
+    llm_string is langchain's serialization of the chat model and its invocation
+    parameters, so it carries the deployment name and the temperature.
+    """
+    return hashlib.sha256(f"{llm_string}\x00{prompt}".encode()).hexdigest()
+
+
+class LLMResponseCache(BaseCache):
+    """LLM response cache with an in-memory LRU in front of a SQLite table.
+
+    Entries expire `ttl_seconds` after they were written. The memory front
+    keeps the `memory_entries` most recently used responses; the SQLite table
+    keeps at most `max_entries` rows and drops the least recently used ones
+    beyond that.
+    """
+
+    def __init__(self, path: str, memory_entries: int = 512, max_entries: int = 10000, ttl_seconds: float = None):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.memory_hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed)")
+        self._connection.commit()
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created > self.ttl_seconds
+
+    def _remember(self, key: str, created: float, response: RETURN_VAL_TYPE):
+        self._memory[key] = (created, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = cache_key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            if key in self._memory:
+                created, response = self._memory[key]
+                if not self._expired(created, now):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    self.memory_hits += 1
+                    return response
+                del self._memory[key]
+
+            row = self._connection.execute(
+                "SELECT response, created FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None or self._expired(row[1], now):
+                if row is not None:
+                    self._connection.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    self._connection.commit()
+                self.misses += 1
+                return None
+
+            try:
+                response = loads(row[0])
+            except Exception as e:
+                structlogger.warning("Unreadable LLM cache entry, dropped", detail=str(e))
+                self._connection.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._connection.commit()
+                self.misses += 1
+                return None
+
+            self._connection.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, key))
+            self._connection.commit()
+            self._remember(key, row[1], response)
+            self.hits += 1
+            return response
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        key = cache_key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, response, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, dumps(return_val), now, now))
+            if self.ttl_seconds is not None:
+                self._connection.execute("DELETE FROM llm_cache WHERE created < ?", (now - self.ttl_seconds,))
+            # size eviction, least recently used rows first
+            self._connection.execute(
+                "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,))
+            self._connection.commit()
+            self._remember(key, now, return_val)
+
+    def evict(self, prompt: str, llm_string: str) -> None:
+        """Drop the response of a prompt, e.g. one that failed its schema check"""
+        key = cache_key(prompt, llm_string)
+        with self._lock:
+            self._memory.pop(key, None)
+            self._connection.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self._connection.commit()
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._connection.execute("DELETE FROM llm_cache")
+            self._connection.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._connection.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "memory_hits": self.memory_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "memory_entries": len(self._memory),
+                "entries": entries,
+            }
+
+
+def load_llm_cache_config(config_fileloc: str = CONFIG_FILELOC) -> dict:
+    with open(config_fileloc) as file:
+        return yaml.safe_load(file).get('llm_cache', {'enabled': False})
+
+
+def build_llm_cache(config_fileloc: str = CONFIG_FILELOC) -> Optional[LLMResponseCache]:
+    """Response cache configured in config.yaml, None when disabled"""
+    config = load_llm_cache_config(config_fileloc)
+    if not config.get('enabled', False):
+        return None
+
+    structlogger.info("-- LLM response cache", path=config['path'])
+    return LLMResponseCache(path=config['path'],
+                            memory_entries=config.get('memory_entries', 512),
+                            max_entries=config.get('max_entries', 10000),
+                            ttl_seconds=config.get('ttl_seconds', None))
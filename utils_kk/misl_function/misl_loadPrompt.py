@@ -1,27 +1,97 @@
 import yaml
 import os
+import glob
+import threading
 
-def load_prompt(prompt_name: str, filename: str = None) -> str:
 
-    base_dir = os.path.join(os.getcwd(), r"utils_kk/prompts")
-    path = os.path.join(base_dir, filename)
+class PromptRegistry:
+    """Prompt files parsed once, re-parsed only when a file's mtime changes.
+
+    Besides the raw templates, callers can register compiled artefacts
+    (prompt templates, parsers) built from a template; they are rebuilt
+    together with the file they come from.
+    """
+
+    def __init__(self, base_dir: str = None):
+        self.base_dir = base_dir
+        self._lock = threading.Lock()
+        self._files = dict()
+        self._compiled = dict()
+
+    def _path(self, filename: str) -> str:
+        base_dir = self.base_dir or os.path.join(os.getcwd(), r"utils_kk/prompts")
+        return os.path.join(base_dir, filename)
+
+    def preload(self):
+        """Parse every prompt file of the prompt directory"""
+        for path in glob.glob(self._path("*.yml")):
+            self._prompts(os.path.basename(path))
+
+    def _prompts(self, filename: str) -> tuple:
+        path = self._path(filename)
+
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Prompt file not found: {path}")
+
+        mtime = os.stat(path).st_mtime_ns
+        with self._lock:
+            cached = self._files.get(path)
+            if cached is not None and cached[0] == mtime:
+                return path, cached
+
+            with open(path, "r", encoding="utf-8") as f:
+                prompts = yaml.safe_load(f)
+            self._files[path] = (mtime, prompts)
+            return path, self._files[path]
+
+    def template(self, prompt_name: str, filename: str) -> str:
+        path, (_, prompts) = self._prompts(filename)
 
-    if not os.path.exists(path):
-        raise FileNotFoundError(f"Prompt file not found: {path}")
+        if prompt_name not in prompts:
+            raise ValueError(f"Prompt '{prompt_name}' not found in {path}.")
 
-    with open(path, "r", encoding="utf-8") as f:
-        prompts = yaml.safe_load(f)
+        prompt_entry = prompts[prompt_name]
 
-    if prompt_name not in prompts:
-        raise ValueError(f"Prompt '{prompt_name}' not found in {path}.")
+        if "template" not in prompt_entry:
+            raise ValueError(f"Prompt '{prompt_name}' is missing a 'template' field.")
 
-    prompt_entry = prompts[prompt_name]
+        return prompt_entry["template"]
 
-    if "template" not in prompt_entry:
-        raise ValueError(f"Prompt '{prompt_name}' is missing a 'template' field.")
+    def compiled(self, prompt_name: str, filename: str, builder):
+        """Artefact built from a template by `builder`, rebuilt when the prompt file changes
+
+        Args:
+            prompt_name (str): prompt entry in the file
+            filename (str): prompt file name
+            builder (callable): template string -> compiled artefact
+
+        Returns:
+            object: the builder's result for the current file version
+        """
+        path, (mtime, _) = self._prompts(filename)
+        key = (path, prompt_name, getattr(builder, "__qualname__", repr(builder)))
+        cached = self._compiled.get(key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        compiled = builder(self.template(prompt_name, filename))
+        with self._lock:
+            self._compiled[key] = (mtime, compiled)
+        return compiled
+
+    def version(self, filename: str) -> int:
+        """mtime of the parsed prompt file, changes whenever the file is reloaded"""
+        _, (mtime, _) = self._prompts(filename)
+        return mtime
+
+
+prompt_registry = PromptRegistry()
+
+
+def load_prompt(prompt_name: str, filename: str = None) -> str:
 
-    return prompt_entry["template"]
+    return prompt_registry.template(prompt_name, filename)
 
 if __name__ == "__main__":
-    print(load_prompt(prompt_name="intent_classification_template", 
-                filename="prompts_intentClassification.yml"))
\ No newline at end of file
+    print(load_prompt(prompt_name="intent_classification_template",
+                filename="prompts_intentClassification.yml"))
@@ -0,0 +1,317 @@
+import os
+import sys
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, project_root)
+
+import argparse
+import glob
+import hashlib
+import json
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from functools import lru_cache
+import pandas as pd
+import yaml
+import structlog
+from utils_kk.misl_function.misl_getData import get_router_index, list_source_files, DATA_DIR, CONFIG_FILELOC
+from utils_kk.misl_function.misl_dataStore import current_version, dataset_source_files
+from utils_kk.tool_functions.router_index import RouterTimeIndex
+from utils_kk.tool_functions.aggregation_plan import get_aggregation_plan
+from utils_kk.tool_functions.comparison_engine import WindowComparisonEngine
+from utils_kk.tool_functions.data_transformer import CONFIG_FILE, FORMAT, RDK_RENAME_MAP, load_RDK_parameters
+
+structlogger = structlog.get_logger(__name__)
+
+MANIFEST_FILE = "_manifest.json"
+# bump when the feature computation changes in a way feature_inputs cannot see
+FEATURES_VERSION = 1
+
+
+def load_reboot_feature_config(config_fileloc: str = CONFIG_FILELOC) -> dict:
+    with open(config_fileloc) as file:
+        return yaml.safe_load(file)['reboot_features']
+
+
+def shard_of(serial_number: str, num_shards: int) -> int:
+    """Stable shard id of a router, identical across processes and runs"""
+    return zlib.crc32(str(serial_number).encode()) % num_shards
+
+
+@lru_cache(maxsize=None)
+def _configured_table_dir() -> str:
+    return load_reboot_feature_config()['directory']
+
+
+def feature_table_dir(base_dir: str = None) -> str:
+    """Feature table directory; its manifest records which source files each part was computed from"""
+    return base_dir or _configured_table_dir()
+
+
+def part_path(table_dir: str, shard_id: int) -> str:
+    return os.path.join(table_dir, f"part-{shard_id:05d}.parquet")
+
+
+def feature_inputs() -> str:
+    """Fingerprint of the configuration the features depend on, besides the source rows
+
+    Only the RDK parameter list, the rename map and the transformation config
+    count: an edit elsewhere in config.yaml keeps the table.
+    """
+    with open(CONFIG_FILE, "rb") as file:
+        transformation_config = hashlib.sha256(file.read()).hexdigest()
+    payload = {"features_version": FEATURES_VERSION, "rdk_parameters": load_RDK_parameters(CONFIG_FILELOC),
+               "rename_map": RDK_RENAME_MAP, "transformation_config": transformation_config}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def read_manifest(table_dir: str):
+    """Manifest of a feature table, None when the table has not been started"""
+    manifest_path = os.path.join(table_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as file:
+        return json.load(file)
+
+
+def write_manifest(table_dir: str, manifest: dict):
+    manifest_path = os.path.join(table_dir, MANIFEST_FILE)
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(manifest, file)
+    os.replace(tmp_path, manifest_path)
+
+
+def file_shards(file_name: str, num_shards: int, data_dir: str = DATA_DIR) -> list:
+    """Shards of the routers with rows in one source file, read from its serialnumber column only"""
+    serials = pd.read_parquet(os.path.join(data_dir, file_name), columns=['serialnumber'])['serialnumber'].unique()
+    return sorted({shard_of(serial_number, num_shards) for serial_number in serials})
+
+
+def diff_sources(manifest: dict, files: dict) -> tuple:
+    """Shards whose parts do not reflect `files`, and the shards of every file in `files`
+
+    A part is stale when one of its routers has rows in a source file that was
+    added, rewritten or removed since the manifest was written.
+
+    Args:
+        manifest (dict): feature table manifest
+        files (dict): source files as returned by list_source_files
+
+    Returns:
+        tuple: (set of stale shard ids, dict of file name -> shard ids)
+    """
+    known, known_shards = manifest['files'], manifest['file_shards']
+    stale, shards = set(), dict()
+    for file_name, stat in files.items():
+        if known.get(file_name, None) == list(stat):
+            shards[file_name] = known_shards[file_name]
+            continue
+        shards[file_name] = file_shards(file_name, manifest['num_shards'])
+        stale.update(shards[file_name])
+    for file_name, stat in known.items():
+        if files.get(file_name, None) is None or list(files[file_name]) != stat:
+            stale.update(known_shards[file_name])
+    return stale, shards
+
+
+def enumerate_reboot_events(router_index: RouterTimeIndex) -> pd.DataFrame:
+    """All hardware reboot events of the fleet as (serialnumber, timestamp) rows"""
+    data = router_index.data
+    events = data.loc[data['hardware_reboot'] == 1, ['serialnumber', 'time']]
+    # plain strings, a categorical serialnumber would group over every fleet serial
+    events = events.assign(serialnumber=events['serialnumber'].astype(object),
+                           timestamp=events['time'].dt.strftime(FORMAT))
+    return events[['serialnumber', 'timestamp']].drop_duplicates().reset_index(drop=True)
+
+
+def materialize_shard(shard_id: int, router_rows: pd.DataFrame, events: pd.DataFrame, table_dir: str) -> dict:
+    """Compute the comparison features of every reboot event in one shard
+
+    Args:
+        shard_id (int): shard being materialized
+        router_rows (pd.DataFrame): rows of every router in the shard
+        events (pd.DataFrame): serialnumber, timestamp of the shard's reboot events
+        table_dir (str): feature table directory
+
+    Returns:
+        dict: shard id with number of written and failed events
+    """
+    plan = get_aggregation_plan(CONFIG_FILE)
+    router_index = RouterTimeIndex(router_rows)
+    frames = []
+    failed = 0
+
+    for serial_number, serial_events in events.groupby('serialnumber', sort=False):
+        # one engine per router, its prefix sums serve every reboot of that router
+        engine = WindowComparisonEngine(router_index.router(serial_number), plan)
+        for timestamp in serial_events['timestamp']:
+            try:
+                final_data = engine.compare(pd.Timestamp(timestamp).to_pydatetime())
+            except Exception as e:
+                structlogger.error("Reboot feature computation failed", serialnumber=serial_number,
+                                   timestamp=timestamp, detail=str(e))
+                failed += 1
+                continue
+            # values mix numbers, strings and flags; stored as text like the tool renders them
+            final_data = final_data.astype(str)
+            final_data.insert(0, 'reboot_timestamp', timestamp)
+            final_data.insert(0, 'serialnumber', serial_number)
+            frames.append(final_data)
+
+    path = part_path(table_dir, shard_id)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    table = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['serialnumber', 'reboot_timestamp', 'Variable'])
+    table.to_parquet(tmp_path, index=False)
+    # the part file only appears once complete, so an interrupted run resumes at this shard
+    os.replace(tmp_path, path)
+    return {"shard_id": shard_id, "events": len(events) - failed, "failed": failed}
+
+
+def materialize_reboot_features(max_workers: int = None, num_shards: int = None, base_dir: str = None) -> str:
+    """Pre-compute RCA comparison features for every hardware reboot of the fleet
+
+    Routers are sharded by serial number; each shard is computed in a worker
+    process and written as its own parquet part file. The manifest records the
+    source files the parts were computed from and the shards of each file, so
+    after a new data drop only the shards of the routers in the new or changed
+    files are recomputed. Shards whose part file already exists are skipped,
+    so an interrupted run can simply be restarted.
+
+    Args:
+        max_workers (int, optional): worker processes, defaults to the CPU count
+        num_shards (int, optional): number of shards, defaults to config.yaml
+        base_dir (str, optional): feature table root directory, defaults to config.yaml
+
+    Returns:
+        str: feature table directory
+    """
+    config = load_reboot_feature_config()
+    table_dir = feature_table_dir(base_dir)
+    os.makedirs(table_dir, exist_ok=True)
+
+    inputs = feature_inputs()
+    # listed before reading, like the dataset store: a file landing in between is picked up by the next run
+    files = list_source_files()
+    manifest = read_manifest(table_dir)
+    if manifest is None or manifest.get('inputs', None) != inputs:
+        # first run or changed feature configuration: every part is recomputed
+        for path in glob.glob(os.path.join(table_dir, "part-*.parquet")):
+            os.remove(path)
+        manifest = {"num_shards": num_shards or config['num_shards'], "inputs": inputs, "files": {}, "file_shards": {}}
+    # resuming or updating: the shard layout of the first run wins
+    num_shards = manifest['num_shards']
+
+    stale, shards = diff_sources(manifest, files)
+    for shard_id in stale:
+        if os.path.exists(part_path(table_dir, shard_id)):
+            os.remove(part_path(table_dir, shard_id))
+    # the manifest describes the target files; a missing part is pending until its shard is written
+    write_manifest(table_dir, {"num_shards": num_shards, "inputs": inputs,
+                               "files": {file_name: list(stat) for file_name, stat in files.items()},
+                               "file_shards": shards})
+
+    router_index = get_router_index()
+    events = enumerate_reboot_events(router_index)
+    events['shard_id'] = events['serialnumber'].map(lambda serial_number: shard_of(serial_number, num_shards))
+    shard_events = dict(tuple(events.groupby('shard_id')))
+
+    pending = [shard_id for shard_id in sorted(shard_events) if not os.path.exists(part_path(table_dir, shard_id))]
+    total_events = sum(len(shard_events[shard_id]) for shard_id in pending)
+    structlogger.info("-- Reboot feature materialization", table_dir=table_dir, shards=len(pending),
+                      stale_shards=len(stale), skipped_shards=len(shard_events) - len(pending), events=total_events)
+
+    def shard_rows(shard_id):
+        serials = shard_events[shard_id]['serialnumber'].unique()
+        return pd.concat([router_index.router(serial_number) for serial_number in serials], ignore_index=True)
+
+    started = time.monotonic()
+    done_events = 0
+    max_workers = max_workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        queue = iter(pending)
+        running = set()
+        while True:
+            # bounded submission keeps only a few shards' rows pickled in flight
+            for shard_id in queue:
+                running.add(executor.submit(materialize_shard, shard_id, shard_rows(shard_id),
+                                            shard_events[shard_id][['serialnumber', 'timestamp']], table_dir))
+                if len(running) >= 2 * max_workers:
+                    break
+            if not running:
+                break
+
+            finished, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                result = future.result()
+                done_events += result["events"] + result["failed"]
+                elapsed = time.monotonic() - started
+                rate = done_events / elapsed if elapsed else 0
+                structlogger.info("-- Shard materialized", **result,
+                                  progress=f"{done_events}/{total_events}",
+                                  eta_seconds=round((total_events - done_events) / rate) if rate else None)
+
+    return table_dir
+
+
+@lru_cache(maxsize=8)
+def usable_shards(dataset_version: str, table_dir: str, manifest_stamp: tuple):
+    """(number of shards, stale shards) of the feature table for a dataset version
+
+    Resolved once per dataset version and manifest: a materialization run
+    rewrites the manifest, and its stamp (inode and mtime) then keys a fresh
+    resolution. Parts of shards with rows in source files the table and the
+    dataset disagree on are not served. None when the table does not match the
+    current feature configuration or the dataset's source files are unknown.
+    """
+    manifest = read_manifest(table_dir)
+    files = dataset_source_files(dataset_version)
+    if manifest is None or files is None or manifest.get('inputs', None) != feature_inputs():
+        return None
+    stale, _ = diff_sources(manifest, files)
+    structlogger.info("-- Reboot feature table resolved", table_dir=table_dir, dataset_version=dataset_version,
+                      stale_shards=len(stale))
+    return manifest['num_shards'], frozenset(stale)
+
+
+def load_reboot_features(serial_number: str, timestamp: str, dataset_version: str = None, base_dir: str = None):
+    """Materialized comparison table of one reboot event, None when not materialized
+
+    Args:
+        serial_number (str): serial number of the router
+        timestamp (str): reboot timestamp in FORMAT
+        dataset_version (str, optional): dataset the answer is for, defaults to the current version
+
+    Returns:
+        pd.DataFrame | None: comparison table as returned by extract_comparison_data
+    """
+    table_dir = feature_table_dir(base_dir)
+    try:
+        stat = os.stat(os.path.join(table_dir, MANIFEST_FILE))
+    except FileNotFoundError:
+        return None
+    table = usable_shards(dataset_version or current_version(), table_dir, (stat.st_ino, stat.st_mtime_ns))
+    if table is None:
+        return None
+
+    num_shards, stale = table
+    shard_id = shard_of(serial_number, num_shards)
+    if shard_id in stale:
+        return None
+    try:
+        table = pd.read_parquet(part_path(table_dir, shard_id), filters=[('serialnumber', '==', serial_number),
+                                                                         ('reboot_timestamp', '==', timestamp)])
+    except FileNotFoundError:
+        # shard without reboot events, or not materialized yet
+        return None
+    if table.empty:
+        return None
+    return table.drop(columns=['serialnumber', 'reboot_timestamp']).reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Materialize RCA features for every fleet reboot event")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes")
+    parser.add_argument("--shards", type=int, default=None, help="number of serial-number shards")
+    args = parser.parse_args()
+    print(materialize_reboot_features(max_workers=args.workers, num_shards=args.shards))
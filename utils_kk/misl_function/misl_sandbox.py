@@ -0,0 +1,383 @@
+import os
+import ast
+import time
+import uuid
+import zlib
+import atexit
+import hashlib
+import weakref
+import threading
+import multiprocessing
+from io import StringIO
+from collections import OrderedDict
+from contextlib import redirect_stdout
+from typing import Any, Optional, Type
+import yaml
+import structlog
+import pyarrow as pa
+from pydantic import BaseModel, ConfigDict, Field
+from langchain_core.tools import BaseTool
+from langchain_experimental.tools.python.tool import PythonInputs, sanitize_input
+
+try:
+    import resource
+except ImportError:  # not a POSIX platform, the agents keep their in-process REPL
+    resource = None
+
+structlogger = structlog.get_logger(__name__)
+
+CONFIG_FILELOC = 'config/config.yaml'
+# REPL sessions and attached frames a worker keeps, least recently used dropped first
+WORKER_SESSIONS = 64
+WORKER_FRAMES = 8
+
+
+class SandboxLimitExceeded(Exception):
+    pass
+
+
+def _raise_cpu_limit(signum, frame):
+    raise SandboxLimitExceeded("the code used more CPU time than allowed and was stopped")
+
+
+def _cpu_seconds_used() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _virtual_memory_bytes() -> int:
+    with open('/proc/self/statm') as file:
+        return int(file.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def _run_code(code: str, namespace: dict) -> str:
+    """Same semantics as PythonAstREPLTool: run every statement, return the value of the last expression or stdout"""
+    tree = ast.parse(code)
+    io_buffer = StringIO()
+    with redirect_stdout(io_buffer):
+        exec(ast.unparse(ast.Module(tree.body[:-1], type_ignores=[])), namespace)
+        last = ast.unparse(ast.Module(tree.body[-1:], type_ignores=[]))
+        try:
+            value = eval(last, namespace)
+        except SyntaxError:
+            # the last statement is not an expression
+            exec(last, namespace)
+            value = None
+    return io_buffer.getvalue() if value is None else str(value)
+
+
+def _worker_main(conn, cpu_seconds: float, memory_mb: int):
+    """Worker loop: attach frames from their Arrow files and run code in per-session namespaces
+
+    Every request is (session, frame path, code); the reply is ("ok", output) or
+    ("error", message). None stops the worker.
+    """
+    import signal
+
+    if resource is not None:
+        signal.signal(signal.SIGXCPU, _raise_cpu_limit)
+        if memory_mb:
+            # on top of what the interpreter and its libraries already reserve
+            limit = _virtual_memory_bytes() + memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, resource.getrlimit(resource.RLIMIT_AS)[1]))
+
+    frames, sessions = OrderedDict(), OrderedDict()
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+        session, frame_path, code = request
+
+        try:
+            if session not in sessions:
+                if frame_path not in frames:
+                    # the memory-mapped table is shared by the worker's sessions; only to_pandas copies
+                    frames[frame_path] = pa.ipc.open_file(pa.memory_map(frame_path)).read_all()
+                    while len(frames) > WORKER_FRAMES:
+                        frames.popitem(last=False)
+                frames.move_to_end(frame_path)
+                sessions[session] = {"df": frames[frame_path].to_pandas()}
+                while len(sessions) > WORKER_SESSIONS:
+                    sessions.popitem(last=False)
+            sessions.move_to_end(session)
+
+            if resource is not None and cpu_seconds:
+                hard = resource.getrlimit(resource.RLIMIT_CPU)[1]
+                resource.setrlimit(resource.RLIMIT_CPU, (int(_cpu_seconds_used() + cpu_seconds) + 1, hard))
+            try:
+                reply = ("ok", _run_code(code, sessions[session]))
+            finally:
+                if resource is not None and cpu_seconds:
+                    resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+
+        except MemoryError:
+            reply = ("error", f"MemoryError: the code needed more than the {memory_mb} MB allowed; "
+                              f"work on fewer rows or columns")
+        except Exception as e:
+            reply = ("error", "{}: {}".format(type(e).__name__, str(e)))
+        conn.send(reply)
+
+
+class _Worker:
+    def __init__(self, context, cpu_seconds: float, memory_mb: int):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, cpu_seconds, memory_mb), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def stop(self, timeout: float = 1.0):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class SandboxPool:
+    """Worker processes that run the agents' Python tool calls.
+
+    The data reaches a worker as an Arrow IPC file it memory-maps, never
+    through the pipe. A session sticks to the worker that ran its first call,
+    where its variables live between calls. Each call is bounded by a CPU-time
+    limit (RLIMIT_CPU), an address-space limit (RLIMIT_AS) and a wall-clock
+    timeout after which the worker is killed and replaced; all three come back
+    to the agent as an error message.
+    """
+
+    def __init__(self, directory: str, workers: int = 4, cpu_seconds: float = 30, memory_mb: int = 2048,
+                 timeout_seconds: float = 60, max_frames: int = 64):
+        self.directory = directory
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.timeout_seconds = timeout_seconds
+        self.max_frames = max_frames
+        os.makedirs(directory, exist_ok=True)
+
+        # workers are forked from a clean server process rather than from the serving process and its
+        # threads; replacing a killed worker is then a fork, not a fresh interpreter start
+        self._context = multiprocessing.get_context("forkserver")
+        self._context.set_forkserver_preload([__name__])
+        self._lock = threading.Lock()
+        self._workers = [_Worker(self._context, cpu_seconds, memory_mb) for _ in range(workers)]
+        # one call at a time per worker slot; the slot keeps its lock when its worker is replaced
+        self._slot_locks = [threading.Lock() for _ in range(workers)]
+        self._affinity = OrderedDict()
+        # frame file -> number of live holders; held files are never trimmed
+        self._held_frames = dict()
+
+    def publish_frame(self, key, data, holder=None) -> str:
+        """Arrow IPC file of a frame, written once per key
+
+        Args:
+            key: anything identifying the frame's content, e.g. serial number and dataset version
+            data (pd.DataFrame): frame the sessions of this key get as `df`
+            holder (optional): object using the file, e.g. the agent; the file is kept while it is alive
+
+        Returns:
+            str: path of the file
+        """
+        name = hashlib.sha256(repr(key).encode()).hexdigest()[:32]
+        path = os.path.join(self.directory, f"{name}.arrow")
+        if holder is not None:
+            self._hold_frame(path, holder)
+        if os.path.exists(path):
+            try:
+                os.utime(path)
+                return path
+            except OSError:
+                # trimmed in the meantime, written again below
+                pass
+
+        table = pa.Table.from_pandas(data, preserve_index=True)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        # uncompressed, so that workers map the buffers instead of decoding them
+        with pa.OSFile(temp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(temp_path, path)
+        self._trim_frames()
+        return path
+
+    def _hold_frame(self, path: str, holder):
+        with self._lock:
+            self._held_frames[path] = self._held_frames.get(path, 0) + 1
+        weakref.finalize(holder, self._release_frame, path)
+
+    def _release_frame(self, path: str):
+        with self._lock:
+            self._held_frames[path] -= 1
+            if not self._held_frames[path]:
+                del self._held_frames[path]
+
+    def _trim_frames(self):
+        """Remove the least recently published frame files beyond `max_frames`, except held ones"""
+        # workers that mapped a removed file keep reading it until they drop it; a session starting
+        # later needs the file, so the files of live agents stay
+        with self._lock:
+            held = set(self._held_frames)
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith('.arrow')]
+        unheld = []
+        for path in paths:
+            if path in held:
+                continue
+            try:
+                unheld.append((os.path.getmtime(path), path))
+            except OSError:
+                # removed by a concurrent trim
+                continue
+        for _, path in sorted(unheld)[:max(len(paths) - self.max_frames, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _worker_index(self, session: str) -> int:
+        with self._lock:
+            if session not in self._affinity:
+                # least loaded worker, ties broken by the session hash
+                load = [0] * len(self._workers)
+                for index in self._affinity.values():
+                    load[index] += 1
+                start = zlib.crc32(session.encode()) % len(self._workers)
+                self._affinity[session] = min(range(len(self._workers)),
+                                              key=lambda i: (load[i], (i - start) % len(self._workers)))
+                while len(self._affinity) > WORKER_SESSIONS * len(self._workers):
+                    self._affinity.popitem(last=False)
+            self._affinity.move_to_end(session)
+            return self._affinity[session]
+
+    def _replace_worker(self, index: int):
+        """Kill a worker and start a new one; the sessions it held lose their variables"""
+        self._workers[index].process.kill()
+        self._workers[index].stop()
+        self._workers[index] = _Worker(self._context, self.cpu_seconds, self.memory_mb)
+        with self._lock:
+            for session in [session for session, i in self._affinity.items() if i == index]:
+                del self._affinity[session]
+
+    def run(self, session: str, frame_path: str, code: str) -> str:
+        """Run code in a session's namespace and return its output or an error message
+
+        Args:
+            session (str): id of the REPL session, one per agent tool
+            frame_path (str): file from publish_frame, loaded as `df` on the session's first call
+            code (str): Python code written by the agent
+
+        Returns:
+            str: value of the last expression, printed output, or "<ErrorType>: message"
+        """
+        index = self._worker_index(session)
+        with self._slot_locks[index]:
+            worker = self._workers[index]
+            start = time.perf_counter()
+            try:
+                worker.conn.send((session, frame_path, code))
+                if worker.conn.poll(self.timeout_seconds):
+                    status, output = worker.conn.recv()
+                    return output
+            except (EOFError, OSError) as e:
+                structlogger.warning("-- Sandbox worker died", worker=index, error=str(e))
+                self._replace_worker(index)
+                return ("WorkerError: the code crashed the Python worker; "
+                        "variables from earlier calls are lost, `df` has been reloaded")
+
+            structlogger.warning("-- Sandbox call timed out", worker=index,
+                                 seconds=round(time.perf_counter() - start, 2))
+            self._replace_worker(index)
+            return (f"TimeoutError: the code did not finish within {self.timeout_seconds} seconds and was stopped; "
+                    f"variables from earlier calls are lost, `df` has been reloaded. Use a cheaper computation")
+
+    def shutdown(self):
+        for worker in self._workers:
+            worker.stop()
+
+
+class SandboxedPythonTool(BaseTool):
+    """python_repl_ast running in a SandboxPool worker instead of the serving process"""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    name: str = "python_repl_ast"
+    description: str = (
+        "A Python shell. Use this to execute python commands. "
+        "Input should be a valid python command. "
+        "When using this tool, sometimes output is abbreviated - "
+        "make sure it does not look abbreviated before using it in your answer."
+    )
+    args_schema: Type[BaseModel] = PythonInputs
+    pool: Any
+    frame_path: str
+    session: str = ""
+    # key and frame of frame_path, to write the file again when it went missing
+    frame_key: Any = None
+    frame: Any = Field(default=None, repr=False)
+
+    def model_post_init(self, __context: Any) -> None:
+        # one session per tool, i.e. per agent, like the REPL it replaces
+        self.session = self.session or uuid.uuid4().hex
+
+    def _run(self, query: str, run_manager=None) -> str:
+        if self.frame is not None and not os.path.exists(self.frame_path):
+            # trimmed by another process sharing the directory; a new session or worker needs it
+            self.frame_path = self.pool.publish_frame(self.frame_key, self.frame, holder=self)
+        return self.pool.run(self.session, self.frame_path, sanitize_input(query))
+
+
+def load_sandbox_config(config_fileloc: str = CONFIG_FILELOC) -> dict:
+    with open(config_fileloc) as file:
+        return yaml.safe_load(file).get('sandbox', {'enabled': False})
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_sandbox_pool(config_fileloc: str = CONFIG_FILELOC) -> Optional[SandboxPool]:
+    """Process-wide sandbox pool configured in config.yaml, started on first use; None when disabled"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            config = load_sandbox_config(config_fileloc)
+            if not config.get('enabled', False) or resource is None:
+                return None
+            structlogger.info("-- Starting sandbox workers", workers=config.get('workers', 4))
+            _pool = SandboxPool(directory=config['directory'],
+                                workers=config.get('workers', 4),
+                                cpu_seconds=config.get('cpu_seconds', 30),
+                                memory_mb=config.get('memory_mb', 2048),
+                                timeout_seconds=config.get('timeout_seconds', 60),
+                                max_frames=config.get('max_frames', 64))
+            atexit.register(_pool.shutdown)
+        return _pool
+
+
+def sandbox_agent(agent, key, data):
+    """Swap an agent's python_repl_ast for one that runs in the sandbox pool
+
+    Args:
+        agent (AgentExecutor): agent from create_pandas_dataframe_agent
+        key: identity of `data`, the file it is spilled to is reused for the same key
+        data (pd.DataFrame): frame the agent was created with
+
+    Returns:
+        AgentExecutor: the same agent; unchanged when the sandbox is disabled or the frame has no Arrow form
+    """
+    pool = get_sandbox_pool()
+    if pool is None:
+        return agent
+
+    try:
+        frame_path = pool.publish_frame(key, data, holder=agent)
+    except (pa.ArrowException, ValueError, TypeError) as e:
+        structlogger.warning("-- Frame not convertible to Arrow, agent code runs in-process", error=str(e))
+        return agent
+
+    agent.tools = [SandboxedPythonTool(pool=pool, frame_path=frame_path, frame_key=key, frame=data)
+                   if tool.name == "python_repl_ast" else tool for tool in agent.tools]
+    return agent
@@ -5,8 +5,9 @@ sys.path.insert(0, project_root)
 
 from dotenv import load_dotenv
 from utils_kk.variables.variable_definitions import customGraph
-from utils_kk.misl_function.misl_loadPrompt import load_prompt
-from utils_kk.llm_initializations import llm
+from utils_kk.misl_function.misl_loadPrompt import prompt_registry
+from utils_kk.llm_initializations import get_llm
+from utils_kk.misl_function.misl_chatHistory import history_messages
 import structlog
 from langchain.prompts import ChatPromptTemplate
 from langchain.prompts import MessagesPlaceholder
@@ -19,39 +20,50 @@ load_dotenv(override=True)
 #router_data = get_data()
 ## -- 
 
-def chitChat_agent(state: customGraph):
-
-    chit_chat_template = load_prompt(prompt_name="chit_chat_template", 
-                                     filename="prompts_chitChat.yml")
-    
-    prompt = ChatPromptTemplate.from_messages([
+def _chit_chat_prompt(chit_chat_template: str) -> ChatPromptTemplate:
+    return ChatPromptTemplate.from_messages([
         ("system", chit_chat_template),
         MessagesPlaceholder(variable_name="chat_history"),
         MessagesPlaceholder(variable_name="chat_suggestions"),
-        ("ai", f"Serial Number for the customer: {state.get('serialnumber', None)}"),
+        ("ai", "Serial Number for the customer: {serial_number}"),
         ("human", "{question}")
     ])
 
-    # final_prompt = prompt.format({
-    #                                 "question": state.get("question", None), 
-    #                                 "chat_history": state.get("chat_history", [])
-    #                             })
 
-    chain = prompt | llm
+def _chit_chat_inputs(state: customGraph) -> dict:
+    return {
+                "question": state.get("question", None), 
+                "chat_history": history_messages(state, "chit_chat"),
+                "chat_suggestions": state.get("intermediate_result", []),
+                "serial_number": state.get("serialnumber", None)
+            }
 
-    agent_response = chain.invoke({
-                                    "question": state.get("question", None), 
-                                    "chat_history": state.get("chat_history", []),
-                                    "chat_suggestions": state.get("intermediate_result", []),
-                                    "serial_number": state.get("serialnumber", None)
-                                })
 
+def _chit_chat_result(state: customGraph, agent_response) -> dict:
     return {
                 "chat_history": [agent_response],
                 "final_result": agent_response.content,
                 "serialnumber": state.get("serialnumber", None)
             }
 
+
+def chitChat_agent(state: customGraph):
+
+    prompt = prompt_registry.compiled("chit_chat_template", "prompts_chitChat.yml", _chit_chat_prompt)
+    chain = prompt | get_llm()
+
+    agent_response = chain.invoke(_chit_chat_inputs(state))
+    return _chit_chat_result(state, agent_response)
+
+
+async def achitChat_agent(state: customGraph):
+
+    prompt = prompt_registry.compiled("chit_chat_template", "prompts_chitChat.yml", _chit_chat_prompt)
+    chain = prompt | get_llm()
+
+    agent_response = await chain.ainvoke(_chit_chat_inputs(state))
+    return _chit_chat_result(state, agent_response)
+
 if __name__ == "__main__":
 
     initial_state: customGraph = {
@@ -0,0 +1,98 @@
+import os
+import sys
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, project_root)
+
+from dotenv import load_dotenv
+from utils_kk.variables.variable_definitions import customGraph
+from utils_kk.misl_function.misl_loadPrompt import prompt_registry
+from utils_kk.misl_function.misl_chatHistory import CHAT_HISTORY_CONFIG, pending_fold, truncate_message, \
+                                                   truncate_tokens
+from utils_kk.llm_initializations import get_llm
+import structlog
+from langchain_core.prompts.prompt import PromptTemplate
+from langchain_core.messages import RemoveMessage
+from langchain_core.messages.utils import get_buffer_string
+
+structlogger = structlog.get_logger(__name__)
+load_dotenv(override=True)
+
+PROMPT_FILE = "prompts_chatHistory.yml"
+
+
+def _summary_prompt(template: str) -> PromptTemplate:
+    return PromptTemplate.from_template(template)
+
+
+def _summary_request(state: customGraph):
+    """Summary prompt, inputs and messages folding the turns that left the verbatim window, None when nothing is due"""
+    messages = pending_fold(state)
+    if not messages:
+        return None
+    max_tokens = CHAT_HISTORY_CONFIG.get('max_message_tokens', 500)
+    prompt = prompt_registry.compiled("history_summary_prompt", PROMPT_FILE, _summary_prompt)
+    summary_tokens = CHAT_HISTORY_CONFIG.get('summary_tokens', 400)
+    return prompt, {"summary": state.get("history_summary", None) or "(empty)",
+                    "conversation": get_buffer_string([truncate_message(message, max_tokens) for message in messages]),
+                    # about three words per four tokens
+                    "max_words": summary_tokens * 3 // 4}, messages
+
+
+def _summary_result(response, messages: list) -> dict:
+    summary = truncate_tokens(response.content.strip(), CHAT_HISTORY_CONFIG.get('summary_tokens', 400))
+    structlogger.debug("-- Chat history folded", folded_messages=len(messages), detail=summary)
+    # folded messages leave the state, so checkpoints stay the size of the verbatim window
+    return {"history_summary": summary, "chat_history": [RemoveMessage(id=message.id) for message in messages]}
+
+
+def compact_history(state: customGraph):
+    """
+    Fold the turns older than the last keep_turns turns into the rolling summary.
+    Only the previous summary and the newly folded turns go to the llm, so the cost of a turn does not grow
+    with the length of the conversation. On failure the turns stay verbatim and are folded after a later turn.
+    """
+
+    request = _summary_request(state)
+    if request is None:
+        return {}
+    prompt, inputs, messages = request
+    try:
+        response = (prompt | get_llm()).invoke(inputs)
+    except Exception as e:
+        structlogger.error("Exception in compact_history", detail=e)
+        return {}
+    return _summary_result(response, messages)
+
+
+async def acompact_history(state: customGraph):
+
+    request = _summary_request(state)
+    if request is None:
+        return {}
+    prompt, inputs, messages = request
+    try:
+        response = await (prompt | get_llm()).ainvoke(inputs)
+    except Exception as e:
+        structlogger.error("Exception in compact_history", detail=e)
+        return {}
+    return _summary_result(response, messages)
+
+
+def fold_history(flow, config: dict):
+    """
+    compact_history on the latest checkpoint of a thread, written back as a state update.
+    Runs after the turn's answer was returned and before the thread's next turn, so the summary call is never
+    on an answer's critical path. Only the summary and the folded messages change, so the update is consistent
+    with any turn checkpointed after the state was read.
+    """
+
+    update = compact_history(flow.get_state(config).values)
+    if update:
+        flow.update_state(config, update)
+
+
+async def afold_history(flow, config: dict):
+
+    update = await acompact_history((await flow.aget_state(config)).values)
+    if update:
+        await flow.aupdate_state(config, update)
@@ -7,153 +7,351 @@ from dotenv import load_dotenv
 from utils_kk.variables.variable_definitions import customGraph, IntentClassificationResult, \
                                                     SerialNumberOnlyResult, FeatureValidationResult
 
-from utils_kk.misl_function.misl_loadPrompt import load_prompt
-from utils_kk.llm_initializations import llm
+from utils_kk.misl_function.misl_loadPrompt import prompt_registry
+from utils_kk.llm_initializations import get_llm, evict_cached_response
+from langchain_core.exceptions import OutputParserException
 from langchain_core.output_parsers import JsonOutputParser, PydanticOutputParser
 from langchain_core.prompts.prompt import PromptTemplate
 from langchain_core.messages import AIMessage, HumanMessage
-from langchain_core.messages.utils import get_buffer_string
+from utils_kk.misl_function.misl_chatHistory import history_text
+from utils_kk.misl_function.misl_dataStore import resolve_data
+from utils_kk.misl_function.misl_getData import CONFIG_FILELOC
+from utils_kk.tool_functions.serial_matcher import SerialMatcher
+from utils_kk.tool_functions.field_index import get_field_index
 import structlog
 import json
+import asyncio
+import time
+import yaml
 structlogger = structlog.get_logger(__name__)
 load_dotenv(override=True)
 
+PROMPT_FILE = "prompts_intentClassification.yml"
+# format instructions only depend on the result schemas, built once at import
+SERIAL_NUMBER_FORMAT = PydanticOutputParser(pydantic_object = SerialNumberOnlyResult).get_format_instructions()
+FEATURE_VALIDATION_FORMAT = PydanticOutputParser(pydantic_object = FeatureValidationResult).get_format_instructions()
+INTENT_CLASSIFICATION_FORMAT = PydanticOutputParser(pydantic_object = IntentClassificationResult).get_format_instructions()
+json_parser = JsonOutputParser()
 
-def extract_serial_number(state: customGraph):
+with open(CONFIG_FILELOC) as file:
+    FEATURE_INDEX_CONFIG = yaml.safe_load(file).get('feature_index', {'enabled': False})
 
-    serialnumber_extractor_prompt = load_prompt(prompt_name="serialnumber_extractor_prompt", 
-                                                filename="prompts_intentClassification.yml")
 
-    prompt = PromptTemplate(template=serialnumber_extractor_prompt,
-                            partial_variables={
-                                "chat_history": get_buffer_string(state.get("chat_history", [])),
-                                "output_parser": PydanticOutputParser(
-                                    pydantic_object = SerialNumberOnlyResult).get_format_instructions()
-                            })
+def _serial_number_prompt(template: str) -> PromptTemplate:
+    return PromptTemplate(template=template, partial_variables={"output_parser": SERIAL_NUMBER_FORMAT})
 
-    chain = prompt | llm | JsonOutputParser()
-    
+
+def _feature_validation_prompt(template: str) -> PromptTemplate:
+    return PromptTemplate(template=template, partial_variables={"output_parser": FEATURE_VALIDATION_FORMAT})
+
+
+def _intent_classification_prompt(template: str) -> PromptTemplate:
+    return PromptTemplate(template=template, partial_variables={"output_parser": INTENT_CLASSIFICATION_FORMAT})
+
+
+SERIAL_NUMBER_KEYS = ["serial_number"]
+FEATURE_VALIDATION_KEYS = ["matched_columns", "status", "explanation", "suggested_response"]
+INTENT_CLASSIFICATION_KEYS = ["intent", "missing_fields", "suggested_question", "matched_columns", "explanation"]
+
+
+def _backoff_seconds(trial: int) -> float:
+    """Exponential pause before the next retry, `retry_backoff` seconds at first, none after the last trial"""
+    if trial + 1 < int(os.getenv("num_retries", 3)):
+        return float(os.getenv("retry_backoff", 0.5)) * 2 ** trial
+    return 0
+
+
+def _chain(prompt: PromptTemplate):
+    return prompt | get_llm(cached=True) | json_parser
+
+
+def _schema_failed(prompt: PromptTemplate, inputs: dict, response):
+    # the response is in the cache (served from it or just written); dropped so the retry asks the
+    # model again and writes its answer through the cache
+    structlogger.error("Wrong schema recieved", detail=response)
+    evict_cached_response(prompt.invoke(inputs))
+
+
+def _invoke_with_retries(prompt: PromptTemplate, inputs: dict, keys: list):
+    for trial in range(int(os.getenv("num_retries", 3))):
+        try:
+            response = _chain(prompt).invoke(input=inputs)
+        except OutputParserException as e:
+            response = e.llm_output
+        if isinstance(response, dict) and all(k in response for k in keys):
+            return response
+        _schema_failed(prompt, inputs, response)
+        time.sleep(_backoff_seconds(trial))
+
+
+async def _ainvoke_with_retries(prompt: PromptTemplate, inputs: dict, keys: list):
+    for trial in range(int(os.getenv("num_retries", 3))):
+        try:
+            response = await _chain(prompt).ainvoke(input=inputs)
+        except OutputParserException as e:
+            response = e.llm_output
+        if isinstance(response, dict) and all(k in response for k in keys):
+            return response
+        _schema_failed(prompt, inputs, response)
+        await asyncio.sleep(_backoff_seconds(trial))
+
+
+def match_serial_number(state: customGraph):
+    """Serial number of the dataset named in the question or earlier user turns, without the LLM"""
     try:
+        matcher = SerialMatcher.for_index(resolve_data(state))
+    except LookupError:
+        return None
+
+    texts = [state.get("question", None)] + [message.content for message in reversed(state.get("chat_history", []))
+                                             if isinstance(message, HumanMessage)]
+    for text in texts:
+        serial_number = matcher.match(str(text))
+        if serial_number:
+            structlogger.debug("-- Serial number matched locally", detail=serial_number)
+            return serial_number
+    return None
+
 
-        query = state.get("question", None)
-        for trial in range(int(os.getenv("num_retries", None))):
-            response = chain.invoke(input={"user_question": query})
-            if isinstance(response, dict):
-                if "serial_number" in response:
-                    structlogger.debug("-- Serial number extracted", detail=response)
-                    return response["serial_number"]
-            else:
-                structlogger.error("Wrong schema recieved", detail=response)
+def _serial_number_request(state: customGraph) -> tuple:
+    prompt = prompt_registry.compiled("serialnumber_extractor_prompt", PROMPT_FILE, _serial_number_prompt)
+    return prompt, {"user_question": state.get("question", None),
+                    "chat_history": history_text(state, "classification")}
+
+
+def extract_serial_number(state: customGraph):
+
+    try:
+        response = _invoke_with_retries(*_serial_number_request(state), SERIAL_NUMBER_KEYS)
+        if response:
+            structlogger.debug("-- Serial number extracted", detail=response)
+            return response["serial_number"]
+
+    except Exception as e:
+        structlogger.error("Exception in extract_serial_number", detail=e)
+
+
+async def aextract_serial_number(state: customGraph):
+
+    try:
+        response = await _ainvoke_with_retries(*_serial_number_request(state), SERIAL_NUMBER_KEYS)
+        if response:
+            structlogger.debug("-- Serial number extracted", detail=response)
+            return response["serial_number"]
 
     except Exception as e:
         structlogger.error("Exception in extract_serial_number", detail=e)
     
     
+def match_features(state: customGraph):
+    """Feature validation from the field index when the question clearly names dataset columns
+
+    Returns:
+        dict | None: FeatureValidationResult fields, None when the LLM validator should decide
+    """
+    if not FEATURE_INDEX_CONFIG.get('enabled', False):
+        return None
+    try:
+        columns = resolve_data(state).data.columns
+    except LookupError:
+        return None
+
+    field_index = get_field_index()
+    matches = field_index.confident_columns(state.get("question", None), columns,
+                                            threshold=FEATURE_INDEX_CONFIG['confidence_threshold'],
+                                            relative_score=FEATURE_INDEX_CONFIG.get('relative_score', 0.9),
+                                            max_columns=FEATURE_INDEX_CONFIG.get('max_columns', 5))
+    if not matches:
+        return None
+
+    response = {
+        "status": "AVAILABLE",
+        "matched_columns": [column for column, _, _ in matches],
+        "explanation": " ".join(f"{field} (column {column}): {field_index.descriptions[field]}." for column, field, _ in matches),
+        "suggested_response": None
+    }
+    structlogger.debug("-- Feature validation matched locally", detail=response,
+                       scores={field: score for _, field, score in matches})
+    return response
+
+
+def _feature_validation_request(state: customGraph) -> tuple:
+    prompt = prompt_registry.compiled("feature_validation_template", PROMPT_FILE, _feature_validation_prompt)
+    return prompt, {"user_query": state.get("question", None),
+                    "chat_history": history_text(state, "classification")}
+
+
 def feature_validation_extractor(state: customGraph):
     
-    feature_validation_template = load_prompt(prompt_name="feature_validation_template", 
-                                            filename="prompts_intentClassification.yml")
+    try:
+        response = _invoke_with_retries(*_feature_validation_request(state), FEATURE_VALIDATION_KEYS)
+        if response:
+            structlogger.debug("-- Feature validation extracted", detail=response)
+            return response
+
+    except Exception as e:
+        structlogger.error("Exception in feature_validation_extractor", detail=e)
 
-    prompt = PromptTemplate(template=feature_validation_template,
-                            partial_variables={
-                                "chat_history": get_buffer_string(state.get("chat_history", [])),
-                                "output_parser": PydanticOutputParser(
-                                    pydantic_object = FeatureValidationResult).get_format_instructions()
-                            })
 
-    chain = prompt | llm | JsonOutputParser()
+async def afeature_validation_extractor(state: customGraph):
     
     try:
-        query = state.get("question", None)
-        for trial in range(int(os.getenv("num_retries", None))):
-            response = chain.invoke(input={"user_query": query})
-            if isinstance(response, dict):
-                if all(k in response for k in ["matched_columns", "status", "explanation", "suggested_response"]):
-                    structlogger.debug("-- Feature validation extracted", detail=response)
-                    return response
-            else:
-                structlogger.error("Wrong schema recieved", detail=response)
+        response = await _ainvoke_with_retries(*_feature_validation_request(state), FEATURE_VALIDATION_KEYS)
+        if response:
+            structlogger.debug("-- Feature validation extracted", detail=response)
+            return response
 
     except Exception as e:
         structlogger.error("Exception in feature_validation_extractor", detail=e)
 
 
-def predict_intent(state: customGraph, feature_validation_result: FeatureValidationResult):
-    serial_number = state.get("serialnumber", None)
-    query = state.get("question", None)
+def _intent_request(state: customGraph, feature_validation_result: FeatureValidationResult) -> tuple:
+    prompt = prompt_registry.compiled("intent_classification_template", PROMPT_FILE, _intent_classification_prompt)
+    # per-turn values are inputs of the compiled prompt rather than partials baked into a new one
+    return prompt, {
+        "user_query": state.get("question", None),
+        "chat_history": history_text(state, "classification"),
+        "serial_number": state.get("serialnumber", None),
+        "matched_columns": feature_validation_result.get("matched_columns", []),
+        "explanation": feature_validation_result.get("explanation", None)
+    }
 
-    intent_classification_template = load_prompt(prompt_name="intent_classification_template", 
-                                                 filename="prompts_intentClassification.yml")
 
-    matched_columns = feature_validation_result.get("matched_columns", [])
-    explanation = feature_validation_result.get("explanation", None)
+def predict_intent(state: customGraph, feature_validation_result: FeatureValidationResult):
 
-    output_format = PydanticOutputParser(
-        pydantic_object = IntentClassificationResult).get_format_instructions()
+    try:
+        response = _invoke_with_retries(*_intent_request(state, feature_validation_result), INTENT_CLASSIFICATION_KEYS)
+        if response:
+            structlogger.debug("-- Intent classification node", detail=response)
+            return response
+
+    except Exception as e:
+        structlogger.error("Exception in predict_intent", detail=e)
 
-    intent_classification_prompt = PromptTemplate(template=intent_classification_template,
-                                                    partial_variables={
-                                                        "chat_history": get_buffer_string(state.get("chat_history", [])),
-                                                        "output_parser": output_format,
-                                                        "serial_number": serial_number,
-                                                        "matched_columns": matched_columns,
-                                                        "explanation": explanation                                                             
-                                                    })
 
-    chain = intent_classification_prompt | llm | JsonOutputParser()
+async def apredict_intent(state: customGraph, feature_validation_result: FeatureValidationResult):
 
     try:
-        for trial in range(int(os.getenv("num_retries", None))):
-            response = chain.invoke(input={"user_query": query})
-            structlogger.debug("-- Intent classification response schema", detail=str(response.keys()))
-            if isinstance(response, dict):
-                if all(k in response for k in ["intent", "missing_fields", "suggested_question", "matched_columns", "explanation"]):
-                    structlogger.debug("-- Intent classification node", detail=response)
-                    return response
-            else:
-                structlogger.error("Wrong schema recieved", detail=response)
+        response = await _ainvoke_with_retries(*_intent_request(state, feature_validation_result), INTENT_CLASSIFICATION_KEYS)
+        if response:
+            structlogger.debug("-- Intent classification node", detail=response)
+            return response
 
     except Exception as e:
         structlogger.error("Exception in predict_intent", detail=e)
 
 
+def _missing_serial_result(query: str) -> dict:
+    return {
+                "intent_classification": "chit-chat", 
+                "chat_history": [HumanMessage(content=str(query))],
+                "intermediate_result": [AIMessage(content="Respond to the non technical question (if any) and Ask for SerialNumber")],
+            }
+
+
+def _unavailable_result(query: str, serial_number: str) -> dict:
+    return {
+                "intent_classification": "chit-chat", 
+                "chat_history": [HumanMessage(content=str(query))],
+                "intermediate_result": [AIMessage(content="I am not sure, if I have record of this parameter, could you please rephrase your question")],
+                "serialnumber": serial_number
+            }
+
+
+def _intent_result(query: str, serial_number: str, response: dict) -> dict:
+    return {
+                "intent_classification": response["intent"], 
+                "chat_history": [HumanMessage(content=str(query))],
+                "intermediate_result": [AIMessage(content=str(response['suggested_question']))],
+                "serialnumber": serial_number,
+                "matched_columns": response["matched_columns"],
+                "explanation": response.get("explanation", None)
+            }
+
+
 def intent_classification_node(state: customGraph):
 
     query = state.get("question", None)
     serial_number = state.get("serialnumber", None)
+    timings = dict()
+    started = time.perf_counter()
     if not serial_number:
         structlogger.debug("Serial number not found in state")
-        serial_number = extract_serial_number(state)
+        # the LLM extractor only runs when no dataset serial is named in the conversation
+        serial_number = match_serial_number(state) or extract_serial_number(state)
+        timings["serial_number"] = round(time.perf_counter() - started, 3)
 
     ## Case-1 Serialnumber is not present
         if not serial_number:
-            return {
-                        "intent_classification": "chit-chat", 
-                        "chat_history": [HumanMessage(content=str(query))],
-                        "intermediate_result": [AIMessage(content="Respond to the non technical question (if any) and Ask for SerialNumber")],
-                    }
+            return _missing_serial_result(query)
 
     ## Is the question answerable
     structlogger.debug("-- From intent classification node", detail=query)
-    feature_validation_result = feature_validation_extractor(state)
+    stage_started = time.perf_counter()
+    feature_validation_result = match_features(state) or feature_validation_extractor(state)
+    timings["feature_validation"] = round(time.perf_counter() - stage_started, 3)
     if feature_validation_result["status"] == "UNAVAILABLE":
-        return {
-                    "intent_classification": "chit-chat", 
-                    "chat_history": [HumanMessage(content=str(query))],
-                    "intermediate_result": [AIMessage(content="I am not sure, if I have record of this parameter, could you please rephrase your question")],
-                    "serialnumber": serial_number
-                }
+        return _unavailable_result(query, serial_number)
     
     ## Predict Intent
-    response = predict_intent(state, feature_validation_result)
-    return {
-                "intent_classification": response["intent"], 
-                "chat_history": [HumanMessage(content=str(query))],
-                "intermediate_result": [AIMessage(content=str(response['suggested_question']))],
-                "serialnumber": serial_number,
-                "matched_columns": response["matched_columns"],
-                "explanation": response.get("explanation", None)
-            }
+    stage_started = time.perf_counter()
+    response = predict_intent({**state, "serialnumber": serial_number}, feature_validation_result)
+    timings["predict_intent"] = round(time.perf_counter() - stage_started, 3)
+    structlogger.info("-- Intent classification timings", total=round(time.perf_counter() - started, 3), **timings)
+    return _intent_result(query, serial_number, response)
+
+
+async def _timed(timings: dict, stage: str, awaitable):
+    started = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[stage] = round(time.perf_counter() - started, 3)
+
+
+async def _resolve_serial_number(state: customGraph):
+    return match_serial_number(state) or await aextract_serial_number(state)
+
+
+async def _validate_features(state: customGraph):
+    return match_features(state) or await afeature_validation_extractor(state)
+
+
+async def aintent_classification_node(state: customGraph):
+    """Async intent_classification_node: serial number extraction and feature validation
+    do not depend on each other and run concurrently, then the intent is predicted.
+
+    Feature validation is started before the serial number is known, so when
+    no serial number is found its answer is discarded.
+    """
+
+    query = state.get("question", None)
+    serial_number = state.get("serialnumber", None)
+    timings = dict()
+    started = time.perf_counter()
+    structlogger.debug("-- From intent classification node", detail=query)
+
+    if serial_number:
+        feature_validation_result = await _timed(timings, "feature_validation", _validate_features(state))
+    else:
+        structlogger.debug("Serial number not found in state")
+        serial_number, feature_validation_result = await asyncio.gather(
+            _timed(timings, "serial_number", _resolve_serial_number(state)),
+            _timed(timings, "feature_validation", _validate_features(state)))
+        timings["concurrent_stages"] = round(time.perf_counter() - started, 3)
+
+    ## Case-1 Serialnumber is not present
+        if not serial_number:
+            return _missing_serial_result(query)
+
+    if feature_validation_result["status"] == "UNAVAILABLE":
+        return _unavailable_result(query, serial_number)
+
+    ## Predict Intent, with the serial number found above
+    response = await _timed(timings, "predict_intent",
+                            apredict_intent({**state, "serialnumber": serial_number}, feature_validation_result))
+    structlogger.info("-- Intent classification timings", total=round(time.perf_counter() - started, 3), **timings)
+    return _intent_result(query, serial_number, response)
 
 
 if __name__ == "__main__":
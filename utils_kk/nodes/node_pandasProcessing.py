@@ -7,68 +7,115 @@ from dotenv import load_dotenv
 from langchain_experimental.agents import create_pandas_dataframe_agent
 from utils_kk.variables.variable_definitions import customGraph, Verification
 from langchain_core.output_parsers import JsonOutputParser, PydanticOutputParser
-from utils_kk.llm_initializations import llm
+from utils_kk.llm_initializations import get_llm
 import structlog
-from utils_kk.misl_function.misl_getData import get_data
+from utils_kk.misl_function.misl_dataStore import ensure_dataset_loaded, resolve_data
+from utils_kk.tool_functions.data_transformer import with_timestamp_columns
 from langchain_core.messages import AIMessage
 from langchain_core.prompts.prompt import PromptTemplate
 import pandas as pd
-from utils_kk.misl_function.misl_loadPrompt import load_prompt
+import asyncio
+from utils_kk.misl_function.misl_loadPrompt import prompt_registry
+from utils_kk.misl_function.misl_agentPool import AgentPool
+from utils_kk.misl_function.misl_sandbox import sandbox_agent
+from utils_kk.tool_functions.query_templates import match_query_template, run_query_template
+from utils_kk.misl_function.misl_getData import CONFIG_FILELOC
+import yaml
 from langchain_core.messages.utils import get_buffer_string
+from utils_kk.misl_function.misl_chatHistory import history_messages, history_text
 structlogger = structlog.get_logger(__name__)
 load_dotenv(override=True)
 
+PROMPT_FILE = "prompts_pandasAgent.yml"
+VERIFICATION_FORMAT = PydanticOutputParser(pydantic_object = Verification).get_format_instructions()
+
+with open(CONFIG_FILELOC) as file:
+    config = yaml.safe_load(file)
+    AGENT_POOL_CONFIG = config.get('agent_pool', {})
+    QUERY_TEMPLATE_CONFIG = config.get('query_templates', {'enabled': False})
+# warm agents per (serial number, dataset version, prompt version, scoped columns); their REPL survives across turns
+agent_pool = AgentPool(max_agents=AGENT_POOL_CONFIG.get('max_agents', 32))
+# identity and time columns kept next to the matched columns
+SCOPE_KEY_COLUMNS = ['serialnumber', 'time', 'date', 'timestamp']
+
+
+def _pandas_agent_prompt(template: str) -> PromptTemplate:
+    return PromptTemplate.from_template(template)
+
+
+def _verification_prompt(template: str) -> PromptTemplate:
+    return PromptTemplate(template=template, partial_variables={"output_parser": VERIFICATION_FORMAT})
+
 ## TO COMMENT AFTER TESTING
 #router_data = get_data()
 
 
-def pandas_agent_processing(state: customGraph):
-    """
-    This function is a langchain agent that takes in a customGraph object containing user query and router data.
-    It uses the pandas dataframe agent to answer the user query and returns the result along with the intermediate steps.
-    The pandas dataframe agent is configured to use the llm model and allow dangerous code.
-    The agent is also configured to return intermediate steps and use the tool-calling functionality.
-    The tools available to the agent are the get_reboots_data function which retrieves the timestamp of all reboots.
-    The function is called with a RebootsData object containing the serial number of the router and the dataframe of router data.
+def _agent_scope(state: customGraph) -> dict:
+    """Rows and columns the agent works on: the router's rows, its matched columns and the key columns
+
+    Falls back to every column when none of the matched columns is in the data.
     """
+    router_index = resolve_data(state)
+    start, stop = router_index.offsets.get(state.get("serialnumber", None), (0, 0))
+    available = list(dict.fromkeys(list(router_index.data.columns) + ['date', 'timestamp']))
 
+    matched = [column for column in state.get("matched_columns", None) or [] if column in available]
+    if matched:
+        columns = list(dict.fromkeys([column for column in SCOPE_KEY_COLUMNS if column in available] + matched))
+    else:
+        columns = available
+    return {"rows": stop - start, "columns": columns}
 
-    #data = pd.DataFrame.from_records(state.get("data", None))
-    data = pd.DataFrame.from_records(state.get("data"))
-    serial_number = state.get("serialnumber", None)
-    chat_history = state.get("chat_history", [])
-    matched_columns = state.get("matched_columns", None)
-    explanation = state.get("explanation", None)
-
-    pandas_agent_prompt = load_prompt(prompt_name="pandas_agent_prompt", 
-                                      filename="prompts_pandasAgent.yml")
-
-    prompt = PromptTemplate(template=pandas_agent_prompt,
-                            partial_variables={
-                                "onerow": data.iloc[0].to_dict(),
-                                "chat_history": get_buffer_string(chat_history),
-                                "serial_number": serial_number,
-                                "matched_columns": matched_columns,
-                                "explanation": explanation
-                            })
-
-    agent = create_pandas_dataframe_agent(llm, data, verbose=True, 
+
+def _agent_key(state: customGraph, scope: dict) -> tuple:
+    return state.get("serialnumber", None), state.get("dataset_version", None), \
+        prompt_registry.version(PROMPT_FILE), tuple(scope["columns"])
+
+
+def _build_pandas_agent(state: customGraph, scope: dict):
+    """Agent over the scoped router frame; its prefix only holds what is fixed for the agent's key"""
+
+    # zero-copy slice of the router's rows; the column selection copies only those rows
+    data = with_timestamp_columns(resolve_data(state).router(state.get("serialnumber", None)))
+    data = data[scope["columns"]].reset_index(drop=True)
+
+    prompt = prompt_registry.compiled("pandas_agent_prompt", PROMPT_FILE, _pandas_agent_prompt)
+    prefix = prompt.format(onerow=data.iloc[0].to_dict() if len(data) else dict.fromkeys(data.columns),
+                           serial_number=state.get("serialnumber", None))
+
+    agent = create_pandas_dataframe_agent(get_llm(), data, verbose=True, 
     allow_dangerous_code=True, agent_type='tool-calling', 
-    return_intermediate_steps=True, prefix=prompt.format())
+    return_intermediate_steps=True, prefix=prefix)
+
+    # the generated code runs in a sandbox worker over the same frame
+    frame_key = ("pandas", state.get("serialnumber", None), state.get("dataset_version", None), tuple(scope["columns"]))
+    return sandbox_agent(agent, frame_key, data)
+
+
+def _pandas_agent_query(state: customGraph) -> str:
+    """Question of this turn together with its per-turn context"""
 
     if state.get("verification", None) == "INVALID":
         
-        pandas_agent_revisor_prompt = load_prompt(prompt_name="pandas_agent_revisor_prompt", 
-                                                filename="prompts_pandasAgent.yml")
+        pandas_agent_revisor_prompt = prompt_registry.template("pandas_agent_revisor_prompt", PROMPT_FILE)
 
-        query = pandas_agent_revisor_prompt.format(question=state.get("question", None))
+        question = pandas_agent_revisor_prompt.format(question=state.get("question", None))
 
     else:
         
-        query = state.get("question", None)
+        question = state.get("question", None)
+
+    turn_prompt = prompt_registry.compiled("pandas_agent_turn_prompt", PROMPT_FILE, _pandas_agent_prompt)
+    query = turn_prompt.format(matched_columns=state.get("matched_columns", None),
+                               explanation=state.get("explanation", None),
+                               chat_history=history_text(state, "pandas_agent"),
+                               question=question)
+
+    structlogger.debug("-- From pandas node", detail=question)
+    return query
+
 
-    structlogger.debug("-- From pandas node", detail=query)
-    result = agent.invoke(query)
+def _pandas_agent_result(result: dict, scope: dict) -> dict:
 
     intermediate_steps = []
     for action, observation in result.get("intermediate_steps", None):    
@@ -82,31 +129,109 @@ def pandas_agent_processing(state: customGraph):
         "intermediate_result": result.get("output", None), 
         "chat_history": [AIMessage(content=str(result.get("output", None)))],
         "generation_scratchpad": intermediate_steps,
+        "verification": None,
+        "agent_scope": {"rows": scope["rows"], "columns": len(scope["columns"])}
+    }
+
+
+def _query_template_request(state: customGraph):
+    """Answer prompt of a question a query template computes directly, None when it needs the agent
+
+    Returns:
+        tuple | None: (template, prompt, inputs)
+    """
+    # a revision asked for by the validator always goes through the agent
+    if not QUERY_TEMPLATE_CONFIG.get('enabled', False) or state.get("verification", None) == "INVALID":
+        return None
+
+    router_index = resolve_data(state)
+    serial_number = state.get("serialnumber", None)
+    matched = match_query_template(state.get("question", None), state.get("matched_columns", None),
+                                   router_index, serial_number)
+    if matched is None:
+        return None
+
+    template, params, window = matched
+    result = run_query_template(template, params, window, router_index, serial_number)
+    structlogger.info("-- Query template matched", template=template.name, detail=result)
+
+    prompt = prompt_registry.compiled("query_template_answer_prompt", PROMPT_FILE, _pandas_agent_prompt)
+    return template, prompt, {"description": template.description, "result": result,
+                              "question": state.get("question", None)}
+
+
+def _query_template_result(template, inputs: dict, response) -> dict:
+    return {
+        "intermediate_result": response.content,
+        "chat_history": [AIMessage(content=response.content)],
+        "generation_scratchpad": [AIMessage(content=f"Template: {template.name}\nResult: {inputs['result']}"),
+                                  AIMessage(content=response.content)],
         "verification": None
     }
 
 
+def pandas_agent_processing(state: customGraph):
+    """
+    This function is a langchain agent that takes in a customGraph object containing user query and router dataset version.
+    It uses the pandas dataframe agent to answer the user query and returns the result along with the intermediate steps.
+    The pandas dataframe agent is configured to use the llm model and allow dangerous code.
+    The agent is also configured to return intermediate steps and use the tool-calling functionality.
+    The tools available to the agent are the get_reboots_data function which retrieves the timestamp of all reboots.
+    The function is called with a RebootsData object containing the serial number of the router and the dataframe of router data.
+    Questions matching a query template (latest reboot, reboot count, metric statistic) skip the agent: the answer is
+    computed in pandas and the llm only words it.
+    """
+
+    request = _query_template_request(state)
+    if request is not None:
+        template, prompt, inputs = request
+        response = (prompt | get_llm()).invoke(inputs)
+        return _query_template_result(template, inputs, response)
+
+    query = _pandas_agent_query(state)
+    scope = _agent_scope(state)
+    structlogger.info("-- Pandas agent scope", rows=scope["rows"], columns=len(scope["columns"]))
+    with agent_pool.lease(_agent_key(state, scope), lambda: _build_pandas_agent(state, scope)) as agent:
+        result = agent.invoke(query)
+    return _pandas_agent_result(result, scope)
+
+
+async def apandas_agent_processing(state: customGraph):
+    """Async pandas_agent_processing; agent construction runs in a worker thread off the event loop"""
+
+    request = _query_template_request(state)
+    if request is not None:
+        template, prompt, inputs = request
+        response = await (prompt | get_llm()).ainvoke(inputs)
+        return _query_template_result(template, inputs, response)
+
+    query = _pandas_agent_query(state)
+    scope = _agent_scope(state)
+    structlogger.info("-- Pandas agent scope", rows=scope["rows"], columns=len(scope["columns"]))
+    key = _agent_key(state, scope)
+    agent = await asyncio.to_thread(agent_pool.acquire, key, lambda: _build_pandas_agent(state, scope))
+    try:
+        result = await agent.ainvoke(query)
+    finally:
+        agent_pool.release(key, agent)
+    return _pandas_agent_result(result, scope)
+
+
 def validate_pandas_agent(state: customGraph):
     
     question = state.get("question", None)
     intermediate_result = state.get("intermediate_result", None)
 
-    pandas_agent_verification_template = load_prompt(prompt_name="pandas_agent_verification_template", 
-                                                    filename="prompts_pandasAgent.yml")
-
-    output_format = PydanticOutputParser(
-        pydantic_object = Verification).get_format_instructions()
-    verification_prompt = PromptTemplate(template=pandas_agent_verification_template,
-                                         partial_variables={
-        "output_parser": output_format,
-        "chat_history": get_buffer_string(state.get("chat_history", [])[:-1])
-    })
-    chain = verification_prompt | llm | JsonOutputParser()
+    verification_prompt = prompt_registry.compiled("pandas_agent_verification_template", PROMPT_FILE,
+                                                   _verification_prompt)
+    chain = verification_prompt | get_llm() | JsonOutputParser()
+    chat_history = get_buffer_string(history_messages(state, "verification")[:-1])
     
     # try:
-    #     for trial in range(int(os.getenv("num_retries", None))):
+    #     for trial in range(int(os.getenv("num_retries", 3))):
     #         response = chain.invoke(input={
     #             "intermediate_result": intermediate_result,
+    #             "chat_history": chat_history,
     #         })
     #         if isinstance(response, dict):
     #             if "verification" in response:
@@ -135,7 +260,7 @@ def merge_answer(state: customGraph):
 if __name__ == "__main__":
     initial_state: customGraph = {
         "question": "Give me the most recent timestamp of reboots for 90100000000V412000536?",
-        "data": get_data(),
+        "dataset_version": ensure_dataset_loaded(),
         "generation_scratchpad": [],
         "intent_classification": "",
         "bypass_intention": False,
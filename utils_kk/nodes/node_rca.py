@@ -6,13 +6,17 @@ sys.path.insert(0, project_root)
 from dotenv import load_dotenv
 from langchain_experimental.agents import create_pandas_dataframe_agent
 from utils_kk.variables.variable_definitions import customGraph
-from utils_kk.llm_initializations import llm
+from utils_kk.llm_initializations import get_llm
+import asyncio
 import structlog
-from utils_kk.misl_function.misl_getData import get_data
+from utils_kk.misl_function.misl_dataStore import ensure_dataset_loaded, resolve_data
+from utils_kk.misl_function.misl_sandbox import sandbox_agent
 from utils_kk.prompts.prompts_rca import rca_classification_template_3
 from utils_kk.tool_functions.tool_calling_funcs import *
 from langchain.prompts import ChatPromptTemplate
 from langchain.prompts import MessagesPlaceholder
+from langchain_core.messages import AIMessage
+from utils_kk.misl_function.misl_chatHistory import history_text
 
 structlogger = structlog.get_logger(__name__)
 load_dotenv(override=True)
@@ -21,43 +25,50 @@ load_dotenv(override=True)
 #router_data = get_data()
 ## -- 
 
-def rca_agent(state: customGraph):
+def _rca_agent_request(state: customGraph):
+    """RCA agent over the rows of the router in the state"""
+
+    router_index = resolve_data(state)
+    serial_number = state.get("serialnumber", None)
+    data = router_index.router(serial_number)
+    template = rca_classification_template_3.format(serial_number=serial_number,
+                                                   chat_history=history_text(state, "rca"),
+                                                   onerow=data.head(1).to_markdown())
+
+    tools = get_rca_tools(router_index, state.get("dataset_version", None))
 
-    data = state.get("data", None)
-    question = state.get("question", None)
-    baseline_data = get_baseline_statistics("knowledge_folder/datapoints/DE_baseline_router_data/")
-    template = rca_classification_template.format(one_row=data.head[1].to_markdown())
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", template),
-        MessagesPlaceholder(variable_name="agent_scratchpad"),
-        ("human", "{question}")
-    ])
-
-    tools = [
-        Tool(
-            name="get_baseline_statistics",
-            func=get_baseline_statistics,
-            description="Use it when asked for root cause analysis of a hardware reboot *to get baseline statistics* for other routers and compare to current router."
-        ),
-        Tool(
-            name="extract_comparison_data",
-            func=extract_comparison_data,
-            description="Use it when asked for root cause analysis of a hardware reboot *to get aggregated data* from: 1 hour, 6 hours, 24 hours and a month prior to the reboot."
-        )
-    ]
-
-    agent = create_pandas_dataframe_agent(llm = llm, prompt = prompt, tools = tools, verbose=True, 
+    agent = create_pandas_dataframe_agent(get_llm(), data, prefix=template, extra_tools=tools, verbose=True, 
                                           allow_dangerous_code=True, agent_type='tool-calling')
+    # only the python tool moves to the sandbox, the RCA tools are our own code
+    return sandbox_agent(agent, ("rca", serial_number, state.get("dataset_version", None)), data)
+
+
+def _rca_result(agent_response: dict) -> dict:
+    return {
+                "final_result": agent_response.get("output", None),
+                "chat_history": [AIMessage(content=str(agent_response.get("output", None)))]
+            }
+
+
+def rca_agent(state: customGraph):
+
+    agent = _rca_agent_request(state)
+    agent_response = agent.invoke(state.get("question", None))
+    return _rca_result(agent_response)
+
+
+async def arca_agent(state: customGraph):
 
-    agent_response = agent.invoke(question)
+    agent = await asyncio.to_thread(_rca_agent_request, state)
+    agent_response = await agent.ainvoke(state.get("question", None))
+    return _rca_result(agent_response)
 
-    return agent_response
 
 if __name__ == "__main__":
 
     initial_state: customGraph = {
         "question": "What was the root cause of the reboot at 2024-08-02 20:07:00?",
-        "data": get_data(),
+        "dataset_version": ensure_dataset_loaded(),
         "chat_history": [],
         "generation_scratchpad": [],
         "intent_classification": "",
@@ -38,7 +38,7 @@ When asked to perform root cause analysis eg. `What is the root cause for the ha
    - If a metric shows **extremely high deviation in any window**, even if pre-1h or pre-6h are normal, it **must be flagged as anomalous**.  
    - flag cases where the provided slope deviates significantly from the expected or average trend
    - Discuss supporting evidence from other windows if relevant. 
-4. Retrieve other routers baseline statistics from tool `get_baseline_statistics`. flag any data points from the router that fall below baseline data lower_fence or above the upper_fence as potential outliers 
+4. Retrieve the router's percentile ranks within the fleet baseline from tool `get_baseline_statistics`. flag any metric of the router that falls below the lower_fence or above the upper_fence as a potential outlier 
 5. Analyze **all features**, including CPU, memory, GPON, RSSI, WiFi, and channel metrics.  
 6. Apply **channel-specific detection rules** using all metrics and deltas:
    - High utilization, overlapping channels, channel instability, congestion, fixed-channel thermal stress.  
@@ -393,6 +393,11 @@ AVAILABLE TOOL:
 - Requires: serial_number (str) + exact timestamp (str: "YYYY-MM-DD HH:MM:SS")
 - Use when: User asks WHY a reboot happened at specific time
 
+**get_baseline_statistics(serial_number, timestamp, metrics)**
+- Percentile rank of the router's 24h pre-reboot medians within the fleet of comparable routers
+- Without metrics it lists only metrics outside the fleet's 5th-95th percentile
+- Use when: checking whether a pre-reboot value is unusual for the fleet, not just for this router
+
 ---
 
 TASK:
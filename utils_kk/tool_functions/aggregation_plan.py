@@ -0,0 +1,192 @@
+from __future__ import annotations
+import os
+import datetime
+import logging
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+import yaml
+
+FORMAT = '%Y-%m-%d %H:%M:%S'
+# statuses counted as 'Up' by get_condition1_stats / get_condition2_stats / get_condition3_stats
+CONDITION_UP_VALUES = {
+    'conditions_1': ['Connecting', 'Authenticating', 'Connected'],
+    'conditions_2': ['Up'],
+    'conditions_3': ['Enabled'],
+}
+# pandas datetimes are ns; 30 min = 30*60*1e9 ns
+SLOPE_UNIT_NS = 30 * 60 * 1e9
+
+
+class AggregationPlan:
+    """RDK_metrics section of the transformation config compiled into column lists.
+
+    `apply` turns one window of router rows into the feature row returned by
+    get_aggregated_data, using one `agg` for the min/max/avg columns, one `sum`
+    for the count/sum columns, one `quantile` for the IQR columns and array
+    arithmetic for conditions, ratios and slopes.
+    """
+
+    def __init__(self, metrics: dict):
+        self.transfer_as_is = list(metrics['transfer_as_is'])
+        self.count = list(metrics['count'])
+        self.total_sum = list(metrics['total_sum'])
+        self.conditions = [(var, CONDITION_UP_VALUES[group])
+                           for group in ('conditions_1', 'conditions_2', 'conditions_3')
+                           for var in metrics[group]]
+        self.min_max_avg = list(metrics['min_max_avg'])
+        self.min = [(var, f"{var.replace('_min', '')}_min") for var in metrics['min']]
+        self.max = [(var, f"{var.replace('_max', '')}_max") for var in metrics['max']]
+        self.ratios = [(item[0], item[1], f"{item[0]}_perc_max") for item in metrics['perc'].values()] + \
+                      [(item[0], item[1], f"{item[0]}_datarate_max") for item in metrics['data_rate'].values()]
+        self.channels_in_use = list(metrics['channels_in_use'])
+        self.slope = list(metrics['slope'])
+        self.iqr = list(metrics['iqr'])
+
+        self.sum_columns = self.count + self.total_sum
+        self.sum_names = [f"{var}_count" for var in self.count] + [f"{var}_sum" for var in self.total_sum]
+        self.extrema_columns = list(dict.fromkeys(self.min_max_avg + [var for var, _ in self.min] + [var for var, _ in self.max]))
+
+    @property
+    def additive_columns(self) -> list:
+        """Columns whose window features can be served from prefix sums and counts"""
+        return list(dict.fromkeys(self.sum_columns + self.min_max_avg))
+
+    def apply(self, df: pd.DataFrame, additive: dict = None) -> dict:
+        """Compute the aggregated features of one window of router rows
+
+        Args:
+            df (pd.DataFrame): router rows of the window, latest first
+            additive (dict, optional): precomputed `_count`/`_sum`/`_avg` features, skips those reductions
+
+        Returns:
+            dict: feature name -> value, in the order of the transformation config
+        """
+        features = dict()
+        additive = additive or dict()
+
+        # transfer as is
+        first_row = df[self.transfer_as_is].iloc[0] if len(df) else pd.Series(index=self.transfer_as_is, dtype=object)
+        features.update(first_row.to_dict())
+
+        # count and sum
+        if all(name in additive for name in self.sum_names):
+            features.update((name, additive[name]) for name in self.sum_names)
+        else:
+            features.update(zip(self.sum_names, df[self.sum_columns].sum().tolist()))
+
+        # conditions, share of rows whose status maps to 'Up'
+        for var, up_values in self.conditions:
+            features[f"{var}_Up_percentage"] = round(df[var].isin(up_values).mean() * 100, 1) if len(df) else 0
+
+        # min_max_avg, min and max in one reduction
+        averages_given = all(f"{var}_avg" in additive for var in self.min_max_avg)
+        extrema = df[self.extrema_columns].agg(['min', 'max'] if averages_given else ['min', 'max', 'mean'])
+        for var in self.min_max_avg:
+            features[f"{var}_min"] = extrema.at['min', var]
+            features[f"{var}_max"] = extrema.at['max', var]
+            features[f"{var}_avg"] = additive[f"{var}_avg"] if averages_given else extrema.at['mean', var]
+        for var, name in self.min:
+            features[name] = extrema.at['min', var]
+        for var, name in self.max:
+            features[name] = extrema.at['max', var]
+
+        # percentage and data rate
+        numerators = df[[item[0] for item in self.ratios]].to_numpy(dtype=float, na_value=np.nan)
+        denominators = df[[item[1] for item in self.ratios]].to_numpy(dtype=float, na_value=np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratios = pd.DataFrame(numerators / denominators).replace([np.inf, -np.inf], np.nan).max()
+        features.update(zip([item[2] for item in self.ratios], ratios.tolist()))
+
+        # channels in use
+        '''
+        wifi_radio_1_channelsinuse: 2.4GHz
+        For channels 1 through 13, the channel interval is 5 MHz,
+          but the width of each channel is 22 MHz. Therefore,
+          there is overlap between neighboring channels, which can lead to interference and degradation of the network.
+        ===> no overlaps 1-6-11 : 5 channels distance no overlap
+
+        wifi_radio_2_channelsinuse: 5GHz
+        The 5 GHz band has a wider frequency range (about 500+ MHz) and is divided into more channels,
+          as well as providing more non-overlapping channels.
+          The channels in the 5 GHz band are separated by a 20 MHz interval,
+            and each channel is 20 MHz wide. The wider spacing between the channels
+            makes it less likely that there will be interference and allows for more simultaneous connections,
+            making it more suitable for high-speed data transmission.
+        ===> no overlap by definition
+        '''
+        for var in self.channels_in_use:
+            name = var.replace('_channelsinuse', '')
+            channels = df[var]
+            try:
+            # IF it is list of channels else skip ( applies for HR data but not for DE data)
+                channels = channels.str.split(',').explode()
+            except AttributeError as exc:
+                logging.info(f"channel explosion on DE data. results in error {exc}")
+
+            unique_channels = pd.Series(channels.unique())
+            # count unique channels used
+            features[f"{name}_total_channels_used"] = len(unique_channels)
+            # identify if there are overlapping channels
+            # has close channels <5 channel distance?
+            if var == 'wifi_radio_1_channelsinuse':
+                channel_numbers = pd.to_numeric(unique_channels, errors='coerce').fillna(0).sort_values().to_numpy()
+                features[f"{name}_overlapping_channels"] = (np.diff(channel_numbers) < 5).any()
+
+        # least squares slope per 30 minutes, one pass over all slope columns
+        features.update(zip([f"{var}_30min_slope" for var in self.slope], self._slopes(df).tolist()))
+
+        # Prefer IQR over standard deviation when data are skewed or contain outliers
+        quartiles = df[self.iqr].quantile([0.25, 0.75])
+        for var in self.iqr:
+            q1 = quartiles.at[0.25, var]
+            q3 = quartiles.at[0.75, var]
+            features[f"{var}_q1"] = round(q1, 6)
+            features[f"{var}_q3"] = round(q3, 6)
+            features[f"{var}_iqr"] = round(q3 - q1, 6)
+
+        return features
+
+    def _slopes(self, df: pd.DataFrame) -> np.ndarray:
+        time = df['time']
+        x = np.where(time.isna(), np.nan, time.to_numpy(dtype='datetime64[ns]').astype('int64')) / SLOPE_UNIT_NS
+        y = df[self.slope].to_numpy(dtype=float, na_value=np.nan)
+        valid = ~np.isnan(y) & ~np.isnan(x)[:, None]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            n = valid.sum(axis=0)
+            x_mean = np.where(valid, x[:, None], 0).sum(axis=0) / n
+            y_mean = np.where(valid, y, 0).sum(axis=0) / n
+            dx = np.where(valid, x[:, None] - x_mean, 0)
+            dy = np.where(valid, y - y_mean, 0)
+            slopes = (dx * dy).sum(axis=0) / (dx * dx).sum(axis=0)
+        return np.round(slopes, 8)
+
+
+def feature_row(features: dict, time_start: datetime.datetime, time_end: datetime.datetime) -> pd.DataFrame:
+    """One-row frame of window features, as returned by get_aggregated_data"""
+    time_start_str = time_start.strftime(FORMAT)
+    time_end_str = time_end.strftime(FORMAT)
+
+    feature_dict = dict()
+    feature_dict[time_start_str] = dict()
+    feature_dict[time_start_str]['end_timestamp'] = time_end_str
+    feature_dict[time_start_str].update(features)
+
+    final_router_data = pd.DataFrame.from_dict(feature_dict,orient='index')
+    final_router_data = final_router_data.reset_index().rename(columns={'index': 'start_timestamp'})
+    final_router_data['start_time'] = pd.to_datetime(final_router_data['start_timestamp'],format= FORMAT )
+    final_router_data['end_time'] = pd.to_datetime(final_router_data['end_timestamp'],format= FORMAT )
+    return final_router_data
+
+
+@lru_cache(maxsize=8)
+def _compile_aggregation_plan(config_file: str, mtime_ns: int) -> AggregationPlan:
+    with open(config_file) as file:
+        config = yaml.safe_load(file)
+    return AggregationPlan(config['RDK_metrics'])
+
+
+def get_aggregation_plan(config_file: str) -> AggregationPlan:
+    """Compiled plan for a transformation config, recompiled only when the file changes"""
+    return _compile_aggregation_plan(config_file, os.stat(config_file).st_mtime_ns)
@@ -0,0 +1,132 @@
+from __future__ import annotations
+import datetime
+from functools import lru_cache
+from dateutil.relativedelta import relativedelta
+import numpy as np
+import pandas as pd
+from utils_kk.tool_functions.aggregation_plan import AggregationPlan, feature_row
+
+FIELD_DESCRIPTIONS_FILE = 'knowledge_folder/llm_field_descriptions.csv'
+# (hours before the reboot, comparison column, change-to-baseline column)
+DEFAULT_WINDOWS = [
+    (1, 'pre-reboot_hours', 'hour_to_baseline_change'),
+    (6, 'pre-reboot_6_hours', '6hour_to_baseline_change'),
+    (24, 'pre-reboot_1_day', 'day_to_baseline_change'),
+]
+
+
+@lru_cache(maxsize=4)
+def field_descriptions(field_descriptions_file: str = FIELD_DESCRIPTIONS_FILE) -> pd.DataFrame:
+    """Field descriptions file, read once per process; treat the frame as read-only"""
+    return pd.read_csv(field_descriptions_file)
+
+
+@lru_cache(maxsize=4)
+def numeric_fields(field_descriptions_file: str = FIELD_DESCRIPTIONS_FILE) -> frozenset:
+    """Field names documented with dtype 'number' in the field descriptions file"""
+    descriptions = field_descriptions(field_descriptions_file)
+    return frozenset(descriptions[descriptions['dtype']=='number']['Field Name'])
+
+
+class WindowComparisonEngine:
+    """Window aggregates of one router, all served from a single time-sorted slice.
+
+    Prefix sums and counts over the additive metrics are built once, so every
+    window's `_count`, `_sum` and `_avg` features are two array lookups. Window
+    bounds and the previous reboot are binary searches over the time column;
+    the remaining features are computed by the aggregation plan on zero-copy
+    slices of the window.
+    """
+
+    def __init__(self, router_rows: pd.DataFrame, plan: AggregationPlan):
+        if not router_rows['time'].is_monotonic_increasing:
+            router_rows = router_rows.sort_values(by=['time'], kind='stable')
+        self.rows = router_rows
+        self.plan = plan
+        self.times = router_rows['time'].to_numpy(dtype='datetime64[ns]')
+
+        columns = plan.additive_columns
+        values = router_rows[columns].to_numpy(dtype=float, na_value=np.nan)
+        valid = ~np.isnan(values)
+        zeros = np.zeros((1, len(columns)))
+        self.prefix_sum = np.concatenate((zeros, np.cumsum(np.where(valid, values, 0), axis=0)))
+        self.prefix_count = np.concatenate((zeros, np.cumsum(valid, axis=0)))
+        self.column_position = {column: position for position, column in enumerate(columns)}
+        self.integer_columns = {column for column in columns
+                                if pd.api.types.is_integer_dtype(router_rows[column]) or pd.api.types.is_bool_dtype(router_rows[column])}
+
+        reboots = (router_rows['hardware_reboot'] == 1).to_numpy()
+        self.reboot_times = self.times[reboots]
+
+    def bounds(self, time_start: datetime, time_end: datetime) -> tuple:
+        """Row positions [lo, hi) with time_start <= time < time_end"""
+        lo, hi = np.searchsorted(self.times, [np.datetime64(pd.Timestamp(time_start)), np.datetime64(pd.Timestamp(time_end))])
+        return int(lo), int(hi)
+
+    def _additive(self, lo: int, hi: int) -> dict:
+        sums = self.prefix_sum[hi] - self.prefix_sum[lo]
+        counts = self.prefix_count[hi] - self.prefix_count[lo]
+
+        additive = dict()
+        for name, var in zip(self.plan.sum_names, self.plan.sum_columns):
+            total = sums[self.column_position[var]]
+            additive[name] = int(round(total)) if var in self.integer_columns else total
+        for var in self.plan.min_max_avg:
+            position = self.column_position[var]
+            additive[f"{var}_avg"] = sums[position] / counts[position] if counts[position] else np.nan
+        return additive
+
+    def aggregate(self, time_start: datetime, time_end: datetime) -> pd.DataFrame:
+        """Aggregated features of [time_start, time_end), same row as get_aggregated_data"""
+        lo, hi = self.bounds(time_start, time_end)
+        # latest row first, as data_period_retrieval returns it
+        window = self.rows.iloc[lo:hi].iloc[::-1]
+        return feature_row(self.plan.apply(window, additive=self._additive(lo, hi)), time_start, time_end)
+
+    def prereboot(self, time_req: datetime, hours: int) -> pd.DataFrame:
+        """Aggregates of the hours before the reboot, doubled when the window is empty"""
+        past_timestamp = time_req - relativedelta(hours=hours)
+        lo, hi = self.bounds(past_timestamp, time_req)
+        if hi == lo:
+            past_timestamp = time_req - relativedelta(hours=2*hours)
+        df_prereboot = self.aggregate(past_timestamp, time_req)
+        df_prereboot['comparison'] = f'pre-reboot_{hours}_hours' if hours<24 else 'pre-reboot_1_day'
+        return df_prereboot
+
+    def baseline(self, time_req: datetime) -> pd.DataFrame:
+        """Aggregates since the previous hardware reboot, capped at one month"""
+        previous = np.searchsorted(self.reboot_times, np.datetime64(pd.Timestamp(time_req)), side='left') - 1
+        past_timestamp = time_req - relativedelta(months=1)
+        if previous >= 0:
+            last_reboot = pd.Timestamp(self.reboot_times[previous]).to_pydatetime()
+            # if last restart was more than 1 month away then take 1 month as sufficient data for comparison
+            if time_req - last_reboot <= datetime.timedelta(days=30):
+                past_timestamp = last_reboot
+        df_baseline = self.aggregate(past_timestamp, time_req)
+        df_baseline['comparison'] = 'baseline'
+        return df_baseline
+
+    def compare(self, time_req: datetime, windows: list = None) -> pd.DataFrame:
+        """Pre-reboot windows against the baseline, one row per variable
+
+        Args:
+            time_req (datetime): time of the reboot
+            windows (list, optional): (hours, column, change column) tuples, defaults to 1h, 6h and 24h
+
+        Returns:
+            pd.DataFrame: Variable, one column per window, baseline and the change of each window to baseline
+        """
+        windows = windows or DEFAULT_WINDOWS
+        frames = [self.prereboot(time_req, hours) for hours, _, _ in windows] + [self.baseline(time_req)]
+        final_data = pd.concat(frames, axis=0).reset_index(drop=True).T
+        final_data = final_data.rename_axis('Variable').rename(
+            columns=dict(enumerate([column for _, column, _ in windows] + ['baseline']))).reset_index()
+
+        # numeric fields are compared by difference, everything else by inequality
+        is_number = final_data['Variable'].isin(numeric_fields())
+        baseline = final_data['baseline']
+        numeric_baseline = pd.to_numeric(baseline, errors='coerce')
+        for _, column, change in windows:
+            difference = (pd.to_numeric(final_data[column], errors='coerce') - numeric_baseline).astype(object)
+            final_data[change] = difference.where(is_number, final_data[column] != baseline)
+        return final_data
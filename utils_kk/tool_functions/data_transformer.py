@@ -6,27 +6,58 @@ import numpy as np
 import datetime
 from dateutil.relativedelta import relativedelta
 import logging
+import pyarrow.dataset as ds
+from concurrent.futures import ThreadPoolExecutor
 from langchain_core.tools import tool
 from scipy.stats import linregress
+from utils_kk.tool_functions.router_index import RouterTimeIndex
+from utils_kk.tool_functions.aggregation_plan import get_aggregation_plan, feature_row
+from utils_kk.tool_functions.comparison_engine import WindowComparisonEngine, FIELD_DESCRIPTIONS_FILE, field_descriptions
 
 FORMAT= '%Y-%m-%d %H:%M:%S'
 CONFIG_FILE = 'config/transformation_config.yaml'
-
-
-def read_directory_parquet(directory_path:str = "../datapoints/") -> pd.DataFrame:
+RDK_RENAME_MAP = {'is_reboot':'hardware_reboot',
+                  'reboot_firmware_flag':'firmware_reboot',
+                  'ip_interface_1_lastchange_flag': 'ip_interface_1_reboot',
+                  'ethernet_link_1_lastchange_flag': 'ethernet_interface_reboot',
+                  'change_wifi_radio_1_channel': 'wifi_radio_1_channel_change',
+                  'change_wifi_radio_2_channel': 'wifi_radio_2_channel_change',
+                  'min_signalstrength':'signalstrength_min',
+                  'max_signalstrength':'signalstrength_max',
+                  'avg_signalstrength':'signalstrength_avg',
+                  'min_lastdatadownlinkrate':'downlink_rate_min',
+                  'max_lastdatadownlinkrate':'downlink_rate_max',
+                  'avg_lastdatadownlinkrate':'downlink_rate_avg',
+                  'min_lastdatauplinkrate':'uplink_rate_min',
+                  'max_lastdatauplinkrate':'uplink_rate_max',
+                  'avg_lastdatauplinkrate':'uplink_rate_avg',
+                  'memusage':'memory_utilization',
+                  'version':'firmware_version',
+                  'hardwareversion': 'hardware_version'}
+
+
+def read_directory_parquet(directory_path:str = "../datapoints/", columns:list = None, max_workers:int = None) -> pd.DataFrame:
     """Function that reads parquet files from a specified directory
     Args:
         directoryPath: directory location to read files from. 
+        columns: optional subset of columns to read, projected down to the parquet reader.
+        max_workers: read files in parallel threads when > 1, otherwise open the directory as one dataset.
 
     Returns:
         pd.DataFrame : read parquet files as a pandas Dataframe.
     """   
-    router_data = pd.DataFrame()
+    file_names = sorted(glob.glob(directory_path+'*.parquet'))
+    if not file_names:
+        return pd.DataFrame(columns=columns)
+
+    if max_workers and max_workers > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            frames = list(executor.map(lambda file_name: pd.read_parquet(file_name, columns=columns), file_names))
+        # concatenate once instead of growing the frame file by file
+        return pd.concat(frames, axis=0, ignore_index=True)
 
-    for file_name in glob.glob(directory_path+'*.parquet'):
-        x = pd.read_parquet(file_name)
-        router_data = pd.concat([router_data,x],axis=0).reset_index(drop=True)
-    return router_data
+    dataset = ds.dataset(file_names, format='parquet')
+    return dataset.to_table(columns=columns, use_threads=True).to_pandas()
 
 def read_directory_csvs(directory_path:str = "../datapoints/") -> pd.DataFrame:
 
@@ -38,11 +69,23 @@ def read_directory_csvs(directory_path:str = "../datapoints/") -> pd.DataFrame:
         pd.DataFrame : read csv files as a pandas Dataframe.
     """    
 
-    router_data = pd.DataFrame()
-    for file_name in glob.glob(directory_path+'*.csv'):
-        x = pd.read_csv(file_name, low_memory=False)
-        router_data = pd.concat([router_data,x],axis=0).reset_index(drop=True)
-    return router_data
+    frames = [pd.read_csv(file_name, low_memory=False) for file_name in glob.glob(directory_path+'*.csv')]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, axis=0, ignore_index=True)
+
+def load_RDK_parameters(yaml_file_location:str) -> list:
+    """Function to load the router parameter subset from the configuration file
+
+    Args:
+        yaml_file_location (str): directory location string for parameters subset to be used from the router dataset
+
+    Returns:
+        list: column names listed under RDK_parameters
+    """
+    with open(yaml_file_location) as file:
+        var_config = yaml.safe_load(file)
+    return var_config['RDK_parameters']
 
 def select_RDK_parameters(df:pd.DataFrame, yaml_file_location:str) -> pd.DataFrame:
     """Function to select column subset from router dataframe
@@ -55,36 +98,54 @@ def select_RDK_parameters(df:pd.DataFrame, yaml_file_location:str) -> pd.DataFra
         pd.DataFrame: filtered dataframe
     """
     # load configuration variables
-    with open(yaml_file_location) as file:
-        var_config = yaml.safe_load(file)
-
-    router_info_params = var_config['RDK_parameters'] 
+    router_info_params = load_RDK_parameters(yaml_file_location)
     return df[router_info_params]
 
 def rename_RDK_parameters(df:pd.DataFrame):
-    df = df.rename(columns={'is_reboot':'hardware_reboot',
-                            'reboot_firmware_flag':'firmware_reboot',
-                            'ip_interface_1_lastchange_flag': 'ip_interface_1_reboot',
-                            'ethernet_link_1_lastchange_flag': 'ethernet_interface_reboot',
-                            'change_wifi_radio_1_channel': 'wifi_radio_1_channel_change',
-                            'change_wifi_radio_2_channel': 'wifi_radio_2_channel_change',
-                            'min_signalstrength':'signalstrength_min',
-                            'max_signalstrength':'signalstrength_max',
-                            'avg_signalstrength':'signalstrength_avg',
-                            'min_lastdatadownlinkrate':'downlink_rate_min',
-                            'max_lastdatadownlinkrate':'downlink_rate_max',
-                            'avg_lastdatadownlinkrate':'downlink_rate_avg',
-                            'min_lastdatauplinkrate':'uplink_rate_min',
-                            'max_lastdatauplinkrate':'uplink_rate_max',
-                            'avg_lastdatauplinkrate':'uplink_rate_avg',
-                            'memusage':'memory_utilization',
-                            'version':'firmware_version',
-                            'hardwareversion': 'hardware_version'})
+    df = df.rename(columns=RDK_RENAME_MAP)
     df['date'] = df['time'].dt.strftime('%Y-%m-%d')
     df['timestamp'] = df['time'].dt.strftime('%Y-%m-%d %H:%M:%S')
 
     return df
 
+def _per_distinct_value(values:pd.Series, transform, missing) -> np.ndarray:
+    """Apply a vectorized transform to the distinct values only and broadcast back by code
+
+    Telemetry strings repeat heavily, so factorizing once and transforming the few
+    distinct values avoids running string parsing over every row.
+    """
+    codes, uniques = pd.factorize(values)
+    transformed = transform(pd.Series(np.asarray(uniques, dtype=object)))
+    # missing values get code -1, which picks the appended fill value
+    return np.append(transformed.to_numpy(), missing)[codes]
+
+def count_channels_in_use(channels:pd.Series) -> pd.Series:
+    """Number of comma separated channels, 1 when the value is missing, 'NULL' or not a string"""
+    if not (pd.api.types.is_object_dtype(channels) or pd.api.types.is_string_dtype(channels)
+            or isinstance(channels.dtype, pd.CategoricalDtype)):
+        return pd.Series(1, index=channels.index, dtype='int64')
+    counts = _per_distinct_value(channels,
+                                 lambda uniques: uniques.str.count(',').add(1).where(uniques.ne('NULL')).fillna(1),
+                                 missing=1)
+    return pd.Series(counts, index=channels.index, dtype='int64')
+
+def coerce_int(values:pd.Series) -> pd.Series:
+    """Integer column with missing values as 0"""
+    if pd.api.types.is_numeric_dtype(values):
+        return values.fillna(0).astype('int64')
+    integers = _per_distinct_value(values,
+                                   lambda uniques: pd.to_numeric(uniques, errors='coerce').astype('Float64').fillna(0),
+                                   missing=0)
+    return pd.Series(integers, index=values.index).astype('int64')
+
+# derived feature name, vectorized builder, source column
+EXTRA_FEATURES = [
+    ("wifi_radio_1_total_channels_active", count_channels_in_use, "wifi_radio_1_channelsinuse"),
+    ("wifi_radio_2_total_channels_active", count_channels_in_use, "wifi_radio_2_channelsinuse"),
+    # fix telemetry restart variable to be int
+    ("telemetry_restart", coerce_int, "telemetry_restart"),
+]
+
 def generate_extra_features(df:pd.DataFrame)-> pd.DataFrame:
     """Generate Extra features on router timeseries data
 
@@ -95,38 +156,106 @@ def generate_extra_features(df:pd.DataFrame)-> pd.DataFrame:
         pd.DataFrame: Router data metrics + additional features dataframe
     """
 
-    df["wifi_radio_1_total_channels_active"] = df["wifi_radio_1_channelsinuse"].apply(lambda x: len(x.split(',')) if (isinstance(x, str) & (x!='NULL')) else 1)
-    df["wifi_radio_2_total_channels_active"] = df["wifi_radio_2_channelsinuse"].apply(lambda x: len(x.split(',')) if (isinstance(x, str) & (x!='NULL')) else 1)
-    # fix telemetry restart variable to be int
-    df["telemetry_restart"] = df["telemetry_restart"].apply(lambda x: int(0 if x is None else x))
+    for feature_name, builder, source_column in EXTRA_FEATURES:
+        df[feature_name] = builder(df[source_column])
     return df
 
-def data_period_retrieval (df:pd.DataFrame, time_start:datetime, time_end:datetime) ->  pd.DataFrame:
+def with_timestamp_columns(df:pd.DataFrame) -> pd.DataFrame:
+    """Derive the string `date` and `timestamp` columns from `time` when they are not stored
+
+    Args:
+        df (pd.DataFrame): router data, possibly in compact mode
+
+    Returns:
+        pd.DataFrame: router data with date and timestamp columns
+    """
+    if 'date' in df.columns and 'timestamp' in df.columns:
+        return df
+    return df.assign(date=df['time'].dt.strftime('%Y-%m-%d'),
+                     timestamp=df['time'].dt.strftime(FORMAT))
+
+def compact_router_data(df:pd.DataFrame, max_category_ratio:float = 0.5, keep_columns:list = ('time',)) -> tuple:
+    """Shrink the router frame: categorical statuses/identities, lossless numeric downcasts,
+    and no stored `date`/`timestamp` strings (see with_timestamp_columns)
+
+    Args:
+        df (pd.DataFrame): preprocessed router data
+        max_category_ratio (float): object columns with at most this share of distinct values become categoricals
+        keep_columns (list): columns left untouched
+
+    Returns:
+        tuple: compacted dataframe, per column memory report dataframe
+    """
+    bytes_before = df.memory_usage(index=False, deep=True)
+    dtypes_before = df.dtypes.astype(str)
+    df = df.drop(columns=[column for column in ('date', 'timestamp') if column in df.columns])
+
+    compacted = dict()
+    for column in df.columns:
+        values = df[column]
+        if column in keep_columns:
+            continue
+        if pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values):
+            if len(values) and values.nunique(dropna=True) <= max_category_ratio * len(values):
+                compacted[column] = values.astype('category')
+        elif pd.api.types.is_bool_dtype(values):
+            continue
+        elif pd.api.types.is_integer_dtype(values):
+            compacted[column] = pd.to_numeric(values, downcast='integer')
+        elif pd.api.types.is_float_dtype(values) and values.dtype != np.float32:
+            downcast = values.astype(np.float32)
+            # only when every value survives the round trip
+            if np.array_equal(downcast.to_numpy(dtype=np.float64), values.to_numpy(dtype=np.float64), equal_nan=True):
+                compacted[column] = downcast
+    df = df.assign(**compacted)
+
+    bytes_after = df.memory_usage(index=False, deep=True).reindex(bytes_before.index, fill_value=0)
+    report = pd.DataFrame({
+        'dtype_before': dtypes_before,
+        'dtype_after': df.dtypes.astype(str).reindex(bytes_before.index, fill_value='dropped'),
+        'bytes_before': bytes_before,
+        'bytes_after': bytes_after,
+        'bytes_saved': bytes_before - bytes_after,
+    }).sort_values(by='bytes_saved', ascending=False)
+    return df, report
+
+def data_period_retrieval (df:pd.DataFrame | RouterTimeIndex, time_start:datetime, time_end:datetime, serial_number:str = None) ->  pd.DataFrame:
     """Function to filter provided data based on serial number and time period
 
     Args:
-        df (pd.DataFrame): router fields dataset
+        df (pd.DataFrame | RouterTimeIndex): router fields dataset, or its serial/time index
         time_start (datetime): start date
         time_end (datetime): end date
+        serial_number (str, optional): restrict to one router, served as a zero-copy slice when df is indexed
 
     Returns:
         pd.DataFrame: filtered dataframe by time period and serial number
     """
+    if isinstance(df, RouterTimeIndex):
+        if serial_number is not None:
+            return df.window(serial_number, time_start, time_end, ascending=False)
+        df = df.data
+
     mask = (df['time'] >= time_start) & (df['time'] < time_end)
+    if serial_number is not None:
+        mask &= (df['serialnumber'] == serial_number)
     filtered_df = df.loc[mask].copy()
     # sort values on time descending
     return filtered_df.sort_values(by=['time'], ascending=False)
 
-def retrieve_serialnumber (df:pd.DataFrame,serial_number:str) ->  pd.DataFrame:
+def retrieve_serialnumber (df:pd.DataFrame | RouterTimeIndex,serial_number:str) ->  pd.DataFrame:
     """Function to filter provided data based on serial number
 
     Args:
-        df (pd.DataFrame): router fields dataset
+        df (pd.DataFrame | RouterTimeIndex): router fields dataset, or its serial/time index
         serial_number (str): Router serial number to be selected
 
     Returns:
         pd.DataFrame: filtered dataframe by time period and serial number
     """
+    if isinstance(df, RouterTimeIndex):
+        return df.router(serial_number, ascending=False)
+
     mask = (df['serialnumber']==serial_number)
     filtered_df = df.loc[mask].copy()
     # sort values on time descending
@@ -154,9 +283,9 @@ def get_condition1_stats(df:pd.DataFrame, colname:str) -> dict:
                   (df[colname] == 'PendingDisconnect') | (df[colname] == 'Disconnecting') |  (df[colname] == 'Disconnected') 
                   ]
     choices = ['Up', 'Down']
-    df.loc[:,colname] = np.select(conditions, choices, default='Unconfigured')
+    status = pd.Series(np.select(conditions, choices, default='Unconfigured'), index=df.index)
     # count how many times each status appeared in time duration
-    status_count = df[colname].value_counts(normalize=True).mul(100).round(1).to_dict()
+    status_count = status.value_counts(normalize=True).mul(100).round(1).to_dict()
     return status_count
 
 def get_condition2_stats(df:pd.DataFrame, colname:str) -> dict:
@@ -184,9 +313,9 @@ def get_condition2_stats(df:pd.DataFrame, colname:str) -> dict:
                   (df[colname] == 'Dormant')
                   ]
     choices = ['Up', 'Down', 'In error state', 'Waiting']
-    df.loc[:,colname] = np.select(conditions, choices, default='Unknown')
+    status = pd.Series(np.select(conditions, choices, default='Unknown'), index=df.index)
     # count how many times each status appeared in time duration
-    status_count = df[colname].value_counts(normalize=True).mul(100).round(1).to_dict()
+    status_count = status.value_counts(normalize=True).mul(100).round(1).to_dict()
     return status_count
 
 def get_condition3_stats(df:pd.DataFrame, colname:str) -> dict:
@@ -213,9 +342,9 @@ def get_condition3_stats(df:pd.DataFrame, colname:str) -> dict:
         (df[colname]=='Error_Misconfigured') |  (df[colname]=='Error')
     ]
     choices = ['Up', 'Down', 'In error state']
-    df.loc[:,colname] = np.select(conditions, choices, default='Unknown')
+    status = pd.Series(np.select(conditions, choices, default='Unknown'), index=df.index)
     # count how many times each status appeared in time duration
-    status_count = df[colname].value_counts(normalize=True).mul(100).round(1).to_dict()
+    status_count = status.value_counts(normalize=True).mul(100).round(1).to_dict()
     return status_count
 
 def get_aggregated_data(df:pd.DataFrame, time_start:datetime, time_end:datetime) ->  pd.DataFrame:
@@ -229,142 +358,8 @@ def get_aggregated_data(df:pd.DataFrame, time_start:datetime, time_end:datetime)
     Returns:
         pd.DataFrame: Aggregated data dataframe
     """
-    
-    time_start_str = time_start.strftime(FORMAT)
-    time_end_str = time_end.strftime(FORMAT)
-
-    feature_dict = dict()
-    feature_dict[time_start_str] = dict()
-    feature_dict[time_start_str]['end_timestamp'] = time_end_str
-    with open(CONFIG_FILE) as file:
-        config = yaml.safe_load(file)
-
-    ################################
-    ### start feature generation ###
-    ################################
-
-    # transfer as is
-    for var in config['RDK_metrics']['transfer_as_is']:
-        feature_dict[time_start_str][f"{var}"] = df[var].values[0]
-
-    # count 
-    for var in config['RDK_metrics']['count']:
-        feature_dict[time_start_str][f"{var}_count"] = df[var].sum()
-    # sum
-    for var in config['RDK_metrics']['total_sum']:
-        feature_dict[time_start_str][f"{var}_sum"] = df[var].sum()
-
-    # conditions 1
-    for var in config['RDK_metrics']['conditions_1']:
-        perc = get_condition1_stats(df, var)
-        try:
-            feature_dict[time_start_str][f"{var}_Up_percentage"] = perc['Up']
-        except KeyError as exc:
-            feature_dict[time_start_str][f"{var}_Up_percentage"] = 0
-
-    # conditions 2
-    for var in config['RDK_metrics']['conditions_2']:
-        perc = get_condition2_stats(df, var)
-        try:
-            feature_dict[time_start_str][f"{var}_Up_percentage"] = perc['Up']
-        except KeyError as exc:
-            feature_dict[time_start_str][f"{var}_Up_percentage"] = 0
-
-    # conditions 3
-    for var in config['RDK_metrics']['conditions_3']:
-        perc = get_condition3_stats(df, var)
-        try:
-            feature_dict[time_start_str][f"{var}_Up_percentage"] = perc['Up']
-        except KeyError as exc:
-            feature_dict[time_start_str][f"{var}_Up_percentage"] = 0
-
-    # min_max_avg
-    for var in config['RDK_metrics']['min_max_avg']:
-        feature_dict[time_start_str][f"{var}_min"] = df[var].dropna().min()
-        feature_dict[time_start_str][f"{var}_max"] = df[var].dropna().max()
-        feature_dict[time_start_str][f"{var}_avg"] = df[var].dropna().mean()  
-    # min
-    for var in config['RDK_metrics']['min']:
-        name = var.replace('_min', '')
-        feature_dict[time_start_str][f"{name}_min"] = df[var].dropna().min()
-    # max
-    for var in config['RDK_metrics']['max']:
-        name = var.replace('_max', '')
-        feature_dict[time_start_str][f"{name}_max"] = df[var].dropna().max()
-    
-    # percentage
-    for var in config['RDK_metrics']['perc']:
-        item = config['RDK_metrics']['perc'][var]
-        percentage = (df[item[0]]/df[item[1]] )
-        feature_dict[time_start_str][f"{item[0]}_perc_max"] = percentage.replace([np.inf, -np.inf], np.nan).max()
-
-    # data rate 
-    for var in config['RDK_metrics']['data_rate']:
-        item = config['RDK_metrics']['data_rate'][var]
-        data_rate = (df[item[0]]/df[item[1]] )
-        feature_dict[time_start_str][f"{item[0]}_datarate_max"] = data_rate.replace([np.inf, -np.inf], np.nan).max()
-    
-    # channels in use
-    '''
-    wifi_radio_1_channelsinuse: 2.4GHz
-    For channels 1 through 13, the channel interval is 5 MHz,
-      but the width of each channel is 22 MHz. Therefore, 
-      there is overlap between neighboring channels, which can lead to interference and degradation of the network.
-    ===> no overlaps 1-6-11 : 5 channels distance no overlap
-
-    wifi_radio_2_channelsinuse: 5GHz
-    The 5 GHz band has a wider frequency range (about 500+ MHz) and is divided into more channels,
-      as well as providing more non-overlapping channels. 
-      The channels in the 5 GHz band are separated by a 20 MHz interval,
-        and each channel is 20 MHz wide. The wider spacing between the channels 
-        makes it less likely that there will be interference and allows for more simultaneous connections, 
-        making it more suitable for high-speed data transmission.
-    ===> no overlap by definition
-    '''
-    for var in config['RDK_metrics']['channels_in_use']:
-        name = var.replace('_channelsinuse','')
-        channel_df = df.copy()
-        
-        try:
-        # IF it is list of channels else skip ( applies for HR data but not for DE data)
-            channel_df['channels'] = df[var].str.split(',')
-            # Explode X into Rows
-            channel_df = channel_df.explode('channels').reset_index(drop=True)
-        except Exception as exc:
-            logging.info(f"channel explosion on DE data. results in error {exc}")
-        
-        unique_channels = channel_df['channels'].unique()
-        unique_channels = [(lambda x: int(0 if (x is None)|(x=='') else x))(x) for x in unique_channels]
-        # count unique channels used
-        feature_dict[time_start_str][f"{name}_total_channels_used"] = len(unique_channels)
-        # identify if there are overlapping channels
-        # has close channels <5 channel distance?
-        if var == 'wifi_radio_1_channelsinuse':
-            feature_dict[time_start_str][f"{name}_overlapping_channels"] = (np.diff(sorted(list(unique_channels)))<5).any()
-    
-    for var in config['RDK_metrics']['slope']:
-        # df has columns: 'time' (datetime-like) and 'y' (numeric)
-        g = df.dropna(subset=['time', var]).sort_values('time')
-        # pandas datetimes are ns; 30 min = 30*60*1e9 ns
-        x = (g['time'].astype('int64') / (30 * 60 * 1e9)).to_numpy()
-        r = linregress(x, g[var].to_numpy())
-        feature_dict[time_start_str][f"{var}_30min_slope"] = round(r.slope, 8)  
-    
-    # Prefer IQR over standard deviation when data are skewed or contain outliers
-    for var in config['RDK_metrics']['iqr']:
-        s_use = df[var].dropna()
-        q1 = s_use.quantile(0.25)
-        q3 = s_use.quantile(0.75)
-        iqr = q3 - q1
-        feature_dict[time_start_str][f"{name}_q1"] = round(q1,6)
-        feature_dict[time_start_str][f"{name}_q3"] = round(q3,6)
-        feature_dict[time_start_str][f"{name}_iqr"] = round(iqr,6)
-        
-    final_router_data = pd.DataFrame.from_dict(feature_dict,orient='index')
-    final_router_data = final_router_data.reset_index().rename(columns={'index': 'start_timestamp'})
-    final_router_data['start_time'] = pd.to_datetime(final_router_data['start_timestamp'],format= FORMAT )
-    final_router_data['end_time'] = pd.to_datetime(final_router_data['end_timestamp'],format= FORMAT )
-    return final_router_data
+    # RDK_metrics is compiled once per config change
+    return feature_row(get_aggregation_plan(CONFIG_FILE).apply(df), time_start, time_end)
 
 def get_prereboot_data(df: pd.DataFrame,time_req: datetime, hours: int)->pd.DataFrame:
     """Get pre reboot data aggregates
@@ -440,15 +435,6 @@ def get_baseline_data(df: pd.DataFrame,time_req: datetime) -> pd.DataFrame:
     return df
 
 
-def get_baseline_statistics():
-    """"
-        Returns statistical data about the baseline
-    """
-    data_dir = "datapoints/DE_baseline_router_data/"
-    baseline_router_data = read_directory_parquet(data_dir)
-    return baseline_router_data
-
-
 def column_info(field_descriptions_file:str, col_name:str) ->  str:
     """Extract field descriptions for columns of dataframe
 
@@ -459,37 +445,27 @@ def column_info(field_descriptions_file:str, col_name:str) ->  str:
         str: field names and descriptions in markdown
     """
 
-    descriptions = pd.read_csv(field_descriptions_file)
+    descriptions = field_descriptions(field_descriptions_file)
     description = descriptions[descriptions['Field Name']==col_name]['Description']
     return description
 
-def extract_comparison_data(timestamp:str) ->  pd.DataFrame:
+def extract_comparison_data(timestamp:str, router_data:pd.DataFrame | RouterTimeIndex, serial_number:str = None) ->  pd.DataFrame:
         """Extract comparison data from before the reboot
 
         Args:
             timestamp (str): timestamp of reboot
+            router_data (pd.DataFrame | RouterTimeIndex): router data, or its serial/time index
+            serial_number (str, optional): router to analyse
 
         Returns:
             pd.DataFrame: aggregated data
         """
-        global router_data
-        df_h = router_data.copy(deep=True) 
-        # get one hour of data if available
+        if isinstance(router_data, RouterTimeIndex):
+            router_data = router_data.data if serial_number is None else router_data.router(serial_number)
+        elif serial_number is not None:
+            router_data = router_data[router_data['serialnumber'] == serial_number]
+
         time_req = datetime.datetime.strptime(timestamp, FORMAT)
-        df_prereboot_h = get_prereboot_data(df_h,time_req,hours=1)
-        # 6h prior to event 
-        df_prereboot_6h = get_prereboot_data(df_h,time_req,hours=6)
-        # 24h prior to event 
-        df_prereboot_d = get_prereboot_data(df_h,time_req,hours=24)
-        # get baseline data for comparison
-        df = router_data.copy(deep=True) 
-        df = get_baseline_data(df,time_req)
-        final_data = pd.concat([df_prereboot_h,df_prereboot_6h,df_prereboot_d,df],axis=0).reset_index(drop=True).T
-        final_data = final_data.rename_axis('Variable').rename(columns={0: "pre-reboot_hours", 1:"pre-reboot_6_hours",2: "pre-reboot_1_day", 3: "baseline"}).reset_index()
-        descriptions = pd.read_csv(FIELD_DESCRIPTIONS_FILE)
-        numbers = list(descriptions[descriptions['dtype']=='number']['Field Name'])
-        final_data['hour_to_baseline_change'] = final_data.apply(lambda x: (x['pre-reboot_hours']-x['baseline']) if (x['Variable'] in numbers) else (x['pre-reboot_hours']!=x['baseline']), axis=1)
-        final_data['6hour_to_baseline_change'] = final_data.apply(lambda x: (x['pre-reboot_6_hours']-x['baseline']) if (x['Variable'] in numbers) else (x['pre-reboot_6_hours']!=x['baseline']), axis=1)
-        final_data['day_to_baseline_change'] = final_data.apply(lambda x: (x['pre-reboot_1_day']-x['baseline']) if (x['Variable'] in numbers) else (x['pre-reboot_1_day']!=x['baseline']), axis=1)
-        
-        return final_data
+        # 1h, 6h, 24h and baseline windows in one pass over the router's time-sorted rows
+        engine = WindowComparisonEngine(router_data, get_aggregation_plan(CONFIG_FILE))
+        return engine.compare(time_req)
@@ -0,0 +1,133 @@
+from __future__ import annotations
+import os
+import re
+import math
+from collections import Counter
+from functools import lru_cache
+import pandas as pd
+from utils_kk.tool_functions.comparison_engine import FIELD_DESCRIPTIONS_FILE
+
+TOKEN_PATTERN = re.compile(r"[a-z]+|\d+(?:\.\d+)?")
+STOPWORDS = frozenset(['a', 'an', 'the', 'of', 'for', 'to', 'in', 'on', 'at', 'by', 'and', 'or', 'is', 'was', 'are',
+                       'were', 'be', 'what', 'which', 'how', 'many', 'much', 'me', 'my', 'give', 'show', 'tell',
+                       'router', 'please', 'with', 'from', 'did', 'does', 'do', 'this', 'that', 'it', 'its'])
+# feature suffixes added by the aggregation plan, longest first; stripped to find the telemetry column
+AGGREGATION_SUFFIXES = ['_Up_percentage', '_datarate_max', '_perc_max', '_count', '_sum', '_max', '_min', '_avg']
+
+
+def _stem(token: str) -> str:
+    # plural folding only, enough for "bytes"/"byte" or "channels"/"channel"
+    return token[:-1] if len(token) > 3 and token.endswith('s') and not token.endswith('ss') else token
+
+
+def tokenize(text: str) -> list:
+    """Lower-case word and number tokens, field names split on underscores"""
+    return [_stem(token) for token in TOKEN_PATTERN.findall(str(text).lower()) if token not in STOPWORDS]
+
+
+class FieldIndex:
+    """BM25 index over the field descriptions file.
+
+    Each field is one document made of its name, category and description;
+    the field name is counted twice so that a question naming the column
+    outranks one that only shares description words.
+    """
+
+    def __init__(self, descriptions, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        descriptions = descriptions.drop_duplicates(subset=['Field Name'])
+        self.fields = descriptions['Field Name'].tolist()
+        self.descriptions = dict(zip(self.fields, descriptions['Description']))
+
+        documents = [tokenize(name) * 2 + tokenize(category) + tokenize(description)
+                     for name, category, description in descriptions[['Field Name', 'Category', 'Description']].itertuples(index=False)]
+        self.term_frequencies = [Counter(document) for document in documents]
+        self.lengths = [len(document) for document in documents]
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0
+
+        document_frequency = Counter(term for frequencies in self.term_frequencies for term in frequencies)
+        n_documents = len(documents)
+        self.idf = {term: math.log(1 + (n_documents - frequency + 0.5) / (frequency + 0.5))
+                    for term, frequency in document_frequency.items()}
+
+    def search(self, query: str, top_k: int = 10) -> list:
+        """Fields ranked by BM25 score against a question
+
+        Args:
+            query (str): user question
+            top_k (int): number of fields returned
+
+        Returns:
+            list: (field name, score) pairs, best first, zero scores left out
+        """
+        terms = [term for term in set(tokenize(query)) if term in self.idf]
+        scores = []
+        for field, frequencies, length in zip(self.fields, self.term_frequencies, self.lengths):
+            score = 0.0
+            for term in terms:
+                frequency = frequencies.get(term, 0)
+                if frequency:
+                    norm = self.k1 * (1 - self.b + self.b * length / self.average_length)
+                    score += self.idf[term] * frequency * (self.k1 + 1) / (frequency + norm)
+            if score > 0:
+                scores.append((field, round(score, 4)))
+        return sorted(scores, key=lambda item: -item[1])[:top_k]
+
+    def confident_columns(self, query: str, columns, threshold: float, relative_score: float = 0.9, max_columns: int = 5) -> list:
+        """Dataset columns a question unambiguously refers to, empty when the LLM should decide
+
+        A field is accepted when it scores at least `threshold`, is within
+        `relative_score` of the best field and contains every query term the
+        index knows. Any accepted field that does not map to a dataset column,
+        or more than `max_columns` accepted fields, makes the match ambiguous.
+
+        Args:
+            query (str): user question
+            columns: columns of the router dataset
+            threshold (float): minimum BM25 score of the best field
+            relative_score (float): share of the best score a field needs to be included
+            max_columns (int): largest number of columns accepted without the LLM
+
+        Returns:
+            list: (column, field, score) triples, best first
+        """
+        terms = {term for term in tokenize(query) if term in self.idf}
+        ranked = self.search(query, top_k=max_columns + 1)
+        if not terms or not ranked or ranked[0][1] < threshold:
+            return []
+
+        position = {field: i for i, field in enumerate(self.fields)}
+        accepted = [(field, score) for field, score in ranked if score >= relative_score * ranked[0][1]
+                    and terms <= self.term_frequencies[position[field]].keys()]
+        if not accepted or accepted[0][0] != ranked[0][0] or len(accepted) > max_columns:
+            return []
+
+        matches = []
+        for field, score in accepted:
+            column = dataset_column(field, columns)
+            if column is None:
+                return []
+            if column not in [match[0] for match in matches]:
+                matches.append((column, field, score))
+        return matches
+
+
+def dataset_column(field: str, columns) -> str | None:
+    """Telemetry column a described field is computed from, None when it is not in the data"""
+    if field in columns:
+        return field
+    for suffix in AGGREGATION_SUFFIXES:
+        if field.endswith(suffix) and field[:-len(suffix)] in columns:
+            return field[:-len(suffix)]
+    return None
+
+
+@lru_cache(maxsize=4)
+def _build_field_index(field_descriptions_file: str, mtime_ns: int) -> FieldIndex:
+    return FieldIndex(pd.read_csv(field_descriptions_file))
+
+
+def get_field_index(field_descriptions_file: str = FIELD_DESCRIPTIONS_FILE) -> FieldIndex:
+    """Index of a field descriptions file, rebuilt only when the file changes"""
+    return _build_field_index(field_descriptions_file, os.stat(field_descriptions_file).st_mtime_ns)
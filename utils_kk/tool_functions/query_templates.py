@@ -0,0 +1,282 @@
+from __future__ import annotations
+import re
+from abc import ABC, abstractmethod
+import pandas as pd
+from utils_kk.tool_functions.router_index import RouterTimeIndex
+from utils_kk.tool_functions.tool_calling_funcs import get_reboots_data
+
+FORMAT = '%Y-%m-%d %H:%M:%S'
+
+DATE = r"\d{4}-\d{2}-\d{2}(?:[ t]\d{1,2}:\d{2}(?::\d{2})?)?"
+# unit words and abbreviations of relative windows ("last 30 mins", "past 24h", "previous 2 weeks")
+UNITS = {'min': 'minutes', 'mins': 'minutes', 'minute': 'minutes', 'minutes': 'minutes',
+         'h': 'hours', 'hr': 'hours', 'hrs': 'hours', 'hour': 'hours', 'hours': 'hours',
+         'd': 'days', 'day': 'days', 'days': 'days',
+         'w': 'weeks', 'wk': 'weeks', 'wks': 'weeks', 'week': 'weeks', 'weeks': 'weeks',
+         'month': 'months', 'months': 'months'}
+# abbreviations only after a number: "last min" is a statistic, "last 5 min" a window
+RELATIVE_PATTERN = re.compile(r"\b(?:last|past|previous)\s+(?:(\d+)\s*(" + "|".join(sorted(UNITS, key=len, reverse=True)) +
+                              r")|(minute|hour|day|week|month)s?)\b")
+RANGE_PATTERN = re.compile(rf"\b(?:between|from)\s+({DATE})\s+(?:and|to|until)\s+({DATE})")
+SINCE_PATTERN = re.compile(rf"\bsince\s+({DATE})")
+DATE_PATTERN = re.compile(DATE)
+# words that mean the question is about a time span; if none of the patterns above explains them the
+# question goes to the agent
+TIME_HINT_PATTERN = re.compile(r"\b(?:since|between|until|before|after|during|yesterday|today|tonight|ago|morning|"
+                               r"afternoon|evening|night|weekend|minutes?|hours?|hrs?|days?|weeks?|wks?|"
+                               r"months?|years?|"
+                               r"jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec|january|february|march|"
+                               r"april|june|july|august|september|october|november|december)\b|\d{1,2}:\d{2}|"
+                               r"\d{4}-\d{2}-\d{2}|\d+\s*(?:mins?|hrs?|h|d|wks?|w)\b")
+
+REBOOT_PATTERN = re.compile(r"\breboot(?:s|ed|ing)?\b|\brestart(?:s|ed)?\b")
+# kinds of reboot a question can name; the reboot templates only count hardware reboots
+REBOOT_KIND_PATTERN = re.compile(r"\b(?:hard(?:ware)?|soft(?:ware)?|firmware|ethernet|interface|watchdog|kernel|"
+                                 r"panic|power|manual|scheduled|remote|user|crash)\b")
+HARDWARE_KINDS = {'hard', 'hardware'}
+# columns feature validation matches for reboot questions, all answered by the reboot templates
+REBOOT_COLUMNS = frozenset({'hardware_reboot', 'last_reboot_reason_split', 'deviceuptime'})
+LATEST_PATTERN = re.compile(r"\b(?:latest|last|most recent|recent|when)\b")
+COUNT_PATTERN = re.compile(r"\b(?:how many|how often|number of|count|times)\b")
+STAT_PATTERNS = {
+    'max': re.compile(r"\b(?:max|maximum|highest|peak)\b"),
+    # "5 min" is a window, not a statistic
+    'min': re.compile(r"\b(?<!\d\s)(?:min|minimum|lowest)\b"),
+    'mean': re.compile(r"\b(?:avg|average|mean)\b"),
+    'median': re.compile(r"\bmedian\b"),
+}
+# questions a single lookup does not answer: causes, breakdowns, comparisons and other reboot kinds
+EXCLUDED_PATTERN = re.compile(r"\b(?:why|cause|caused|reason|root|explain|per|each|every|daily|hourly|trend|compare|"
+                              r"versus|vs|distribution|firmware|telemetry|interface|ethernet|software|soft|"
+                              r"watchdog|kernel|panic|manual|scheduled|remote)\b")
+# identity and time columns, never the metric of a question
+KEY_COLUMNS = {'serialnumber', 'time', 'date', 'timestamp'}
+
+
+def parse_time_window(text: str, anchor: pd.Timestamp):
+    """Time span a question refers to, relative expressions counted back from `anchor`
+
+    Understands "last/past N minutes|hours|days|weeks|months" (also abbreviated,
+    e.g. "past 24h", "last 2 hrs"), "last day|week|...",
+    "today", "yesterday", "between|from <date> and|to <date>", "since <date>" and
+    "on <date>". Dates are ISO (2024-08-02 or 2024-08-02 14:30); a date without
+    a time covers the whole day.
+
+    Args:
+        text (str): user question
+        anchor (pd.Timestamp): time "now" refers to, the latest telemetry sample
+
+    Returns:
+        tuple | None: (start, end) with end exclusive, None when no expression was recognised
+    """
+    text = text.lower()
+    end = anchor + pd.Timedelta(seconds=1)
+
+    match = RANGE_PATTERN.search(text)
+    if match:
+        start, stop = (_parse_date(value) for value in match.groups())
+        return start[0], stop[1]
+
+    match = SINCE_PATTERN.search(text)
+    if match:
+        return _parse_date(match.group(1))[0], end
+
+    match = RELATIVE_PATTERN.search(text)
+    if match:
+        amount = int(match.group(1)) if match.group(1) else 1
+        return anchor - pd.DateOffset(**{UNITS[match.group(2) or match.group(3)]: amount}), end
+
+    if re.search(r"\btoday\b", text):
+        return anchor.normalize(), end
+    if re.search(r"\byesterday\b", text):
+        return anchor.normalize() - pd.Timedelta(days=1), anchor.normalize()
+
+    dates = DATE_PATTERN.findall(text)
+    if len(dates) == 1 and ':' not in dates[0]:
+        # a single day; a single instant ("the reboot at 20:07") is not a span
+        return _parse_date(dates[0])
+    return None
+
+
+def _parse_date(value: str) -> tuple:
+    """(start, end) of a date (the whole day) or of a date and time (that instant)"""
+    timestamp = pd.Timestamp(value.replace('t', ' '))
+    if ':' in value:
+        return timestamp, timestamp + pd.Timedelta(seconds=1)
+    return timestamp, timestamp + pd.Timedelta(days=1)
+
+
+def _period(window, rows: pd.DataFrame) -> str:
+    if window is not None:
+        return f"{window[0].strftime(FORMAT)} to {window[1].strftime(FORMAT)}"
+    if len(rows):
+        return f"{rows['time'].iloc[0].strftime(FORMAT)} to {rows['time'].iloc[-1].strftime(FORMAT)} (all data)"
+    return "all data"
+
+
+class QueryTemplate(ABC):
+    """A question shape answered by one pandas lookup.
+
+    `match` reads the parameters from the lower-cased question and the
+    matched columns and returns None when the question does not have the
+    shape; `run` computes the facts the answer is written from.
+    """
+
+    name = ""
+    description = ""
+    # matched columns the template answers besides its "column" parameter
+    columns = frozenset()
+
+    @abstractmethod
+    def match(self, question: str, matched_columns: list, numeric_columns: set):
+        """Parameters of the question, None when it does not have this template's shape"""
+
+    @abstractmethod
+    def run(self, router_index: RouterTimeIndex, serial_number: str, rows: pd.DataFrame, window, params: dict) -> dict:
+        """Facts for the answer, computed from the router's rows in the window"""
+
+
+class LatestReboot(QueryTemplate):
+    name = "latest_reboot"
+    description = "Most recent hardware reboot of the router (hardware_reboot == 1)"
+    columns = REBOOT_COLUMNS
+
+    def match(self, question, matched_columns, numeric_columns):
+        if _hardware_reboot(question) and LATEST_PATTERN.search(question) and not COUNT_PATTERN.search(question):
+            return {}
+        return None
+
+    def run(self, router_index, serial_number, rows, window, params):
+        reboots = _reboots(router_index, serial_number, window)
+        return {
+            "serial_number": serial_number,
+            "period": _period(window, rows),
+            "latest_hardware_reboot": reboots['timestamp'].iloc[-1] if len(reboots) else "no hardware reboot recorded",
+            "hardware_reboots_in_period": len(reboots),
+        }
+
+
+class RebootCount(QueryTemplate):
+    name = "reboot_count"
+    description = "Number of hardware reboots of the router (rows with hardware_reboot == 1) in a period"
+    columns = REBOOT_COLUMNS
+
+    def match(self, question, matched_columns, numeric_columns):
+        if _hardware_reboot(question) and COUNT_PATTERN.search(question):
+            return {}
+        return None
+
+    def run(self, router_index, serial_number, rows, window, params):
+        reboots = _reboots(router_index, serial_number, window)
+        return {
+            "serial_number": serial_number,
+            "period": _period(window, rows),
+            "hardware_reboots": len(reboots),
+            "latest_reboot_timestamps": reboots['timestamp'].tolist()[-10:],
+        }
+
+
+class MetricStat(QueryTemplate):
+    name = "metric_stat"
+    description = "Maximum, minimum, average or median of one telemetry column in a period"
+
+    def match(self, question, matched_columns, numeric_columns):
+        stats = _stats(question)
+        columns = [column for column in dict.fromkeys(matched_columns) if column not in KEY_COLUMNS]
+        if len(stats) != 1 or len(columns) != 1 or columns[0] not in numeric_columns or REBOOT_PATTERN.search(question):
+            return None
+        return {"stat": stats[0], "column": columns[0]}
+
+    def run(self, router_index, serial_number, rows, window, params):
+        column, stat = params["column"], params["stat"]
+        values = rows[column].dropna()
+        result = {"serial_number": serial_number, "period": _period(window, rows), "column": column,
+                  "statistic": stat, "samples": len(values)}
+        if not len(values):
+            result["value"] = "no samples in the period"
+            return result
+
+        result["value"] = round(float(getattr(values, stat)()), 3)
+        if stat in ('max', 'min'):
+            position = values.idxmax() if stat == 'max' else values.idxmin()
+            result["at"] = rows.loc[position, 'time'].strftime(FORMAT)
+        return result
+
+
+QUERY_TEMPLATES = [LatestReboot(), RebootCount(), MetricStat()]
+
+
+def _stats(question: str) -> list:
+    return [stat for stat, pattern in STAT_PATTERNS.items() if pattern.search(question)]
+
+
+def _covers(template: QueryTemplate, params: dict, question: str, matched_columns: list) -> bool:
+    """Whether the template answers every part of the question: each matched column and statistic it names
+
+    "when was the last reboot and what was the max cpu" fits the latest-reboot
+    template, but the lookup would drop the max cpu part.
+    """
+    columns = {column for column in matched_columns if column not in KEY_COLUMNS}
+    return columns <= template.columns | {params.get("column", None)} \
+        and set(_stats(question)) <= {params.get("stat", None)}
+
+
+def _hardware_reboot(question: str) -> bool:
+    """Question about reboots that names no reboot kind, or only hardware ones"""
+    return bool(REBOOT_PATTERN.search(question)) and set(REBOOT_KIND_PATTERN.findall(question)) <= HARDWARE_KINDS
+
+
+def _reboots(router_index: RouterTimeIndex, serial_number: str, window) -> pd.DataFrame:
+    reboots = get_reboots_data(router_index, serial_number)
+    if window is not None:
+        times = pd.to_datetime(reboots['timestamp'])
+        reboots = reboots[(times >= window[0]) & (times < window[1])]
+    return reboots
+
+
+def match_query_template(question: str, matched_columns: list, router_index: RouterTimeIndex, serial_number: str):
+    """Template answering a question with one lookup, None when the agent should handle it
+
+    A question is matched only when exactly one template fits it, the template
+    answers every column and statistic the question names, nothing in it asks
+    for a cause, breakdown or comparison, and every time reference in it was
+    understood by parse_time_window.
+
+    Args:
+        question (str): user question
+        matched_columns (list): dataset columns from feature validation
+        router_index (RouterTimeIndex): router data
+        serial_number (str): router of the question
+
+    Returns:
+        tuple | None: (template, params, window)
+    """
+    if serial_number not in router_index or not question:
+        return None
+    question = question.lower()
+    if EXCLUDED_PATTERN.search(question):
+        return None
+
+    data = router_index.data
+    # categorical columns (compact mode) and flags are not metrics
+    numeric_columns = {column for column in data.columns if pd.api.types.is_numeric_dtype(data[column].dtype)
+                       and not pd.api.types.is_bool_dtype(data[column].dtype)}
+    matches = [(template, params) for template in QUERY_TEMPLATES
+               for params in [template.match(question, matched_columns or [], numeric_columns)] if params is not None]
+    if len(matches) != 1 or not _covers(*matches[0], question, matched_columns or []):
+        return None
+
+    rows = router_index.router(serial_number)
+    window = parse_time_window(question, rows['time'].iloc[-1])
+    if window is None and TIME_HINT_PATTERN.search(question):
+        return None
+    return matches[0][0], matches[0][1], window
+
+
+def run_query_template(template: QueryTemplate, params: dict, window, router_index: RouterTimeIndex, serial_number: str) -> dict:
+    """Facts of a matched template for the router, restricted to the window"""
+    if window is None:
+        rows = router_index.router(serial_number)
+    else:
+        rows = router_index.window(serial_number, window[0], window[1])
+    return template.run(router_index, serial_number, rows, window, params)
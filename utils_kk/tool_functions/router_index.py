@@ -0,0 +1,151 @@
+from __future__ import annotations
+import bisect
+import datetime
+import numpy as np
+import pandas as pd
+
+
+class RouterTimeIndex:
+    """Router telemetry sorted by (serialnumber, time) with per-serial offset ranges.
+
+    Built once at load time. Router and time-window lookups are a dictionary
+    access plus a binary search over the router's time column, and return
+    positional slices of the underlying frame instead of filtered copies.
+    Slices are views: treat them as read-only.
+
+    Attributes:
+        data: router data sorted by serialnumber, then time ascending
+        offsets: serialnumber -> (start, stop) row positions in `data`
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        if not self._is_sorted(df):
+            df = df.sort_values(by=['serialnumber', 'time'], kind='stable', ignore_index=True)
+        elif not isinstance(df.index, pd.RangeIndex):
+            df = df.reset_index(drop=True)
+
+        self.data = df
+        self.times = df['time'].to_numpy(dtype='datetime64[ns]')
+        self.offsets = dict()
+
+        serials = df['serialnumber'].to_numpy()
+        if len(serials):
+            boundaries = np.flatnonzero(serials[1:] != serials[:-1]) + 1
+            starts = np.concatenate(([0], boundaries))
+            stops = np.concatenate((boundaries, [len(serials)]))
+            self.offsets = {serials[start]: (int(start), int(stop)) for start, stop in zip(starts, stops)}
+
+    @staticmethod
+    def _is_sorted(df: pd.DataFrame) -> bool:
+        serials = df['serialnumber'].to_numpy()
+        times = df['time'].to_numpy(dtype='datetime64[ns]')
+        if len(serials) < 2:
+            return True
+        same_serial = serials[1:] == serials[:-1]
+        # serial runs must be contiguous and increasing, times ascending within a run
+        if not pd.Index(serials[np.concatenate(([True], ~same_serial))]).is_monotonic_increasing:
+            return False
+        return bool((times[1:][same_serial] >= times[:-1][same_serial]).all())
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __contains__(self, serial_number: str) -> bool:
+        return serial_number in self.offsets
+
+    @property
+    def serials(self) -> list:
+        return list(self.offsets)
+
+    @staticmethod
+    def _orient(df: pd.DataFrame, ascending: bool) -> pd.DataFrame:
+        return df if ascending else df.iloc[::-1]
+
+    def router(self, serial_number: str, ascending: bool = True) -> pd.DataFrame:
+        """Rows of one router as a zero-copy slice, empty if the serial is unknown"""
+        start, stop = self.offsets.get(serial_number, (0, 0))
+        return self._orient(self.data.iloc[start:stop], ascending)
+
+    def window_bounds(self, serial_number: str, time_start: datetime, time_end: datetime) -> tuple:
+        """Row positions [lo, hi) of one router with time_start <= time < time_end"""
+        start, stop = self.offsets.get(serial_number, (0, 0))
+        router_times = self.times[start:stop]
+        lo = start + int(np.searchsorted(router_times, np.datetime64(pd.Timestamp(time_start)), side='left'))
+        hi = start + int(np.searchsorted(router_times, np.datetime64(pd.Timestamp(time_end)), side='left'))
+        return lo, hi
+
+    def window(self, serial_number: str, time_start: datetime, time_end: datetime, ascending: bool = True) -> pd.DataFrame:
+        """Rows of one router inside [time_start, time_end) as a zero-copy slice"""
+        lo, hi = self.window_bounds(serial_number, time_start, time_end)
+        return self._orient(self.data.iloc[lo:hi], ascending)
+
+    def merge(self, delta: pd.DataFrame) -> RouterTimeIndex:
+        """New index with the rows of `delta` merged in, rows already present dropped
+
+        The existing rows are never re-sorted: each new row's position is found
+        by a binary search in its router's time range (or among the serial runs
+        for a new router), and the merged frame is one positional take. The
+        cost is a copy of the frame plus work proportional to the delta.
+
+        Args:
+            delta (pd.DataFrame): preprocessed rows with the columns of `data`
+
+        Returns:
+            RouterTimeIndex: index over the merged rows
+        """
+        data, delta = _align_columns(self.data, delta)
+        delta = delta.drop_duplicates(subset=['serialnumber', 'time'], keep='last')
+        delta = delta.sort_values(by=['serialnumber', 'time'], kind='stable', ignore_index=True)
+        delta_times = delta['time'].to_numpy(dtype='datetime64[ns]')
+        serials = list(self.offsets)
+
+        positions = np.empty(len(delta), dtype=np.int64)
+        keep = np.ones(len(delta), dtype=bool)
+        for serial_number, rows in delta.groupby('serialnumber', sort=False, observed=True).indices.items():
+            if serial_number in self.offsets:
+                start, stop = self.offsets[serial_number]
+                router_times = self.times[start:stop]
+                lo = np.searchsorted(router_times, delta_times[rows], side='left')
+                # a (serial, time) sample that is already loaded is not added twice
+                keep[rows] = (lo == len(router_times)) | (router_times[np.minimum(lo, len(router_times) - 1)] != delta_times[rows])
+                positions[rows] = start + np.searchsorted(router_times, delta_times[rows], side='right')
+            else:
+                # new router: after the serial runs that sort before it
+                following = bisect.bisect_left(serials, serial_number)
+                positions[rows] = self.offsets[serials[following]][0] if following < len(serials) else len(self.data)
+
+        delta, positions = delta[keep], positions[keep]
+        if delta.empty:
+            return self
+        order = np.insert(np.arange(len(data)), positions, len(data) + np.arange(len(delta)))
+        merged = pd.concat([data, delta], ignore_index=True).take(order)
+        return RouterTimeIndex(merged.reset_index(drop=True))
+
+
+def _align_columns(data: pd.DataFrame, delta: pd.DataFrame) -> tuple:
+    """Delta rows with the columns and, where lossless, the dtypes of the loaded data
+
+    Returns:
+        tuple: loaded data with categoricals widened to the delta's values, aligned delta
+    """
+    delta = delta.reindex(columns=data.columns)
+    widened, aligned = dict(), dict()
+    for column, dtype in data.dtypes.items():
+        values = delta[column]
+        if values.dtype == dtype:
+            continue
+        if isinstance(dtype, pd.CategoricalDtype):
+            # appended categories keep the loaded codes valid
+            new_categories = pd.Index(values.dropna().unique()).difference(dtype.categories)
+            if len(new_categories):
+                widened[column] = data[column].cat.add_categories(new_categories)
+            aligned[column] = values.astype(widened[column].dtype if column in widened else dtype)
+        elif pd.api.types.is_numeric_dtype(dtype) and pd.api.types.is_numeric_dtype(values):
+            try:
+                cast = values.astype(dtype)
+            except (ValueError, TypeError):
+                continue
+            if np.array_equal(cast.to_numpy(dtype=np.float64), values.to_numpy(dtype=np.float64), equal_nan=True):
+                aligned[column] = cast
+    # the published frame is shared and read-only, widening builds a new one
+    return (data.assign(**widened) if widened else data), delta.assign(**aligned)
@@ -0,0 +1,84 @@
+from __future__ import annotations
+import re
+import weakref
+from utils_kk.tool_functions.router_index import RouterTimeIndex
+
+# serials look like 90100000000V412000536: long alphanumeric tokens, mostly digits
+CANDIDATE_PATTERN = re.compile(r"[A-Za-z0-9]{10,32}")
+MIN_CANDIDATE_DIGITS = 6
+MAX_EDIT_DISTANCE = 1
+
+_matchers = weakref.WeakKeyDictionary()
+
+
+class SerialMatcher:
+    """Serial numbers of a dataset, matched exactly or within a small edit distance.
+
+    Exact matches are hash-set lookups. Typos are resolved by a bounded
+    Levenshtein search over a character trie of the serials, which prunes
+    every branch whose distance already exceeds the bound.
+    """
+
+    def __init__(self, serials, max_edit_distance: int = MAX_EDIT_DISTANCE):
+        self.max_edit_distance = max_edit_distance
+        # matching is case-insensitive, the dataset spelling is returned
+        self.serials = {str(serial).upper(): str(serial) for serial in serials}
+        self.trie = dict()
+        for key in self.serials:
+            node = self.trie
+            for char in key:
+                node = node.setdefault(char, dict())
+            node[None] = key
+
+    @classmethod
+    def for_index(cls, router_index: RouterTimeIndex) -> SerialMatcher:
+        """Matcher of a router index, built once per index"""
+        matcher = _matchers.get(router_index)
+        if matcher is None:
+            matcher = _matchers[router_index] = cls(router_index.serials)
+        return matcher
+
+    @staticmethod
+    def candidates(text: str) -> list:
+        """Serial-shaped tokens of a text, in order of appearance"""
+        return [token.upper() for token in CANDIDATE_PATTERN.findall(text or "")
+                if sum(char.isdigit() for char in token) >= MIN_CANDIDATE_DIGITS]
+
+    def fuzzy(self, candidate: str) -> list:
+        """(distance, serial) of every serial within max_edit_distance of the candidate"""
+        matches = []
+        first_row = list(range(len(candidate) + 1))
+        stack = [(child, char, first_row) for char, child in self.trie.items() if char is not None]
+        while stack:
+            node, char, previous_row = stack.pop()
+            row = [previous_row[0] + 1]
+            for column in range(1, len(candidate) + 1):
+                row.append(min(row[column - 1] + 1,
+                               previous_row[column] + 1,
+                               previous_row[column - 1] + (candidate[column - 1] != char)))
+            if None in node and row[-1] <= self.max_edit_distance:
+                matches.append((row[-1], self.serials[node[None]]))
+            if min(row) <= self.max_edit_distance:
+                stack.extend((child, next_char, row) for next_char, child in node.items() if next_char is not None)
+        return sorted(matches)
+
+    def match(self, text: str):
+        """Serial number referenced in a text, None when nothing matches unambiguously
+
+        Args:
+            text (str): user question or chat message
+
+        Returns:
+            str | None: serial number as spelled in the dataset
+        """
+        candidates = self.candidates(text)
+        for candidate in candidates:
+            if candidate in self.serials:
+                return self.serials[candidate]
+
+        for candidate in candidates:
+            matches = self.fuzzy(candidate)
+            # a typo equally close to two serials is left to the LLM
+            if matches and (len(matches) == 1 or matches[0][0] < matches[1][0]):
+                return matches[0][1]
+        return None
@@ -1,23 +1,29 @@
-from langchain_core.tools import tool
+from langchain_core.tools import tool, StructuredTool
 import pandas as pd
 import datetime
 from utils_kk.tool_functions.data_transformer import *
+import utils_kk.tool_functions.data_transformer as data_transformer
+from utils_kk.misl_function.misl_rebootFeatures import load_reboot_features
+from utils_kk.misl_function.misl_baselineStore import get_baseline_store, router_percentiles
 
-def get_reboots_data(router_data:pd.DataFrame, serial_number:str) -> pd.DataFrame:
+def get_reboots_data(router_data:pd.DataFrame | RouterTimeIndex, serial_number:str) -> pd.DataFrame:
     """
     Get dataframe of hardware reboots for given serial number
 
     Args:
-        router_data (pd.DataFrame): dataframe of router data
+        router_data (pd.DataFrame | RouterTimeIndex): dataframe of router data, or its serial/time index
         serial_number (str): serial number of the router
 
     Returns:
         pd.DataFrame: dataframe of hardware reboots for given serial number
     """
     
-    df = pd.DataFrame.from_records(router_data)
-    df = df[df['serialnumber'] == serial_number]
-    df = df[df['hardware_reboot'] == 1]
+    if isinstance(router_data, RouterTimeIndex):
+        df = router_data.router(serial_number)
+    else:
+        df = pd.DataFrame.from_records(router_data)
+        df = df[df['serialnumber'] == serial_number]
+    df = with_timestamp_columns(df[df['hardware_reboot'] == 1])
     return df[['serialnumber', 'timestamp','hardware_reboot']].reset_index(drop=True)
 
 
@@ -32,55 +38,74 @@ def extract_comparison_data(timestamp:str, router_data:pd.DataFrame) ->  pd.Data
         pd.DataFrame: aggregated data
     """
 
-    df_h = router_data.copy(deep=True) 
-    # get one hour of data if available
-    time_req = datetime.datetime.strptime(timestamp, FORMAT)
-    df_prereboot_h = get_prereboot_data(df_h,time_req,hours=1)
-    # 6h prior to event 
-    df_prereboot_6h = get_prereboot_data(df_h,time_req,hours=6)
-    # 24h prior to event 
-    df_prereboot_d = get_prereboot_data(df_h,time_req,hours=24)
-    # get baseline data for comparison
-    df = router_data.copy(deep=True) 
-    df = get_baseline_data(df,time_req)
-    final_data = pd.concat([df_prereboot_h,df_prereboot_6h,df_prereboot_d,df],axis=0).reset_index(drop=True).T
-    final_data = final_data.rename_axis('Variable').rename(columns={0: "pre-reboot_hours", 1:"pre-reboot_6_hours",2: "pre-reboot_1_day", 3: "baseline"}).reset_index()
-    descriptions = pd.read_csv(FIELD_DESCRIPTIONS_FILE)
-    numbers = list(descriptions[descriptions['dtype']=='number']['Field Name'])
-    final_data['hour_to_baseline_change'] = final_data.apply(lambda x: (x['pre-reboot_hours']-x['baseline']) if (x['Variable'] in numbers) else (x['pre-reboot_hours']!=x['baseline']), axis=1)
-    final_data['6hour_to_baseline_change'] = final_data.apply(lambda x: (x['pre-reboot_6_hours']-x['baseline']) if (x['Variable'] in numbers) else (x['pre-reboot_6_hours']!=x['baseline']), axis=1)
-    final_data['day_to_baseline_change'] = final_data.apply(lambda x: (x['pre-reboot_1_day']-x['baseline']) if (x['Variable'] in numbers) else (x['pre-reboot_1_day']!=x['baseline']), axis=1)
-    
-    return final_data
+    return data_transformer.extract_comparison_data(timestamp, router_data)
 
 
-@tool(parse_docstring=True)
-def column_info(FIELD_DESCRIPTIONS_FILE:str, col_name:str) ->  str:
-    """Extract field descriptions for columns of dataframe
+def get_rca_tools(router_index: RouterTimeIndex, dataset_version: str = None) -> list:
+    """
+    Build the RCA tools bound to the shared router dataset
 
     Args:
-        col_name (str): column name
+        router_index (RouterTimeIndex): serial/time index of the router data
+        dataset_version (str, optional): version id of the router data, for the materialized reboot features
 
     Returns:
-        str: field names and descriptions in markdown
+        list: tools for the RCA agent
     """
 
-    descriptions = pd.read_csv(FIELD_DESCRIPTIONS_FILE)
-    description = descriptions[descriptions['Field Name']==col_name]['Description']
-    return description
+    def compare_prereboot_vs_baseline(serial_number: str, timestamp: str) -> str:
+        """Compare router metrics 1 hour, 6 hours and 24 hours before a hardware reboot against the router's baseline.
+
+        Args:
+            serial_number: serial number of the router
+            timestamp: exact reboot timestamp in "YYYY-MM-DD HH:MM:SS" format
+
+        Returns:
+            str: comparison table in markdown
+        """
+        if serial_number not in router_index:
+            return f"No telemetry found for serial number {serial_number}"
+        # pre-analyzed by the fleet materialization job when available
+        final_data = load_reboot_features(serial_number, timestamp, dataset_version)
+        if final_data is None:
+            final_data = data_transformer.extract_comparison_data(timestamp, router_index, serial_number)
+        return final_data.to_markdown(index=False)
+
+    def get_baseline_statistics(serial_number: str, timestamp: str = None, metrics: list[str] = None) -> str:
+        """Percentile ranks of the router's metrics within the fleet baseline of comparable routers.
+
+        Args:
+            serial_number: serial number of the router
+            timestamp: reboot timestamp in "YYYY-MM-DD HH:MM:SS" format; the router's values are the medians of the 24 hours before it, or of its last 24 hours of data when not given
+            metrics: metric columns to report; by default only metrics outside the fleet's 5th-95th percentile
+
+        Returns:
+            str: router median, fleet percentiles, IQR fences and percentile rank per metric in markdown
+        """
+        if serial_number not in router_index:
+            return f"No telemetry found for serial number {serial_number}"
+        end = pd.Timestamp(timestamp) if timestamp else router_index.router(serial_number)['time'].iloc[-1] + pd.Timedelta(seconds=1)
+        rows = router_index.window(serial_number, end - pd.Timedelta(hours=24), end)
+        report = router_percentiles(get_baseline_store(), rows, metrics)
+        if report.empty:
+            return "All metrics of the router are within the fleet's 5th-95th percentile range"
+        return report.to_markdown(index=False)
+
+    return [StructuredTool.from_function(compare_prereboot_vs_baseline, parse_docstring=True),
+            StructuredTool.from_function(get_baseline_statistics, parse_docstring=True)]
 
 
 @tool(parse_docstring=True)
-def get_baseline_statistics(data_dir:str) -> pd.DataFrame:
-    """
-    Returns statistical data about the baseline of a router
+def column_info(FIELD_DESCRIPTIONS_FILE:str, col_name:str) ->  str:
+    """Extract field descriptions for columns of dataframe
 
     Args:
-        data_dir (str): directory containing parquet files of the baseline router data
+        col_name (str): column name
 
     Returns:
-        pd.DataFrame: statistical data about the baseline of the router
+        str: field names and descriptions in markdown
     """
-    baseline_router_data = read_directory_parquet(data_dir)
-    return baseline_router_data
 
+    descriptions = field_descriptions(FIELD_DESCRIPTIONS_FILE)
+    description = descriptions[descriptions['Field Name']==col_name]['Description']
+    return description
@@ -114,7 +114,9 @@ class customGraph(TypedDict):
         bypass_intention: temporary variable to bypass intent classification during testing
         intermediate_result: intermediate result of the LLM
         final_result: final result of the LLM
-        data: Dataframe of the router data
+        dataset_version: Version id of the shared router dataset, resolved by the nodes
+        agent_scope: Rows and columns of the frame handed to the pandas agent
+        history_summary: Rolling summary of the turns folded out of chat_history
     """
 
     question: str
@@ -125,10 +127,12 @@ class customGraph(TypedDict):
     intermediate_result: str
     final_result: str
     verification: Verification
-    data: pd.DataFrame
+    dataset_version: str
     serialnumber: Optional[str]
     matched_columns: Optional[List[str]]
     explanation: str
+    agent_scope: Optional[dict]
+    history_summary: Optional[str]
     
 
 class FeatureValidationResult(BaseModel):